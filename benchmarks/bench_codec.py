@@ -0,0 +1,81 @@
+"""比较共享session编解码与pickle的编解码开销
+
+用法：
+    python benchmarks/bench_codec.py [--number 20000] [--json results.json]
+"""
+import argparse
+import json
+import pickle
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from shared_auth import codec  # noqa: E402
+
+
+AUTH_SESSION = {
+    '_auth_user_id': '42',
+    '_auth_user_backend': 'auth_app.backends.CachedModelBackend',
+    '_auth_user_hash': 'f' * 64,
+    '_auth_user_username': 'testuser',
+    '_auth_user_email': 'testuser@example.com',
+}
+
+LARGE_SESSION = dict(
+    AUTH_SESSION,
+    cart=[{'sku': f'SKU-{i:05d}', 'qty': i % 7, 'price': i * 1.25, 'tags': ['a', 'b', 'c']} for i in range(500)],
+    recent_searches=[f'search term {i}' for i in range(200)],
+)
+
+SESSIONS = {'auth_only': AUTH_SESSION, 'large': LARGE_SESSION}
+
+CODECS = {
+    'pickle': (pickle.dumps, pickle.loads),
+    'shared_codec': (codec.dumps, codec.loads),
+}
+
+
+def measure(func, arg, number):
+    """返回单次调用的平均耗时（微秒），取多轮中的最小值"""
+    timings = timeit.repeat(lambda: func(arg), number=number, repeat=5)
+    return min(timings) / number * 1e6
+
+
+def run(number):
+    results = []
+    for session_name, session in SESSIONS.items():
+        for codec_name, (dumps, loads) in CODECS.items():
+            encoded = dumps(session)
+            rounds = max(number // 50, 100) if session_name == 'large' else number
+            results.append({
+                'session': session_name,
+                'codec': codec_name,
+                'size_bytes': len(encoded),
+                'encode_us': round(measure(dumps, session, rounds), 3),
+                'decode_us': round(measure(loads, encoded, rounds), 3),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20000, help='小session每轮调用次数')
+    parser.add_argument('--json', dest='json_path', help='把结果写入JSON文件')
+    args = parser.parse_args()
+
+    results = run(args.number)
+
+    print(f"{'session':<12}{'codec':<14}{'bytes':>10}{'encode µs':>12}{'decode µs':>12}")
+    for row in results:
+        print(f"{row['session']:<12}{row['codec']:<14}{row['size_bytes']:>10}"
+              f"{row['encode_us']:>12.3f}{row['decode_us']:>12.3f}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'benchmark': 'codec', 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
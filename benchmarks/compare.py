@@ -0,0 +1,76 @@
+"""对比两次基准测试的JSON结果，发现性能回退
+
+支持loadtest.py和bench_codec.py输出的JSON。任一指标比基线差超过阈值时以状态码1退出，
+可以在CI中使用。
+
+用法：
+    python benchmarks/compare.py baseline.json current.json [--threshold 0.10]
+"""
+import argparse
+import json
+import sys
+
+# 指标 -> 是否越大越好
+METRICS = {
+    'rps': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'encode_us': False,
+    'decode_us': False,
+}
+
+
+def load_results(path):
+    """把结果统一为 {名称: {指标: 值}}"""
+    with open(path) as f:
+        report = json.load(f)
+    results = report['results']
+    if isinstance(results, list):
+        # bench_codec.py: 每行一个（session, codec）组合
+        return {f"{row['session']}/{row['codec']}": row for row in results}
+    return results
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    rows = []
+    for name, base_row in baseline.items():
+        cur_row = current.get(name)
+        if cur_row is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            base, cur = base_row.get(metric), cur_row.get(metric)
+            if not base or cur is None:
+                continue
+            change = (cur - base) / base
+            worse = -change if higher_is_better else change
+            rows.append((name, metric, base, cur, change))
+            if worse > threshold:
+                regressions.append((name, metric, base, cur, change))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.10, help='允许变差的比例，默认10%%')
+    args = parser.parse_args()
+
+    rows, regressions = compare(load_results(args.baseline), load_results(args.current), args.threshold)
+
+    print(f"{'name':<24}{'metric':<12}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, metric, base, cur, change in rows:
+        print(f"{name:<24}{metric:<12}{base:>12.3f}{cur:>12.3f}{change:>+10.1%}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for name, metric, base, cur, change in regressions:
+            print(f"  {name} {metric}: {base:.3f} -> {cur:.3f} ({change:+.1%})")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == '__main__':
+    main()
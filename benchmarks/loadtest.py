@@ -0,0 +1,284 @@
+"""共享认证关键路径的压测脚本
+
+以固定并发（闭环，每个worker完成一个请求后立即发出下一个）压测：
+
+- django_login    Django登录（login_view，包含密码哈希）
+- fastapi_user    FastAPI /api/user（session解码 + 用户查询）
+- fastapi_session FastAPI /api/session
+- fastapi_health  FastAPI /health
+
+报告每秒请求数和p50/p95/p99延迟，可以保存为JSON，再用compare.py与之前的结果对比。
+
+用法：
+    # 压测已经启动的服务（docker-compose up）
+    python benchmarks/loadtest.py --concurrency 32 --duration 15 --json results.json
+
+    # 在进程内启动服务（fakeredis + SQLite，见tests/inprocess.py）
+    python benchmarks/loadtest.py --inprocess --json results.json
+
+    # 在进程内启动合并部署的ASGI应用（combined/asgi.py）
+    python benchmarks/loadtest.py --inprocess --combined --json results.json
+
+进程内模式下压测客户端与服务共用一个Python进程，绝对数值偏低，适合比较同一台机器上不同版本的结果；
+发布之间的对比应压测独立运行的服务。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+CSRF_PATTERN = re.compile(r'name=["\']csrfmiddlewaretoken["\'][^>]*value=["\']([^"\']+)["\']')
+SESSION_COOKIE_NAME = "shared_session_id"
+
+
+def percentile(sorted_values, pct):
+    """最近秩法计算百分位数"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def django_form_post(client, path, data):
+    """先GET页面取得CSRF令牌，再提交表单"""
+    page = await client.get(path)
+    match = CSRF_PATTERN.search(page.text)
+    token = match.group(1) if match else client.cookies.get("csrftoken")
+    return await client.post(
+        path,
+        data={**data, "csrfmiddlewaretoken": token},
+        headers={"Referer": f"{client.base_url}{path}"},
+    )
+
+
+class Target:
+    name = None
+    base_url_attr = "fastapi_url"
+    path = None
+
+    def __init__(self, env):
+        self.env = env
+
+    async def make_client(self):
+        return httpx.AsyncClient(
+            base_url=getattr(self.env, self.base_url_attr),
+            cookies={SESSION_COOKIE_NAME: self.env.session_id},
+            timeout=30,
+        )
+
+    async def request(self, client):
+        response = await client.get(self.path)
+        return response.status_code == 200
+
+
+class DjangoLogin(Target):
+    name = "django_login"
+    base_url_attr = "django_url"
+
+    async def make_client(self):
+        client = httpx.AsyncClient(base_url=self.env.django_url, timeout=30)
+        await client.get("/login/")
+        return client
+
+    async def request(self, client):
+        # 登录会轮换CSRF密钥，每次使用cookie中最新的值
+        response = await client.post(
+            "/login/",
+            data={
+                "username": self.env.username,
+                "password": self.env.password,
+                "csrfmiddlewaretoken": client.cookies.get("csrftoken"),
+            },
+            headers={"Referer": f"{self.env.django_url}/login/"},
+        )
+        return response.status_code == 302
+
+
+class FastAPIUser(Target):
+    name = "fastapi_user"
+    path = "/api/user"
+
+
+class FastAPISession(Target):
+    name = "fastapi_session"
+    path = "/api/session"
+
+
+class FastAPIHealth(Target):
+    name = "fastapi_health"
+    path = "/health"
+
+
+TARGETS = {cls.name: cls for cls in (DjangoLogin, FastAPIUser, FastAPISession, FastAPIHealth)}
+
+
+class Environment:
+    """被压测的服务以及压测用户"""
+
+    def __init__(self, django_url, fastapi_url):
+        self.django_url = django_url.rstrip("/")
+        self.fastapi_url = fastapi_url.rstrip("/")
+        self.username = f"bench_{uuid.uuid4().hex[:8]}"
+        self.password = "bench-password-123"
+        self.session_id = None
+
+    async def prepare(self):
+        """注册压测用户并登录，取得FastAPI请求使用的session cookie"""
+        async with httpx.AsyncClient(base_url=self.django_url, timeout=30) as client:
+            await django_form_post(client, "/register/", {
+                "username": self.username,
+                "email": f"{self.username}@example.com",
+                "password1": self.password,
+                "password2": self.password,
+            })
+            response = await django_form_post(client, "/login/", {
+                "username": self.username,
+                "password": self.password,
+            })
+            if response.status_code != 302 or not client.cookies.get(SESSION_COOKIE_NAME):
+                raise RuntimeError(f"Login for benchmark user failed: HTTP {response.status_code}")
+            self.session_id = client.cookies.get(SESSION_COOKIE_NAME)
+
+
+async def run_target(target, concurrency, duration, warmup):
+    latencies = []
+    errors = 0
+    recording = False
+
+    async def worker(stop_at):
+        nonlocal errors
+        client = await target.make_client()
+        try:
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                try:
+                    ok = await target.request(client)
+                except httpx.HTTPError:
+                    ok = False
+                elapsed = time.perf_counter() - started
+                if not recording:
+                    continue
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+        finally:
+            await client.aclose()
+
+    stop_at = time.perf_counter() + warmup + duration
+    workers = [asyncio.ensure_future(worker(stop_at)) for _ in range(concurrency)]
+    await asyncio.sleep(warmup)
+    recording = True
+    measured_from = time.perf_counter()
+    await asyncio.gather(*workers)
+    measured = time.perf_counter() - measured_from
+
+    latencies.sort()
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(measured, 3),
+        "rps": round(len(latencies) / measured, 1) if measured > 0 else 0.0,
+        "mean_ms": to_ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": to_ms(percentile(latencies, 50)),
+        "p95_ms": to_ms(percentile(latencies, 95)),
+        "p99_ms": to_ms(percentile(latencies, 99)),
+        "max_ms": to_ms(latencies[-1] if latencies else None),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+async def run(args, django_url, fastapi_url):
+    env = Environment(django_url, fastapi_url)
+    await env.prepare()
+    results = {}
+    for name in args.targets:
+        print(f"Running {name} (concurrency={args.concurrency}, duration={args.duration}s)...", flush=True)
+        results[name] = await run_target(TARGETS[name](env), args.concurrency, args.duration, args.warmup)
+    return results
+
+
+def print_report(results):
+    print(f"\n{'target':<18}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in results.items():
+        fmt = lambda value: f"{value:>10.2f}" if value is not None else f"{'-':>10}"  # noqa: E731
+        print(f"{name:<18}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10.1f}"
+              f"{fmt(row['p50_ms'])}{fmt(row['p95_ms'])}{fmt(row['p99_ms'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--django-url", default=os.environ.get("DJANGO_URL", "http://localhost:8000"))
+    parser.add_argument("--fastapi-url", default=os.environ.get("FASTAPI_URL", "http://localhost:8001"))
+    parser.add_argument("--inprocess", action="store_true", help="在进程内启动服务（fakeredis + SQLite）")
+    parser.add_argument("--combined", action="store_true", help="与--inprocess一起使用，启动合并部署的ASGI应用")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=list(TARGETS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="每个目标的计时秒数")
+    parser.add_argument("--warmup", type=float, default=2.0, help="每个目标计时前的预热秒数")
+    parser.add_argument("--json", dest="json_path", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    services = None
+    django_url, fastapi_url = args.django_url, args.fastapi_url
+    if args.inprocess:
+        sys.path.insert(0, str(ROOT_DIR / "tests"))
+        # 压测登录时使用真实的密码哈希
+        os.environ.setdefault("INPROCESS_FAST_PASSWORD_HASHER", "False")
+        from inprocess import InProcessServices
+
+        services = InProcessServices(combined=args.combined).start()
+        django_url, fastapi_url = services.django_url, services.fastapi_url
+
+    # 不输出每个请求的日志
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    try:
+        results = asyncio.run(run(args, django_url, fastapi_url))
+    finally:
+        if services is not None:
+            services.stop()
+
+    print_report(results)
+
+    if args.json_path:
+        report = {
+            "benchmark": "loadtest",
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "mode": ("combined" if args.combined else "inprocess") if args.inprocess else "live",
+                "concurrency": args.concurrency,
+                "duration_s": args.duration,
+                "warmup_s": args.warmup,
+            },
+            "results": results,
+        }
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Django和FastAPI合并到一个ASGI进程的入口
+
+Django（``shared_auth_project/asgi.py``）处理根路径下的请求，FastAPI的 ``app``
+挂载在 ``COMBINED_FASTAPI_PREFIX``（默认 ``/fastapi``）下，lifespan事件交给FastAPI。
+
+两个应用共用同一个进程时，Django读取的session和解析出的用户直接写入FastAPI的进程内缓存，
+FastAPI处理同一session的请求时不再访问Redis和数据库；Django修改、删除session或用户时
+立即失效本进程的缓存。Redis仍然是session的存储，并通过pub/sub让其他进程的缓存失效，
+因此可以与独立部署的Django、FastAPI进程或多个合并进程同时运行。
+
+用法：
+    uvicorn combined.asgi:application --host 0.0.0.0 --port 8000
+"""
+import os
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+for path in (ROOT_DIR / "django_app", ROOT_DIR / "fastapi_app"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "shared_auth_project.settings")
+
+from shared_auth_project.asgi import application as django_application  # noqa: E402
+
+import main  # noqa: E402
+from auth_app import backends, sessions  # noqa: E402
+from session_cache import SessionCache  # noqa: E402
+
+FASTAPI_PREFIX = os.environ.get("COMBINED_FASTAPI_PREFIX", "/fastapi").rstrip("/")
+
+
+class CombinedApplication:
+    """按路径前缀把请求分发给FastAPI，其余请求交给Django"""
+
+    def __init__(self, django_app, fastapi_app, prefix: str):
+        self.django_app = django_app
+        self.fastapi_app = fastapi_app
+        self.prefix = prefix
+        self._raw_prefix = prefix.encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            # Django的ASGI应用不支持lifespan，FastAPI在这里建立Redis和数据库连接
+            return await self.fastapi_app(scope, receive, send)
+
+        path = scope["path"]
+        if path == self.prefix or path.startswith(self.prefix + "/"):
+            # 与Starlette的Mount相同：去掉前缀，并把前缀加到root_path
+            scope = dict(scope)
+            scope["path"] = path[len(self.prefix):] or "/"
+            scope["root_path"] = scope.get("root_path", "") + self.prefix
+            raw_path = scope.get("raw_path")
+            if raw_path and raw_path.startswith(self._raw_prefix):
+                scope["raw_path"] = raw_path[len(self._raw_prefix):] or b"/"
+            return await self.fastapi_app(scope, receive, send)
+
+        return await self.django_app(scope, receive, send)
+
+
+def share_caches() -> None:
+    """让Django读写FastAPI的进程内session缓存和用户行缓存"""
+    if main.session_cache.enabled:
+        sessions.local_cache = main.session_cache
+        main.user_row_cache = SessionCache(maxsize=main.session_cache.maxsize, ttl=main.session_cache.ttl)
+        backends.local_user_cache = main.user_row_cache
+
+
+share_caches()
+application = CombinedApplication(django_application, main.app, FASTAPI_PREFIX)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AuthAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'auth_app'
+
+    def ready(self):
+        from . import metrics, signals  # noqa: F401
+
+        # REDIS_URL的连接池；session分片（SESSION_REDIS_URLS）时各节点的连接池不导出
+        metrics.register_redis_pool('default')
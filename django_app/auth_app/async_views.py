@@ -0,0 +1,157 @@
+"""与 :mod:`auth_app.views` 相同的异步视图，在ASGI部署中使用（``AUTH_ASYNC_VIEWS``）
+
+同步视图在ASGI下每个请求都要切换到线程中执行，并在其中阻塞等待Redis和数据库。
+这里的视图使用异步ORM（``aget``、``aexists``、``asave``）和异步的认证函数，
+等待密码哈希时也不占用线程，一个worker可以同时处理大量认证请求。
+
+Django 5.0起提供 ``aauthenticate``、``alogin``、``alogout`` 和 ``aget_user``，之前的版本没有这些函数，
+退回到在线程中调用对应的同步函数（session和用户在同一次切换中加载）。
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth, messages
+from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import redirect, render
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from shared_auth.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from . import hashing, health, metrics
+from .hashing import HashingBusy
+from .views import hashing_busy_response, readyz_response, user_api_data, user_api_etag
+
+
+def _async_or_thread(name):
+    """返回 ``django.contrib.auth`` 中的异步函数，没有时用线程包装同名的同步函数"""
+    function = getattr(auth, 'a' + name, None)
+    return function if function is not None else sync_to_async(getattr(auth, name))
+
+
+alogin = _async_or_thread('login')
+alogout = _async_or_thread('logout')
+aauthenticate = _async_or_thread('authenticate')
+_aget_user = _async_or_thread('get_user')
+
+
+async def aget_user(request):
+    """解析 ``request.user``，之后模板和视图中访问它不会再查询Redis或数据库"""
+    user = await _aget_user(request)
+    request.user = user
+    return user
+
+
+def login_required(view):
+    """异步视图使用的 ``login_required``（Django 5.1之前的装饰器不支持异步视图）"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if user.is_authenticated:
+            return await view(request, *args, **kwargs)
+        return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+    return wrapper
+
+
+async def home_view(request):
+    """主页视图"""
+    await aget_user(request)
+    return render(request, 'auth_app/home.html')
+
+
+async def login_view(request):
+    """登录视图"""
+    await aget_user(request)
+    if request.method == 'POST':
+        username = request.POST.get('username')
+        password = request.POST.get('password')
+
+        try:
+            user = await aauthenticate(request, username=username, password=password)
+        except HashingBusy:
+            return hashing_busy_response(request, 'auth_app/login.html')
+
+        if user is not None:
+            await alogin(request, user)
+
+            # 在session中存储额外的用户信息，以便FastAPI可以访问；登录后session已加载，只修改内存中的数据
+            request.session['_auth_user_username'] = user.username
+            request.session['_auth_user_email'] = user.email
+
+            messages.success(request, f'Welcome back, {username}!')
+            return redirect('home')
+        else:
+            messages.error(request, 'Invalid username or password.')
+
+    return render(request, 'auth_app/login.html')
+
+
+async def register_view(request):
+    """注册视图"""
+    await aget_user(request)
+    if request.method == 'POST':
+        username = request.POST.get('username')
+        email = request.POST.get('email')
+        password1 = request.POST.get('password1')
+        password2 = request.POST.get('password2')
+
+        if password1 != password2:
+            messages.error(request, 'Passwords do not match.')
+            return render(request, 'auth_app/register.html')
+
+        if await User.objects.filter(username=username).aexists():
+            messages.error(request, 'Username already exists.')
+            return render(request, 'auth_app/register.html')
+
+        try:
+            await hashing.acreate_user(username=username, email=email, password=password1)
+        except HashingBusy:
+            return hashing_busy_response(request, 'auth_app/register.html')
+        messages.success(request, f'Account created for {username}. You can now login.')
+        return redirect('login')
+
+    return render(request, 'auth_app/register.html')
+
+
+async def logout_view(request):
+    """登出视图"""
+    await alogout(request)
+    messages.success(request, 'You have been logged out.')
+    return redirect('login')
+
+
+@login_required
+async def profile_view(request):
+    """个人资料视图"""
+    session_id = request.COOKIES.get('shared_session_id', 'Not found')
+    return render(request, 'auth_app/profile.html', {'session_id': session_id})
+
+
+@login_required
+async def user_api_view(request):
+    """用户API视图，返回JSON格式的用户数据"""
+    # 与同步视图的etag和cache_control装饰器相同，Django 5.0之前它们不支持异步视图
+    etag = user_api_etag(request)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(user_api_data(request))
+    response.headers['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+async def metrics_view(request):
+    """Prometheus格式的指标"""
+    return HttpResponse(metrics.registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+async def livez_view(request):
+    """存活探针，不访问数据库和Redis"""
+    return JsonResponse({'status': 'ok'})
+
+
+async def readyz_view(request):
+    """就绪探针，缓存的结果过期时在线程中重新检查"""
+    report = health.cached_report() or await sync_to_async(health.report)()
+    return readyz_response(report)
@@ -0,0 +1,202 @@
+import logging
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.db import router, transaction
+from django_redis import get_redis_connection
+
+from . import hashing, metrics
+
+logger = logging.getLogger(__name__)
+
+# 与FastAPI合并部署（combined/asgi.py）时设置为FastAPI的进程内用户行缓存
+local_user_cache = None
+
+
+# 缓存的用户字段：Django校验session哈希需要的password、user_can_authenticate需要的is_active，
+# 以及视图、模板（个人资料页的last_login）和权限检查读取的字段。其余字段（姓名、date_joined）为
+# 延迟加载，访问时才查询数据库，异步视图中不能访问
+CACHED_USER_FIELDS = ('id', 'password', 'last_login', 'username', 'email', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _user_cache():
+    return caches[settings.AUTH_USER_CACHE_ALIAS]
+
+
+def user_version_key(user_id):
+    return f"auth_user_version:{user_id}"
+
+
+def user_cache_key(user_id, version):
+    return f"auth_user:{user_id}:{version}"
+
+
+def _cached_fields(user):
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields
+        if field.attname in CACHED_USER_FIELDS
+    }
+
+
+def get_user_version(user_id):
+    """用户行缓存的版本号：用户被修改或删除的事务提交后加1，之前的缓存不再被读取"""
+    return _user_cache().get(user_version_key(user_id), 0, version=settings.AUTH_USER_CACHE_VERSION)
+
+
+async def aget_user_version(user_id):
+    return await _user_cache().aget(user_version_key(user_id), 0, version=settings.AUTH_USER_CACHE_VERSION)
+
+
+def cache_user(user, version):
+    """把用户行写入共享缓存，``version`` 为查询数据库之前读取的版本号
+
+    查询期间用户被修改时版本号已经增加，这里写入的旧数据不会再被读取。
+    """
+    _user_cache().set(
+        user_cache_key(user.pk, version),
+        _cached_fields(user),
+        timeout=settings.AUTH_USER_CACHE_TIMEOUT,
+        version=settings.AUTH_USER_CACHE_VERSION,
+    )
+
+
+async def acache_user(user, version):
+    await _user_cache().aset(
+        user_cache_key(user.pk, version),
+        _cached_fields(user),
+        timeout=settings.AUTH_USER_CACHE_TIMEOUT,
+        version=settings.AUTH_USER_CACHE_VERSION,
+    )
+
+
+def get_cached_user(user_id, version):
+    """从共享缓存读取用户，未命中时返回None"""
+    data = _user_cache().get(user_cache_key(user_id, version), version=settings.AUTH_USER_CACHE_VERSION)
+    return _user_from_cache(data)
+
+
+async def aget_cached_user(user_id, version):
+    data = await _user_cache().aget(user_cache_key(user_id, version), version=settings.AUTH_USER_CACHE_VERSION)
+    return _user_from_cache(data)
+
+
+def _user_from_cache(data):
+    if data is None:
+        return None
+
+    UserModel = get_user_model()
+    fields = [field for field in UserModel._meta.concrete_fields if field.attname in CACHED_USER_FIELDS]
+    if {field.attname for field in fields} != data.keys():
+        # 缓存的字段与当前模型不一致（例如迁移之后），视为未命中
+        return None
+    values = [field.to_python(data[field.attname]) for field in fields]
+    return UserModel.from_db(router.db_for_read(UserModel), [field.attname for field in fields], values)
+
+
+def invalidate_cached_user(user_id):
+    """使用户行缓存失效：立即增加一次版本号，当前事务提交后再增加一次（不在事务中时只增加一次）
+
+    信号在事务提交之前发出，只在这时失效的话，并发的请求仍可能读到提交前的旧行并写入新版本号的key；
+    提交后再次增加版本号，这样的写入不会再被读取。
+    """
+    _invalidate_cached_user(user_id)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _invalidate_cached_user(user_id))
+
+
+def _invalidate_cached_user(user_id):
+    if local_user_cache is not None:
+        local_user_cache.invalidate(str(user_id))
+    cache = _user_cache()
+    try:
+        version_key = cache.make_key(user_version_key(user_id), version=settings.AUTH_USER_CACHE_VERSION)
+        get_redis_connection(settings.AUTH_USER_CACHE_ALIAS).incr(version_key)
+    except Exception:
+        logger.exception("Failed to invalidate cached user %s", user_id)
+
+
+def share_user_row(user, epoch):
+    """把Django解析出的用户交给同一进程中的FastAPI，字段与其查询的auth_user列一致"""
+    local_user_cache.set(
+        str(user.pk), {'id': user.pk, 'username': user.username, 'email': user.email}, epoch
+    )
+
+
+class CachedModelBackend(ModelBackend):
+    """在共享Redis缓存中保存用户行的认证后端
+
+    AuthenticationMiddleware每次请求都会调用 ``get_user``，
+    缓存命中时不再查询 ``auth_user`` 表。缓存key包含每个用户的版本号，
+    ``User`` 的 ``post_save``/``post_delete`` 信号在事务提交后增加版本号；``QuerySet.update()`` 等
+    不触发信号的批量修改需要自行调用 :func:`invalidate_cached_user`。
+
+    用户名和密码不匹配时抛出 ``PermissionDenied`` 结束认证，排在后面的 ``ModelBackend``
+    （只为之前登录的session保留）不会再查询和计算一次哈希。
+
+    ``authenticate`` 把 ``ModelBackend.authenticate`` 交给 :mod:`auth_app.hashing` 的线程池执行；
+    ``aauthenticate`` 供Django 5.2起的 ``auth.aauthenticate`` 使用，等待期间不占用线程。
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if password is None:
+            return None
+        # ModelBackend.authenticate（查询用户、检查密码、必要时升级哈希）整个在哈希线程池中执行
+        user = hashing.run_with_connections(partial(super().authenticate, request, username, password, **kwargs))
+        if user is None:
+            raise PermissionDenied
+        return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if password is None:
+            return None
+        user = await hashing.arun_with_connections(partial(super().authenticate, request, username, password, **kwargs))
+        if user is None:
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        epoch = local_user_cache.epoch if local_user_cache is not None else None
+        with metrics.USER_CACHE_GET.time():
+            version = get_user_version(user_id)
+            user = get_cached_user(user_id, version)
+        if user is None:
+            metrics.USER_CACHE_MISS.inc()
+            with metrics.USER_QUERY.time():
+                user = super().get_user(user_id)
+            if user is not None:
+                cache_user(user, version)
+        else:
+            metrics.USER_CACHE_HIT.inc()
+            user = user if self.user_can_authenticate(user) else None
+        if user is not None and epoch is not None:
+            share_user_row(user, epoch)
+        return user
+
+    async def aget_user(self, user_id):
+        # Django 5.2起 ``request.auser()`` 调用后端的aget_user
+        epoch = local_user_cache.epoch if local_user_cache is not None else None
+        with metrics.USER_CACHE_GET.time():
+            version = await aget_user_version(user_id)
+            user = await aget_cached_user(user_id, version)
+        if user is None:
+            metrics.USER_CACHE_MISS.inc()
+            UserModel = get_user_model()
+            try:
+                with metrics.USER_QUERY.time():
+                    user = await UserModel._default_manager.aget(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            if not self.user_can_authenticate(user):
+                return None
+            await acache_user(user, version)
+        else:
+            metrics.USER_CACHE_HIT.inc()
+            user = user if self.user_can_authenticate(user) else None
+        if user is not None and epoch is not None:
+            share_user_row(user, epoch)
+        return user
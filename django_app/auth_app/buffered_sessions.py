@@ -0,0 +1,111 @@
+"""在一个请求内合并session写入的cache session后端
+
+默认的cache后端在一次登录中会多次访问Redis：``cycle_key`` 先检查新key是否存在、
+立即写入新key、删除旧key并发布失效消息，响应时再写入一次并发布一次。
+这里 ``cycle_key`` 和 ``delete`` 只在内存中记录，响应时把所有修改放进一个pipeline：
+
+    SET <key> <数据> PX <有效期> NX|XX（hash布局时为保存hash的脚本）
+    DEL <旧key> ...
+    PUBLISH <失效频道> <旧key / 被修改的key> ...
+
+新key不再预先检查是否存在，而是用 ``SET NX`` 写入，冲突时换一个key重试。
+更新已有的session时用 ``SET XX``：请求处理期间session被其他请求删除（登出、``flush()``）时不会被写回，
+与 ``CacheSessionStore`` 相同抛出 ``UpdateError``，``SessionMiddleware`` 返回 ``SessionInterrupted``。
+session分片（``SESSION_REDIS_URLS``）时命令按key所在的节点分组，每个节点一个pipeline。
+
+延迟写入由 :class:`auth_app.middleware.BufferedSessionMiddleware` 开启并在响应时提交；
+没有经过该中间件的session（例如测试客户端的 ``login()``）与 :mod:`auth_app.sessions` 的行为相同。
+"""
+from django.conf import settings
+from django.contrib.sessions.backends.base import VALID_KEY_CHARS, CreateError, UpdateError
+from django.utils.crypto import get_random_string
+from django_redis.exceptions import ConnectionInterrupted
+
+from . import metrics, sessions, sharding
+
+
+class SessionStore(sessions.SessionStore):
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self.buffered = False
+        # 需要在提交时删除的旧session key
+        self._stale_keys = []
+        # cycle_key生成的新key尚未写入，提交时使用SET NX
+        self._pending_create = False
+
+    def _get_new_session_key(self):
+        # 不预先检查key是否存在，写入时的SET NX保证不会覆盖已有的session
+        return get_random_string(32, VALID_KEY_CHARS)
+
+    def cycle_key(self):
+        if not self.buffered:
+            return super().cycle_key()
+        data = self._session
+        key = self.session_key
+        self._session_key = self._get_new_session_key()
+        self._session_cache = data
+        self._pending_create = True
+        self.modified = True
+        if key:
+            self._stale_keys.append(key)
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if not (must_create or self._pending_create):
+            self._write(self._get_session())
+            return
+        data = self._get_session(no_load=True)
+        while True:
+            try:
+                self._write(data, must_create=True)
+            except CreateError:
+                if must_create:
+                    # 由create()生成新key重试
+                    raise
+                self._session_key = self._get_new_session_key()
+                continue
+            self._pending_create = False
+            return
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        self._stale_keys.append(session_key)
+        if not self.buffered:
+            self.flush_pending()
+
+    def flush_pending(self):
+        """提交尚未写入的删除（例如登出时session被清空，不会再调用save）"""
+        if self._stale_keys:
+            self._write(None)
+
+    def _write(self, data, must_create=False):
+        """用一个pipeline写入当前session（``data`` 不为None时）、删除旧key并发布失效消息
+
+        session分片时每个涉及的节点一个pipeline，失效消息在 ``REDIS_URL`` 上发布。
+        """
+        client = self._cache.client
+        stale_keys, self._stale_keys = self._stale_keys, []
+        pipeline = sharding.Pipeline(client)
+        if data is not None:
+            self._write_command(pipeline.for_key(client.make_key(self.cache_key)), data, must_create)
+        for key in stale_keys:
+            key = client.make_key(self.cache_key_prefix + key)
+            pipeline.for_key(key).delete(key)
+        # 新创建的session不可能已被FastAPI缓存
+        invalidated = stale_keys if must_create or data is None else [*stale_keys, self.session_key]
+        for key in invalidated:
+            pipeline.publish(settings.SESSION_INVALIDATION_CHANNEL, key)
+        try:
+            with metrics.SESSION_SAVE.time():
+                results = pipeline.execute()
+        except Exception as e:
+            metrics.SESSION_STORE_ERRORS.inc()
+            raise ConnectionInterrupted(connection=None) from e
+        for key in invalidated:
+            sessions.invalidate_local_session(key)
+        if data is not None and not results[0]:
+            raise CreateError if must_create else UpdateError
@@ -0,0 +1,149 @@
+"""在专用线程池中计算密码哈希，限制同时进行的哈希数量
+
+PBKDF2等哈希器在计算时释放GIL，放到独立的线程中计算不会阻塞同一进程中的其他请求线程；
+线程池大小（``PASSWORD_HASHING_WORKERS``）限制了登录和注册同时占用的CPU。
+所有哈希线程都在忙时，请求最多等待 ``PASSWORD_HASHING_QUEUE_TIMEOUT`` 秒，
+超时抛出 :class:`HashingBusy`，视图返回503，而不是让所有worker都排在哈希后面。
+
+登录和注册把Django自己的 ``ModelBackend.authenticate`` 和 ``UserManager.create_user`` 整个交给
+线程池执行（:func:`run_with_connections`）。其中的查询使用调用方线程的数据库连接，与请求中的
+其他查询在同一个事务里；调用方在此期间等待结果，不会同时使用这些连接。
+以 ``a`` 开头的函数供异步视图使用，等待结果时不占用线程。
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+from . import metrics
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+class HashingBusy(Exception):
+    """等待空闲哈希线程超时"""
+
+
+def _get_executor():
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = settings.PASSWORD_HASHING_WORKERS
+                _slots = threading.BoundedSemaphore(workers)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+    return _executor, _slots
+
+
+def _reset_after_fork():
+    # 线程不会被fork到子进程（例如gunicorn预加载应用后fork出的worker），在子进程中重新创建
+    global _executor, _slots
+    _executor = None
+    _slots = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def submit(fn, *args):
+    """在哈希线程池中执行 ``fn(*args)``，返回Future；没有空闲线程且等待超时时抛出HashingBusy"""
+    executor, slots = _get_executor()
+    started = time.perf_counter()
+    if not slots.acquire(timeout=settings.PASSWORD_HASHING_QUEUE_TIMEOUT):
+        metrics.PASSWORD_HASHING_REJECTED.inc()
+        raise HashingBusy()
+    return _submit_acquired(executor, slots, started, fn, *args)
+
+
+async def asubmit(fn, *args):
+    """与 :func:`submit` 相同，没有空闲线程时在事件循环之外等待，返回asyncio Future"""
+    executor, slots = _get_executor()
+    started = time.perf_counter()
+    if not slots.acquire(blocking=False):
+        waiter = asyncio.ensure_future(
+            asyncio.to_thread(slots.acquire, timeout=settings.PASSWORD_HASHING_QUEUE_TIMEOUT)
+        )
+        try:
+            acquired = await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # 请求被取消时等待仍在继续，拿到的线程名额需要归还
+            waiter.add_done_callback(lambda done: done.result() and slots.release())
+            raise
+        if not acquired:
+            metrics.PASSWORD_HASHING_REJECTED.inc()
+            raise HashingBusy()
+    return asyncio.wrap_future(_submit_acquired(executor, slots, started, fn, *args))
+
+
+def _submit_acquired(executor, slots, started, fn, *args):
+    metrics.PASSWORD_HASH_WAIT.observe(time.perf_counter() - started)
+    try:
+        future = executor.submit(_timed, fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def _timed(fn, *args):
+    with metrics.PASSWORD_HASH.time():
+        return fn(*args)
+
+
+def run(fn, *args):
+    """在哈希线程池中执行 ``fn(*args)`` 并等待结果"""
+    return submit(fn, *args).result()
+
+
+async def arun(fn, *args):
+    return await (await asubmit(fn, *args))
+
+
+def _caller_connections():
+    return [connections[alias] for alias in connections]
+
+
+def _using_connections(conns, fn):
+    # 在哈希线程中临时使用调用方线程的连接；结束后移除，哈希线程不保留任何连接
+    for conn in conns:
+        conn.inc_thread_sharing()
+        connections[conn.alias] = conn
+    try:
+        return fn()
+    finally:
+        for conn in conns:
+            del connections[conn.alias]
+            conn.dec_thread_sharing()
+
+
+def run_with_connections(fn):
+    """在哈希线程池中执行会查询数据库的 ``fn()``，查询使用当前线程的数据库连接"""
+    return run(partial(_using_connections, _caller_connections(), fn))
+
+
+async def arun_with_connections(fn):
+    """异步视图中ORM使用的是 ``sync_to_async`` 线程的连接，``fn()`` 也使用这些连接"""
+    conns = await sync_to_async(_caller_connections)()
+    return await arun(partial(_using_connections, conns, fn))
+
+
+def create_user(username, email, password, **extra_fields):
+    """在线程池中执行 ``UserManager.create_user``"""
+    return run_with_connections(partial(get_user_model().objects.create_user, username, email, password, **extra_fields))
+
+
+async def acreate_user(username, email, password, **extra_fields):
+    return await arun_with_connections(
+        partial(get_user_model().objects.create_user, username, email, password, **extra_fields)
+    )
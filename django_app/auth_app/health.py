@@ -0,0 +1,78 @@
+"""Django的就绪检查：检查结果缓存 ``HEALTH_CHECK_INTERVAL`` 秒
+
+探针请求只读取缓存的结果；结果过期时由一个请求线程重新检查，
+其他并发请求继续返回上一次的结果，不会同时访问依赖。
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django_redis import get_redis_connection
+
+from . import sharding
+
+_lock = threading.Lock()
+_report = None
+_checked_at = None
+
+
+def check_database():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def check_redis():
+    get_redis_connection(sharding.INVALIDATION_CACHE_ALIAS).ping()
+    client = sharding.session_client()
+    if sharding.is_sharded(client):
+        for redis in client.nodes.values():
+            redis.ping()
+
+
+CHECKS = {
+    'database': check_database,
+    'redis': check_redis,
+}
+
+
+def probe():
+    """执行所有检查，返回 ``(是否就绪, 各项结果)``"""
+    results = {}
+    for name, check in CHECKS.items():
+        started = time.perf_counter()
+        try:
+            check()
+        except Exception as e:
+            result = {'status': 'error', 'error': str(e)}
+        else:
+            result = {'status': 'ok'}
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        results[name] = result
+    return all(result['status'] == 'ok' for result in results.values()), results
+
+
+def cached_report():
+    """返回未过期的检查结果，没有时返回None"""
+    if _report is not None and time.monotonic() - _checked_at < settings.HEALTH_CHECK_INTERVAL:
+        return _report
+    return None
+
+
+def report():
+    """返回 ``(是否就绪, 各项结果)``，结果过期时重新检查"""
+    global _report, _checked_at
+    cached = cached_report()
+    if cached is not None:
+        return cached
+    if not _lock.acquire(blocking=_report is None):
+        # 其他线程正在检查
+        return _report
+    try:
+        cached = cached_report()
+        if cached is None:
+            cached = _report = probe()
+            _checked_at = time.monotonic()
+        return cached
+    finally:
+        _lock.release()
@@ -0,0 +1,91 @@
+import math
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = '在当前机器上测量密码哈希器的耗时，并给出达到目标耗时的参数建议'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250.0, help='目标单次哈希耗时（毫秒）')
+        parser.add_argument('--runs', type=int, default=5, help='每组参数测量的次数')
+        parser.add_argument('--algorithm', default='default',
+                            help='要测量的哈希器算法名，默认为PASSWORD_HASHERS中的第一个')
+
+    def handle(self, *args, **options):
+        hasher = get_hasher(options['algorithm'])
+        runs = max(options['runs'], 1)
+        target = options['target_ms'] / 1000
+
+        current = self.measure(hasher, runs)
+        self.stdout.write(f'哈希器：{type(hasher).__module__}.{type(hasher).__name__}')
+        self.stdout.write(f'当前参数：{self.format_params(self.params(hasher))}')
+        self.stdout.write(f'单次耗时：{current * 1000:.1f} ms（{runs}次的中位数）')
+        workers = settings.PASSWORD_HASHING_WORKERS
+        self.stdout.write(
+            f'吞吐量：每个哈希线程约{1 / current:.1f}次/秒，'
+            f'PASSWORD_HASHING_WORKERS={workers}时每个进程约{workers / current:.1f}次/秒'
+        )
+
+        suggested = self.suggest(hasher, current / target)
+        if suggested is None:
+            self.stdout.write(self.style.WARNING(f'无法为算法 {hasher.algorithm} 给出参数建议'))
+            return
+        if suggested == self.params(hasher):
+            self.stdout.write(self.style.SUCCESS(f'当前参数已接近目标耗时 {options["target_ms"]:.0f} ms'))
+            return
+
+        tuned = type(f'Tuned{type(hasher).__name__}', (type(hasher),), suggested)()
+        measured = self.measure(tuned, runs)
+        self.stdout.write(self.style.SUCCESS(
+            f'建议参数：{self.format_params(suggested)}（实测 {measured * 1000:.1f} ms）'
+        ))
+        self.stdout.write(
+            '在哈希器子类中设置这些属性，并把它放在PASSWORD_HASHERS的第一位；'
+            '已有用户的哈希会在下次登录时自动升级。'
+        )
+
+    def measure(self, hasher, runs):
+        # 先计算一次，排除首次加载库等开销
+        hasher.encode('password-benchmark', hasher.salt())
+        durations = []
+        for _ in range(runs):
+            salt = hasher.salt()
+            started = time.perf_counter()
+            hasher.encode('password-benchmark', salt)
+            durations.append(time.perf_counter() - started)
+        return statistics.median(durations)
+
+    def params(self, hasher):
+        names = ('iterations', 'rounds', 'time_cost', 'memory_cost', 'work_factor', 'block_size')
+        return {name: getattr(hasher, name) for name in names if hasattr(hasher, name)}
+
+    def format_params(self, params):
+        return ', '.join(f'{name}={value}' for name, value in params.items()) or '（无）'
+
+    def suggest(self, hasher, ratio):
+        """按耗时与参数的关系估算达到目标耗时的参数，``ratio`` 为当前耗时/目标耗时"""
+        params = self.params(hasher)
+        if 'iterations' in params:
+            # PBKDF2：耗时与迭代次数成正比
+            iterations = max(int(round(params['iterations'] / ratio, -3)), 1000)
+            return {'iterations': iterations}
+        if 'rounds' in params:
+            # bcrypt：每增加一轮耗时翻倍
+            rounds = min(max(params['rounds'] - round(math.log2(ratio)), 4), 31)
+            return {'rounds': rounds}
+        if 'time_cost' in params:
+            # Argon2：耗时与time_cost和memory_cost大致成正比，time_cost最小为1，不够时减少内存
+            time_cost = params['time_cost'] / ratio
+            if time_cost >= 1:
+                return {'time_cost': int(round(time_cost)), 'memory_cost': params['memory_cost']}
+            return {'time_cost': 1, 'memory_cost': max(int(params['memory_cost'] * time_cost), 8)}
+        if 'work_factor' in params:
+            # scrypt：耗时和内存都与work_factor（2的幂）成正比，内存约为128 * N * r字节
+            work_factor = 2 ** max(round(math.log2(params['work_factor'] / ratio)), 1)
+            return {'work_factor': work_factor, 'block_size': params['block_size']}
+        return None
@@ -0,0 +1,185 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+def setup_worker():
+    # 以spawn方式启动的进程需要先初始化Django；fork出的进程已经初始化
+    if not apps.ready:
+        django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        '从CSV或NDJSON文件批量导入用户（字段：username、email、password），'
+        '在进程池中并行计算密码哈希，按批次在事务中bulk_create，已存在的用户名跳过'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='输入文件，"-"表示标准输入')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='输入格式，默认按文件扩展名（.csv、.ndjson、.jsonl）判断')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每个事务插入的用户数')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='计算密码哈希的进程数，0表示在当前进程中计算')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or FORMATS.get(os.path.splitext(options['path'])[1].lower())
+        if fmt is None:
+            raise CommandError('无法从文件名判断输入格式，请指定--format')
+        batch_size = max(options['batch_size'], 1)
+        workers = max(options['workers'], 0)
+        self.verbosity = options['verbosity']
+        self.user_model = get_user_model()
+        self.stats = Counter()
+        self.started = time.perf_counter()
+
+        executor = ProcessPoolExecutor(workers, initializer=setup_worker) if workers else None
+        with self.open(options['path']) as stream, executor or nullcontext():
+            # 当前批次插入数据库时，下一批次的密码已经在进程池中计算
+            pending = None
+            for batch in self.batches(self.read(stream, fmt), batch_size):
+                users = self.new_users(batch)
+                hashed = self.hash_passwords(executor, workers, users)
+                if pending is not None:
+                    self.insert(*pending)
+                pending = (users, hashed)
+            if pending is not None:
+                self.insert(*pending)
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'导入完成：{self.summary()}，耗时{elapsed:.1f}秒（{self.stats["created"] / elapsed:.0f}个/秒）'
+        ))
+
+    def open(self, path):
+        if path == '-':
+            return nullcontext(io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig'))
+        try:
+            return open(path, encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(f'无法打开{path}：{e}')
+
+    def read(self, stream, fmt):
+        """逐行读取记录，返回 ``(行号, 记录)``，无法解析的行记录为无效"""
+        if fmt == 'csv':
+            reader = csv.DictReader(stream)
+            missing = {'username', 'password'} - set(reader.fieldnames or ())
+            if missing:
+                raise CommandError(f'CSV缺少列：{", ".join(sorted(missing))}')
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                self.invalid(line_number, f'JSON解析失败：{e}')
+                continue
+            if not isinstance(record, dict):
+                self.invalid(line_number, '不是JSON对象')
+                continue
+            yield line_number, record
+
+    def batches(self, records, size):
+        while True:
+            batch = list(islice(records, size))
+            if not batch:
+                return
+            yield batch
+
+    def invalid(self, line_number, reason):
+        self.stats['invalid'] += 1
+        if self.verbosity >= 2:
+            self.stderr.write(f'第{line_number}行无效：{reason}')
+
+    def new_users(self, batch):
+        """校验记录并排除已存在的用户名（每批一次查询）和文件中重复的用户名"""
+        User = self.user_model
+        max_length = User._meta.get_field(User.USERNAME_FIELD).max_length
+        candidates = {}
+        for line_number, record in batch:
+            username = User.normalize_username(str(record.get('username') or '').strip())
+            if not username or len(username) > max_length:
+                self.invalid(line_number, f'用户名为空或超过{max_length}个字符')
+                continue
+            if username in candidates:
+                self.skip(username)
+                continue
+            password = record.get('password')
+            candidates[username] = User(
+                username=username,
+                email=User._default_manager.normalize_email(record.get('email') or ''),
+                # 密码为空时设置为不可用的密码，与create_user(password=None)相同
+                password=str(password) if password else None,
+            )
+        existing = self.existing_usernames(list(candidates))
+        users = []
+        for username, user in candidates.items():
+            if username in existing:
+                self.skip(username)
+            else:
+                users.append(user)
+        # 与之前批次重复的用户名由这里的查询排除；前一批次尚未插入时，由insert中的重试排除
+        return users
+
+    def existing_usernames(self, usernames):
+        User = self.user_model
+        return set(User._default_manager.filter(
+            **{f'{User.USERNAME_FIELD}__in': usernames}
+        ).values_list(User.USERNAME_FIELD, flat=True))
+
+    def skip(self, username):
+        self.stats['existing'] += 1
+        if self.verbosity >= 2:
+            self.stdout.write(self.style.WARNING(f'已存在，跳过：{username}'))
+
+    def hash_passwords(self, executor, workers, users):
+        passwords = [user.password for user in users]
+        if executor is None:
+            # 在insert中逐个计算
+            return map(make_password, passwords)
+        # 每个进程分到几个块，减少进程间通信次数，同时让各进程的负载均衡
+        chunksize = max(len(passwords) // (workers * 4), 1)
+        return executor.map(make_password, passwords, chunksize=chunksize)
+
+    def insert(self, users, hashed):
+        for user, password in zip(users, hashed):
+            user.password = password
+        try:
+            with transaction.atomic():
+                self.user_model._default_manager.bulk_create(users)
+        except IntegrityError:
+            # 与前一批次重复，或检查之后有用户通过注册页面创建了相同的用户名，排除后重试一次
+            existing = self.existing_usernames([user.username for user in users])
+            for username in existing:
+                self.skip(username)
+            users = [user for user in users if user.username not in existing]
+            with transaction.atomic():
+                self.user_model._default_manager.bulk_create(users)
+        self.stats['created'] += len(users)
+        if self.verbosity >= 1:
+            elapsed = time.perf_counter() - self.started
+            self.stdout.write(f'{self.summary()}（{self.stats["created"] / elapsed:.0f}个/秒）')
+
+    def summary(self):
+        stats = self.stats
+        return f'新建{stats["created"]}，已存在{stats["existing"]}，无效{stats["invalid"]}'
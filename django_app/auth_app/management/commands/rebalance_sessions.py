@@ -0,0 +1,116 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.sessions.backends.cache import KEY_PREFIX
+from django.core.management.base import BaseCommand, CommandError
+
+from auth_app import sharding
+from shared_auth.sharding import redact
+
+from .session_inventory import glob_escape
+
+
+class Command(BaseCommand):
+    help = (
+        '修改SESSION_REDIS_URLS（例如增加节点）之后，把不在哈希环所选节点上的session迁移过去：'
+        '逐个节点SCAN，用DUMP/RESTORE复制到新节点后从原节点删除，有效期不变'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', action='append', default=[], metavar='URL',
+                            help='同时扫描的其他节点，例如已从SESSION_REDIS_URLS移除的节点或原来的REDIS_URL，可以重复')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='每次SCAN的COUNT，也是每个pipeline的key数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计需要迁移的session，不修改Redis')
+
+    def handle(self, *args, **options):
+        if settings.SESSION_MODE != 'redis':
+            raise CommandError('session不保存在Redis中（SESSION_MODE不是redis）')
+        self.client = sharding.session_client()
+        if not sharding.is_sharded(self.client):
+            raise CommandError('没有配置session分片（SESSION_REDIS_URLS）')
+        self.batch_size = max(options['batch_size'], 1)
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        self.counts = Counter()
+        self.moved = Counter()
+        self.started = time.perf_counter()
+
+        nodes = dict(self.client.nodes)
+        for url in options['source']:
+            if url not in nodes:
+                nodes[url] = self.client.connection_factory.connect(url)
+        match = glob_escape(self.client.make_key(KEY_PREFIX)) + '*'
+        for node, redis in nodes.items():
+            self.scan(node, redis, match)
+        self.report()
+
+    def scan(self, node, redis, match):
+        cursor = 0
+        while True:
+            cursor, keys = redis.scan(cursor, match=match, count=self.batch_size)
+            self.counts['scanned'] += len(keys)
+            targets = {}
+            for key in keys:
+                target = self.client.get_server_name(key.decode())
+                if target != node:
+                    targets[key] = target
+            if targets:
+                self.move(node, redis, targets)
+            if cursor == 0:
+                break
+        if self.verbosity >= 2:
+            self.stdout.write(f'{redact(node)}：已扫描{self.counts["scanned"]}个session')
+
+    def move(self, node, redis, targets):
+        """把 ``targets``（``{key: 目标节点}``）从 ``node`` 复制到目标节点，成功后从 ``node`` 删除"""
+        if self.dry_run:
+            for target in targets.values():
+                self.moved[target] += 1
+            return
+        pipeline = redis.pipeline(transaction=False)
+        for key in targets:
+            pipeline.dump(key)
+            pipeline.pttl(key)
+        results = pipeline.execute()
+
+        restores = {}
+        for index, (key, target) in enumerate(targets.items()):
+            dumped, ttl = results[2 * index:2 * index + 2]
+            if dumped is None or ttl == -2:
+                # SCAN之后已过期或被删除
+                continue
+            # RESTORE的有效期为0表示不过期
+            restores.setdefault(target, []).append((key, max(ttl, 0), dumped))
+
+        done = []
+        for target, entries in restores.items():
+            pipeline = self.client.nodes[target].pipeline(transaction=False)
+            for key, ttl, dumped in entries:
+                # 不覆盖目标节点上已有的key：修改配置之后写入的session比原节点上的新
+                pipeline.restore(key, ttl, dumped)
+            for (key, _, _), result in zip(entries, pipeline.execute(raise_on_error=False)):
+                if not isinstance(result, Exception):
+                    self.moved[target] += 1
+                elif str(result).startswith('BUSYKEY'):
+                    self.counts['busy'] += 1
+                else:
+                    self.counts['failed'] += 1
+                    self.stderr.write(f'迁移{key.decode()}到{redact(target)}失败：{result}')
+                    continue
+                done.append(key)
+        if done:
+            redis.delete(*done)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        counts = self.counts
+        action = '需要迁移' if self.dry_run else '已迁移'
+        self.stdout.write(f'共扫描{counts["scanned"]}个session，{action}{sum(self.moved.values())}个，耗时{elapsed:.1f}秒')
+        for target, count in self.moved.items():
+            self.stdout.write(f'  到{redact(target)}：{count}个')
+        if counts['busy']:
+            self.stdout.write(f'  目标节点上已有更新的session，只删除原节点上的：{counts["busy"]}个')
+        if counts['failed']:
+            raise CommandError(f'{counts["failed"]}个session迁移失败，已保留在原节点上，可以重新执行')
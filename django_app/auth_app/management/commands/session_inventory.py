@@ -0,0 +1,223 @@
+import json
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.cache import KEY_PREFIX
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from auth_app import sharding
+from shared_auth import codec, session_hash
+from shared_auth.sharding import redact
+
+# 按剩余有效期统计session数量的区间（秒）
+TTL_BUCKETS = ((3600, '<1h'), (86400, '<1d'), (7 * 86400, '<7d'), (None, '>=7d'))
+NO_EXPIRY = '无过期时间'
+
+
+def glob_escape(value):
+    return ''.join(f'\\{c}' if c in '*?[]\\' else c for c in value)
+
+
+class Command(BaseCommand):
+    help = (
+        '用SCAN遍历Redis中的session，按批次用pipeline读取剩余有效期、内存占用和用户ID并输出统计；'
+        '可以删除用户已不存在或已停用的session'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='每次SCAN的COUNT，也是每个pipeline和用户查询的key数')
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help='删除用户已不存在或已停用的session，并发布失效消息')
+        parser.add_argument('--ndjson', action='store_true',
+                            help='每个session输出一行JSON，进度和统计改为输出到stderr')
+
+    def handle(self, *args, **options):
+        if settings.SESSION_MODE != 'redis':
+            raise CommandError('session不保存在Redis中（SESSION_MODE不是redis）')
+        self.batch_size = max(options['batch_size'], 1)
+        self.delete_orphans = options['delete_orphans']
+        self.ndjson = options['ndjson']
+        self.log = self.stderr if self.ndjson else self.stdout
+        self.verbosity = options['verbosity']
+        self.user_model = get_user_model()
+        self.client = caches[settings.SESSION_CACHE_ALIAS].client
+        self.prefix = self.client.make_key(KEY_PREFIX)
+        self.hash_layout = settings.SESSION_STORAGE_LAYOUT == 'hash'
+        # 只保存计数，内存占用与key的总数无关
+        self.counts = Counter()
+        self.memory = Counter()
+        self.ttls = Counter()
+        self.nodes = Counter()
+        self.started = time.perf_counter()
+
+        # session分片时逐个节点扫描，每个节点上的key只用该节点的pipeline读取
+        for self.node, self.redis in sharding.nodes(self.client).items():
+            self.scan()
+        self.report()
+
+    def scan(self):
+        # SCAN可能重复返回同一个key，统计结果是近似值
+        cursor = 0
+        match = glob_escape(self.prefix) + '*'
+        while True:
+            cursor, keys = self.redis.scan(cursor, match=match, count=self.batch_size)
+            if keys:
+                self.process(keys)
+            if cursor == 0:
+                break
+
+    def process(self, keys):
+        pipeline = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipeline.pttl(key)
+            pipeline.memory_usage(key)
+            self.read_user_id(pipeline, key, self.hash_layout)
+        results = pipeline.execute(raise_on_error=False)
+
+        entries = []
+        wrong_type = []
+        for index, key in enumerate(keys):
+            ttl, memory, raw = results[3 * index:3 * index + 3]
+            if ttl == -2:
+                # SCAN之后已过期或被删除
+                continue
+            entry = {
+                'key': key,
+                'session_key': key.decode()[len(self.prefix):],
+                'ttl_seconds': None if ttl < 0 else ttl // 1000,
+                'memory_bytes': None if isinstance(memory, Exception) else memory,
+                'raw': raw,
+            }
+            if isinstance(raw, Exception) and session_hash.is_wrong_type(raw):
+                wrong_type.append(entry)
+            entries.append(entry)
+        if wrong_type:
+            # 切换布局之前保存的session
+            pipeline = self.redis.pipeline(transaction=False)
+            for entry in wrong_type:
+                self.read_user_id(pipeline, entry['key'], not self.hash_layout)
+            for entry, raw in zip(wrong_type, pipeline.execute(raise_on_error=False)):
+                entry['raw'] = raw
+                entry['hash'] = not self.hash_layout
+
+        user_ids = {}
+        for entry in entries:
+            entry['user_id'], entry['status'] = self.decode_user_id(entry)
+            if entry['user_id'] is not None:
+                user_ids.setdefault(entry['user_id'], []).append(entry)
+        self.check_users(user_ids)
+
+        orphans = [entry for entry in entries if entry['status'] == 'orphan']
+        if orphans and self.delete_orphans:
+            self.delete(orphans)
+        for entry in entries:
+            self.record(entry)
+        self.progress()
+
+    def read_user_id(self, pipeline, key, hash_layout):
+        if hash_layout:
+            pipeline.hget(key, '_auth_user_id')
+        else:
+            pipeline.get(key)
+
+    def decode_user_id(self, entry):
+        """返回 ``(用户ID, 状态)``，未登录的session用户ID为None"""
+        raw = entry['raw']
+        if isinstance(raw, Exception):
+            return None, 'error'
+        if raw is None:
+            return None, 'anonymous'
+        try:
+            if entry.get('hash', self.hash_layout):
+                user_id = codec.loads(raw)
+            else:
+                user_id = self.client.decode(raw).get('_auth_user_id')
+            if user_id is None:
+                return None, 'anonymous'
+            return self.user_model._meta.pk.to_python(user_id), 'authenticated'
+        except Exception:
+            return None, 'undecodable'
+
+    def check_users(self, user_ids):
+        """每批用一次查询找出用户已不存在或已停用的session"""
+        if not user_ids:
+            return
+        active = dict(self.user_model._default_manager.filter(
+            pk__in=list(user_ids)
+        ).values_list('pk', 'is_active'))
+        for user_id, entries in user_ids.items():
+            if not active.get(user_id, False):
+                for entry in entries:
+                    entry['status'] = 'orphan'
+
+    def delete(self, orphans):
+        # 失效消息发布到REDIS_URL；未分片时与DEL在同一个pipeline中
+        pipeline = sharding.Pipeline(self.client)
+        for entry in orphans:
+            pipeline.on(self.redis).delete(entry['key'])
+            pipeline.publish(settings.SESSION_INVALIDATION_CHANNEL, entry['session_key'])
+        results = pipeline.execute()
+        for entry, deleted in zip(orphans, results[::2]):
+            entry['deleted'] = bool(deleted)
+            self.counts['deleted'] += bool(deleted)
+
+    def record(self, entry):
+        status = entry['status']
+        self.counts['total'] += 1
+        self.counts[status] += 1
+        self.nodes[self.node] += 1
+        if entry['memory_bytes'] is None:
+            self.counts['memory_unknown'] += 1
+        else:
+            self.memory['total'] += entry['memory_bytes']
+            self.memory[status] += entry['memory_bytes']
+        self.ttls[self.ttl_bucket(entry['ttl_seconds'])] += 1
+        if self.ndjson:
+            self.stdout.write(json.dumps({
+                'session_key': entry['session_key'],
+                'ttl_seconds': entry['ttl_seconds'],
+                'memory_bytes': entry['memory_bytes'],
+                'user_id': entry['user_id'],
+                'status': status,
+                'deleted': entry.get('deleted', False),
+            }, default=str))
+
+    def ttl_bucket(self, ttl):
+        if ttl is None:
+            return NO_EXPIRY
+        for limit, label in TTL_BUCKETS:
+            if limit is None or ttl < limit:
+                return label
+
+    def progress(self):
+        if self.verbosity >= 2:
+            elapsed = time.perf_counter() - self.started
+            self.log.write(f'已扫描{self.counts["total"]}个session（{self.counts["total"] / elapsed:.0f}个/秒）')
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        counts, memory = self.counts, self.memory
+        self.log.write(f'共{counts["total"]}个session，耗时{elapsed:.1f}秒')
+        for status, label in (('authenticated', '已登录'), ('anonymous', '未登录'), ('orphan', '用户不存在或已停用'),
+                              ('undecodable', '无法解码'), ('error', '读取失败')):
+            if counts[status]:
+                self.log.write(f'  {label}：{counts[status]}个，{self.format_bytes(memory[status])}')
+        unknown = f'（{counts["memory_unknown"]}个无法获取MEMORY USAGE）' if counts['memory_unknown'] else ''
+        self.log.write(f'  内存合计：{self.format_bytes(memory["total"])}{unknown}')
+        labels = [label for _, label in TTL_BUCKETS] + [NO_EXPIRY]
+        self.log.write('  剩余有效期：' + '，'.join(f'{label} {self.ttls[label]}' for label in labels))
+        if len(self.nodes) > 1:
+            self.log.write('  各节点：' + '，'.join(f'{redact(node)} {count}' for node, count in self.nodes.items()))
+        if self.delete_orphans:
+            self.log.write(self.style.SUCCESS(f'已删除{counts["deleted"]}个用户不存在或已停用的session'))
+
+    def format_bytes(self, value):
+        for unit in ('B', 'KiB', 'MiB'):
+            if value < 1024:
+                return f'{value:.0f} {unit}' if unit == 'B' else f'{value:.1f} {unit}'
+            value /= 1024
+        return f'{value:.1f} GiB'
@@ -0,0 +1,75 @@
+"""Django关键路径的指标，由 ``/metrics/`` 以Prometheus文本格式导出
+
+带标签的指标在这里绑定好子指标，请求路径上直接使用，不再查找标签。
+Django的数据库连接没有连接池（按线程保持），因此只导出Redis连接池的使用情况。
+"""
+import os
+
+from shared_auth.metrics import Counter, Gauge, Histogram, Registry
+
+registry = Registry()
+
+STAGE_SECONDS = Histogram(
+    "shared_auth_stage_seconds", "Latency of each stage of session and user resolution",
+    ["stage"], registry=registry,
+)
+SESSION_LOAD = STAGE_SECONDS.labels("session_load")
+SESSION_SAVE = STAGE_SECONDS.labels("session_save")
+USER_CACHE_GET = STAGE_SECONDS.labels("user_cache_get")
+USER_QUERY = STAGE_SECONDS.labels("user_query")
+PASSWORD_HASH = STAGE_SECONDS.labels("password_hash")
+PASSWORD_HASH_WAIT = STAGE_SECONDS.labels("password_hash_wait")
+
+USER_CACHE_REQUESTS = Counter(
+    "shared_auth_user_cache_requests_total", "Shared user cache lookups",
+    ["result"], registry=registry,
+)
+USER_CACHE_HIT = USER_CACHE_REQUESTS.labels("hit")
+USER_CACHE_MISS = USER_CACHE_REQUESTS.labels("miss")
+
+SESSION_NOT_FOUND = Counter(
+    "shared_auth_session_not_found_total", "Session keys with no data in the session store",
+    registry=registry,
+)
+SESSION_DECODE_FAILURES = Counter(
+    "shared_auth_session_decode_failures_total", "Sessions that could not be decoded",
+    registry=registry,
+)
+SESSION_STORE_ERRORS = Counter(
+    "shared_auth_session_store_errors_total", "Errors talking to the session store",
+    registry=registry,
+)
+
+PASSWORD_HASHING_REJECTED = Counter(
+    "shared_auth_password_hashing_rejected_total",
+    "Logins and registrations rejected because no hashing thread became free in time",
+    registry=registry,
+)
+
+POOL_CONNECTIONS = Gauge(
+    "shared_auth_pool_connections", "Connection pool usage, sampled at scrape time",
+    ["pool", "state"], registry=registry,
+)
+
+
+def register_redis_pool(alias):
+    """导出django_redis连接池中使用中和空闲的连接数"""
+    def sample(read):
+        def sampled():
+            from django_redis import get_redis_connection
+
+            return read(get_redis_connection(alias).connection_pool)
+        return sampled
+
+    POOL_CONNECTIONS.labels("redis", "in_use").set_function(
+        sample(lambda pool: len(pool._in_use_connections))
+    )
+    POOL_CONNECTIONS.labels("redis", "idle").set_function(
+        sample(lambda pool: len(pool._available_connections))
+    )
+    POOL_CONNECTIONS.labels("redis", "max").set_function(sample(lambda pool: pool.max_connections))
+
+
+# gunicorn运行多个worker时汇总所有worker的指标（目录由docker/gunicorn.conf.py设置）
+if os.environ.get("METRICS_MULTIPROC_DIR"):
+    registry.enable_multiprocess(os.environ["METRICS_MULTIPROC_DIR"], "django")
@@ -0,0 +1,21 @@
+from django.contrib.sessions.middleware import SessionMiddleware
+
+
+class BufferedSessionMiddleware(SessionMiddleware):
+    """替代Django的SessionMiddleware：请求处理期间延迟session的Redis写入，响应时一次提交
+
+    session后端不支持延迟写入（例如signed_cookies）时与SessionMiddleware相同。
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        if hasattr(request.session, 'flush_pending'):
+            request.session.buffered = True
+
+    def process_response(self, request, response):
+        response = super().process_response(request, response)
+        session = getattr(request, 'session', None)
+        if hasattr(session, 'flush_pending'):
+            # 登出等只删除session的请求不会调用save，在这里提交剩余的删除
+            session.flush_pending()
+        return response
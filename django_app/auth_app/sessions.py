@@ -0,0 +1,131 @@
+import logging
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.contrib.sessions.backends.cache import SessionStore as CacheSessionStore
+from django_redis import get_redis_connection
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import RedisError
+
+from shared_auth import session_hash
+from . import metrics, sharding
+
+logger = logging.getLogger(__name__)
+
+# 与FastAPI合并部署（combined/asgi.py）时设置为FastAPI的进程内session缓存：
+# Django读取的session写入该缓存，FastAPI处理同一session时不再访问Redis
+local_cache = None
+
+
+def invalidate_local_session(session_key):
+    # 本进程的缓存立即失效，不等待pub/sub消息
+    if local_cache is not None:
+        local_cache.invalidate(session_key)
+
+
+def publish_session_invalidation(session_key):
+    """通知所有FastAPI进程从本地缓存中移除该session"""
+    invalidate_local_session(session_key)
+    try:
+        connection = get_redis_connection(sharding.INVALIDATION_CACHE_ALIAS)
+        connection.publish(settings.SESSION_INVALIDATION_CHANNEL, session_key)
+    except Exception:
+        logger.exception("Failed to publish session invalidation for %s", session_key)
+
+
+class SessionStore(CacheSessionStore):
+    """在保存和删除session时发布失效消息的cache session后端
+
+    ``SESSION_STORAGE_LAYOUT=hash`` 时session按 :mod:`shared_auth.session_hash` 保存为Redis hash。
+    配置了 ``SESSION_REDIS_URLS`` 时session分布在多个节点上（见 :mod:`auth_app.sharding`）。
+    """
+
+    def load(self):
+        # 与父类相同，额外区分并记录未找到、Redis错误和解码失败
+        cache, epoch = local_cache, None
+        if cache is not None and self._session_key:
+            cached = cache.get(self._session_key)
+            # FastAPI只读取部分字段时缓存的是PartialSession，不能作为Django的session
+            if cached is not None and not isinstance(cached, session_hash.PartialSession):
+                # 缓存中的字典与FastAPI共享，Django会修改session，因此返回副本
+                return dict(cached)
+            epoch = cache.epoch
+        try:
+            with metrics.SESSION_LOAD.time():
+                session_data = self._load_data()
+        except (ConnectionInterrupted, RedisError):
+            metrics.SESSION_STORE_ERRORS.inc()
+            session_data = None
+        except Exception:
+            metrics.SESSION_DECODE_FAILURES.inc()
+            session_data = None
+        else:
+            if session_data is None:
+                metrics.SESSION_NOT_FOUND.inc()
+        if session_data is not None:
+            if epoch is not None:
+                cache.set(self._session_key, dict(session_data), epoch)
+            return session_data
+        self._session_key = None
+        return {}
+
+    def _load_data(self):
+        if settings.SESSION_STORAGE_LAYOUT != 'hash':
+            return self._cache.get(self.cache_key)
+        client = self._cache.client
+        key = client.make_key(self.cache_key)
+        try:
+            fields = sharding.client_for(client, key, write=False).hgetall(key)
+        except RedisError as e:
+            if not session_hash.is_wrong_type(e):
+                raise
+            # 切换布局之前保存的session
+            return self._cache.get(self.cache_key)
+        return session_hash.decode_fields(fields.items()) if fields else None
+
+    def _write_command(self, redis, data, must_create=False):
+        """在Redis客户端或pipeline上执行保存session的命令，返回是否写入
+
+        ``must_create`` 时只在key不存在时写入，否则只在key仍然存在时写入：
+        请求处理期间被其他请求登出或清空的session不会被重新写回。
+        """
+        client = self._cache.client
+        key = client.make_key(self.cache_key)
+        expiry_ms = self.get_expiry_age() * 1000
+        if settings.SESSION_STORAGE_LAYOUT == 'hash':
+            args = session_hash.save_args(data, must_create, expiry_ms)
+            return redis.eval(session_hash.SAVE_SCRIPT, 1, key, *args)
+        return redis.set(key, client.encode(data), px=expiry_ms, nx=must_create, xx=not must_create)
+
+    def _save_hash(self, must_create):
+        # 与CacheSessionStore.save相同，只是写入命令不同
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        client = self._cache.client
+        redis = sharding.client_for(client, client.make_key(self.cache_key))
+        try:
+            created = self._write_command(redis, data, must_create)
+        except RedisError as e:
+            raise ConnectionInterrupted(connection=None) from e
+        if must_create and not created:
+            raise CreateError
+        if not must_create and not created:
+            raise UpdateError
+
+    def save(self, must_create=False):
+        if settings.SESSION_STORAGE_LAYOUT == 'hash':
+            self._save_hash(must_create)
+        else:
+            super().save(must_create=must_create)
+        # 新创建的session不可能已被FastAPI缓存
+        if not must_create:
+            publish_session_invalidation(self.session_key)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        super().delete(session_key)
+        publish_session_invalidation(session_key)
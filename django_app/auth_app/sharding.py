@@ -0,0 +1,95 @@
+"""Django端的session分片（``SESSION_REDIS_URLS``）
+
+配置了多个节点时session保存在 ``sessions`` 缓存中，:class:`ShardClient` 用
+:class:`shared_auth.sharding.HashRing` 选择节点，与FastAPI的选择相同。用户缓存和失效消息
+仍然使用 ``default`` 缓存（``REDIS_URL``），FastAPI在那里订阅失效频道。
+
+直接访问Redis的代码（hash布局、合并写入、管理命令）通过 :func:`client_for` 和
+:class:`Pipeline` 访问session所在的节点，未分片时两者都使用 ``default`` 缓存的客户端。
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django_redis import get_redis_connection
+from django_redis.client import ShardClient as BaseShardClient
+
+from shared_auth import sharding
+
+# 失效消息发布到的缓存，FastAPI订阅同一个Redis
+INVALIDATION_CACHE_ALIAS = 'default'
+
+
+class ShardClient(BaseShardClient):
+    """与FastAPI使用相同哈希环的django_redis分片客户端"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._ring = sharding.HashRing(self._server)
+
+    def get_server_name(self, _key):
+        # 按完整的key选择节点；不支持django_redis的{hash tag}，FastAPI不解析它
+        return self._ring.node_for(str(_key))
+
+    @property
+    def nodes(self):
+        """``{节点地址: Redis客户端}``"""
+        return self._serverdict
+
+
+def session_client():
+    """session缓存的django_redis客户端"""
+    return caches[settings.SESSION_CACHE_ALIAS].client
+
+
+def is_sharded(client):
+    return isinstance(client, ShardClient)
+
+
+def nodes(client):
+    """``{节点地址: Redis客户端}``，未分片时只有一个节点"""
+    if is_sharded(client):
+        return client.nodes
+    return {client._server[0]: client.get_client(write=True)}
+
+
+def client_for(client, key, write=True):
+    """``key``（make_key之后的完整key）所在节点的Redis客户端"""
+    if is_sharded(client):
+        return client.get_server(key)
+    return client.get_client(write=write)
+
+
+class Pipeline:
+    """按key所在的节点分发命令的pipeline，``execute`` 按添加的顺序返回所有命令的结果
+
+    每次调用 :meth:`on`、:meth:`for_key` 后在返回的pipeline上添加一个命令。
+    未分片时session和失效消息使用同一个Redis，所有命令在一个pipeline中一次往返执行。
+    """
+
+    def __init__(self, client):
+        self.client = client
+        # id(Redis客户端) -> [pipeline, 命令数]
+        self._pipelines = {}
+        # 每个命令的 (id(Redis客户端), 在该pipeline中的位置)
+        self._commands = []
+
+    def on(self, redis):
+        entry = self._pipelines.get(id(redis))
+        if entry is None:
+            entry = self._pipelines[id(redis)] = [redis.pipeline(transaction=False), 0]
+        self._commands.append((id(redis), entry[1]))
+        entry[1] += 1
+        return entry[0]
+
+    def for_key(self, key):
+        return self.on(client_for(self.client, key))
+
+    def publish(self, channel, message):
+        self.on(get_redis_connection(INVALIDATION_CACHE_ALIAS)).publish(channel, message)
+
+    def execute(self, raise_on_error=True):
+        # 各节点的pipeline依次执行；一个节点失败时已经在其他节点执行的命令不会回滚
+        results = {
+            ident: pipeline.execute(raise_on_error=raise_on_error)
+            for ident, (pipeline, _) in self._pipelines.items()
+        }
+        return [results[ident][index] for ident, index in self._commands]
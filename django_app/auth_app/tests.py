@@ -1,6 +1,25 @@
-from django.test import TestCase, Client
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import Mock, patch
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import AsyncClient, TestCase, Client, override_settings
+from django.contrib.auth import BACKEND_SESSION_KEY, authenticate
 from django.contrib.auth.models import User
+from django.contrib.sessions.backends.base import UpdateError
 from django.urls import reverse
+from django_redis import get_redis_connection
+
+from shared_auth.sharding import HashRing
+from . import async_views, backends, buffered_sessions, hashing, health, metrics, sessions
+from .urls import auth_urlpatterns
+
+# AsyncViewsTestCase使用的URL配置
+urlpatterns = auth_urlpatterns(async_views)
 
 
 class AuthTestCase(TestCase):
@@ -67,3 +86,610 @@ class AuthTestCase(TestCase):
         self.assertEqual(data['email'], 'test@example.com')
         self.assertEqual(data['auth_backend'], 'django')
 
+
+@override_settings(SESSION_ENGINE='auth_app.sessions')
+class SessionInvalidationTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username='testuser', password='testpassword')
+
+    def test_logout_publishes_invalidation(self):
+        """测试登出时发布session失效消息"""
+        self.client.login(username='testuser', password='testpassword')
+        session_key = self.client.session.session_key
+
+        with patch('auth_app.sessions.publish_session_invalidation') as publish:
+            self.client.get(reverse('logout'))
+
+        publish.assert_any_call(session_key)
+
+    def test_login_invalidates_previous_session_key(self):
+        """测试登录轮换session key时旧key被失效"""
+        self.client.get(reverse('login'))
+        session = self.client.session
+        session['visited'] = True
+        session.save()
+        old_key = session.session_key
+
+        with patch('auth_app.sessions.publish_session_invalidation') as publish:
+            self.client.post(reverse('login'), {
+                'username': 'testuser',
+                'password': 'testpassword'
+            })
+
+        publish.assert_any_call(old_key)
+        self.assertNotEqual(self.client.session.session_key, old_key)
+
+
+@override_settings(SESSION_ENGINE='auth_app.buffered_sessions')
+class BufferedSessionTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username='testuser', password='testpassword')
+        self.redis = get_redis_connection(settings.SESSION_CACHE_ALIAS)
+
+    def session_exists(self, session_key):
+        return self.redis.exists(f':1:django.contrib.sessions.cache{session_key}')
+
+    def test_login_writes_session_once(self):
+        """测试登录轮换session key时只写一次Redis，旧key被删除并失效"""
+        self.client.get(reverse('login'))
+        session = self.client.session
+        session['visited'] = True
+        session.save()
+        old_key = session.session_key
+        saves = metrics.SESSION_SAVE.count
+
+        with patch('auth_app.sessions.invalidate_local_session') as invalidate:
+            response = self.client.post(reverse('login'), {
+                'username': 'testuser',
+                'password': 'testpassword'
+            })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(metrics.SESSION_SAVE.count - saves, 1)
+        invalidate.assert_called_once_with(old_key)
+        new_key = self.client.session.session_key
+        self.assertNotEqual(new_key, old_key)
+        self.assertFalse(self.session_exists(old_key))
+        self.assertTrue(self.session_exists(new_key))
+        self.assertTrue(self.client.session['visited'])
+
+    def test_logout_deletes_session(self):
+        """测试登出时在响应阶段删除session"""
+        self.client.post(reverse('login'), {
+            'username': 'testuser',
+            'password': 'testpassword'
+        })
+        session_key = self.client.session.session_key
+        self.assertTrue(self.session_exists(session_key))
+
+        self.client.get(reverse('logout'))
+
+        self.assertFalse(self.session_exists(session_key))
+
+
+    def test_save_does_not_restore_flushed_session(self):
+        """测试其他请求flush()之后，本请求在响应时的保存不会把session写回"""
+        session = buffered_sessions.SessionStore()
+        session['visited'] = True
+        session.save()
+        session_key = session.session_key
+
+        request_session = buffered_sessions.SessionStore(session_key)
+        request_session.buffered = True
+        request_session['count'] = 1
+        buffered_sessions.SessionStore(session_key).flush()
+
+        with self.assertRaises(UpdateError):
+            request_session.save()
+        self.assertFalse(self.session_exists(session_key))
+
+
+@override_settings(SESSION_ENGINE='auth_app.buffered_sessions', SESSION_STORAGE_LAYOUT='hash')
+class HashSessionLayoutTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username='testuser', password='testpassword')
+        self.redis = get_redis_connection(settings.SESSION_CACHE_ALIAS)
+
+    def redis_key(self, session_key):
+        return f':1:django.contrib.sessions.cache{session_key}'
+
+    def test_login_stores_session_fields(self):
+        """测试hash布局下登录后每个顶层key保存为一个hash字段"""
+        response = self.client.post(reverse('login'), {
+            'username': 'testuser',
+            'password': 'testpassword'
+        })
+        self.assertEqual(response.status_code, 302)
+        key = self.redis_key(self.client.session.session_key)
+        self.assertEqual(self.redis.type(key), b'hash')
+        self.assertIn(b'_auth_user_id', self.redis.hkeys(key))
+        self.assertGreater(self.redis.pttl(key), 0)
+        self.assertEqual(self.client.get(reverse('user_api')).json()['username'], 'testuser')
+
+    def test_create_and_legacy_blob_session(self):
+        """测试hash布局下创建空session，以及读取并转换按blob布局保存的session"""
+        session = sessions.SessionStore()
+        session.create()
+        self.assertEqual(self.redis.hkeys(self.redis_key(session.session_key)), [b'__session__'])
+        self.assertTrue(session.exists(session.session_key))
+
+        with self.settings(SESSION_STORAGE_LAYOUT='blob'):
+            legacy = sessions.SessionStore()
+            legacy['visited'] = True
+            legacy.save()
+        loaded = sessions.SessionStore(legacy.session_key)
+        self.assertTrue(loaded['visited'])
+        loaded['count'] = 1
+        loaded.save()
+        self.assertEqual(self.redis.type(self.redis_key(legacy.session_key)), b'hash')
+        self.assertEqual(dict(sessions.SessionStore(legacy.session_key).items()), {'visited': True, 'count': 1})
+
+    def test_update_after_delete_is_not_written(self):
+        """测试hash布局下session被其他请求删除后，更新不会把它写回"""
+        session = sessions.SessionStore()
+        session['visited'] = True
+        session.save()
+        loaded = sessions.SessionStore(session.session_key)
+        loaded['count'] = 1
+        sessions.SessionStore(session.session_key).delete()
+
+        with self.assertRaises(UpdateError):
+            loaded.save()
+        self.assertFalse(self.redis.exists(self.redis_key(session.session_key)))
+
+        buffered = buffered_sessions.SessionStore()
+        buffered.save()
+        request_session = buffered_sessions.SessionStore(buffered.session_key)
+        request_session.buffered = True
+        request_session['count'] = 1
+        buffered_sessions.SessionStore(buffered.session_key).flush()
+        with self.assertRaises(UpdateError):
+            request_session.save()
+        self.assertFalse(self.redis.exists(self.redis_key(buffered.session_key)))
+
+
+class CachedUserBackendTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword'
+        )
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_authenticated_request_without_queries(self):
+        """测试用户行缓存后，已认证请求不再查询数据库"""
+        self.client.get(reverse('user_api'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('user_api'))
+        self.assertEqual(response.json()['username'], 'testuser')
+
+    def test_user_change_invalidates_cache(self):
+        """测试修改用户后缓存失效"""
+        self.client.get(reverse('user_api'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.email = 'changed@example.com'
+            self.user.save()
+
+        response = self.client.get(reverse('user_api'))
+        self.assertEqual(response.json()['email'], 'changed@example.com')
+
+    def test_session_from_model_backend_stays_logged_in(self):
+        """测试切换认证后端之前登录的session（后端为ModelBackend）仍然有效，登录失败只检查一次密码"""
+        session = self.client.session
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session.save()
+        self.assertEqual(self.client.get(reverse('user_api')).json()['username'], 'testuser')
+
+        with patch('auth_app.hashing.run', wraps=hashing.run) as run:
+            self.assertIsNone(authenticate(username='testuser', password='wrong'))
+        self.assertEqual(run.call_count, 1)
+
+    def test_late_write_of_old_row_is_not_served(self):
+        """测试修改用户的事务提交之前读到的旧行在之后写入缓存时不会被读取"""
+        stale = User.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            # 并发的get_user在信号发出后、事务提交前读取版本号和（提交前的）旧行
+            version = backends.get_user_version(self.user.pk)
+        backends.cache_user(stale, version)
+
+        self.assertIsNone(backends.CachedModelBackend().get_user(self.user.pk))
+        self.assertNotIn('date_joined', backends._cached_fields(stale))
+
+    def test_user_api_conditional_get(self):
+        """测试用户API的ETag：未修改时返回304，修改用户后ETag变化"""
+        response = self.client.get(reverse('user_api'))
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+
+        response = self.client.get(reverse('user_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.email = 'changed@example.com'
+            self.user.save()
+
+        response = self.client.get(reverse('user_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_deactivated_user_is_logged_out(self):
+        """测试停用用户后无法继续访问"""
+        self.client.get(reverse('user_api'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        response = self.client.get(reverse('user_api'))
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(SESSION_ENGINE='auth_app.sessions')
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username='testuser', email='test@example.com', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_metrics_view(self):
+        """测试/metrics/导出缓存命中和各阶段耗时"""
+        self.client.get(reverse('user_api'))
+        hits = metrics.USER_CACHE_HIT.value
+        session_loads = metrics.SESSION_LOAD.count
+
+        self.client.get(reverse('user_api'))
+        self.assertEqual(metrics.USER_CACHE_HIT.value, hits + 1)
+        self.assertEqual(metrics.SESSION_LOAD.count, session_loads + 1)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertContains(response, 'shared_auth_stage_seconds_bucket{stage="user_cache_get",le="+Inf"}')
+        self.assertContains(response, 'shared_auth_user_cache_requests_total{result="hit"}')
+        self.assertContains(response, 'shared_auth_pool_connections{pool="redis",state="max"}')
+
+    def test_missing_session_is_counted(self):
+        """测试cookie中的session不存在时计入未找到"""
+        not_found = metrics.SESSION_NOT_FOUND.value
+        self.client.cookies['shared_session_id'] = 'doesnotexist0000000000000000000'
+        self.client.get(reverse('home'))
+        self.assertEqual(metrics.SESSION_NOT_FOUND.value, not_found + 1)
+
+
+class PasswordHashingTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username='testuser', password='testpassword')
+
+    def test_register_hashes_password(self):
+        """测试注册时在哈希线程池中计算的密码可以用于登录"""
+        hashed = metrics.PASSWORD_HASH.count
+        self.client.post(reverse('register'), {
+            'username': 'newuser',
+            'email': 'new@example.com',
+            'password1': 'newpassword',
+            'password2': 'newpassword',
+        })
+        self.assertGreater(metrics.PASSWORD_HASH.count, hashed)
+        self.assertTrue(User.objects.get(username='newuser').check_password('newpassword'))
+
+    @override_settings(PASSWORD_HASHING_QUEUE_TIMEOUT=0.01)
+    def test_login_rejected_when_hashing_busy(self):
+        """测试所有哈希线程都在忙时登录返回503"""
+        rejected = metrics.PASSWORD_HASHING_REJECTED.value
+        _, slots = hashing._get_executor()
+        held = 0
+        while slots.acquire(blocking=False):
+            held += 1
+        try:
+            response = self.client.post(reverse('login'), {
+                'username': 'testuser',
+                'password': 'testpassword'
+            })
+        finally:
+            for _ in range(held):
+                slots.release()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(metrics.PASSWORD_HASHING_REJECTED.value, rejected + 1)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_hasher_cost_command(self):
+        """测试hasher_cost命令给出达到目标耗时的参数建议"""
+        out = StringIO()
+        call_command('hasher_cost', '--runs', '1', '--target-ms', '1', stdout=out)
+        self.assertIn('单次耗时', out.getvalue())
+        self.assertIn('建议参数：iterations=', out.getvalue())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportUsersTestCase(TestCase):
+    def write_file(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_csv_in_process_pool(self):
+        """测试从CSV导入：并行计算哈希、分批插入，跳过已存在和重复的用户名"""
+        User.objects.create_user(username='existing', password='old-password')
+        rows = ['username,email,password']
+        rows += [f'user{i},user{i}@EXAMPLE.com,password{i}' for i in range(5)]
+        rows += ['existing,new@example.com,new-password', 'user0,dup@example.com,dup', ',empty@example.com,x']
+        path = self.write_file('.csv', '\n'.join(rows) + '\n')
+        out = StringIO()
+
+        call_command('import_users', path, '--batch-size', '2', '--workers', '2', stdout=out)
+
+        self.assertIn('导入完成：新建5，已存在2，无效1', out.getvalue())
+        user = User.objects.get(username='user3')
+        self.assertEqual(user.email, 'user3@example.com')
+        self.assertTrue(user.check_password('password3'))
+        self.assertTrue(User.objects.get(username='existing').check_password('old-password'))
+
+    def test_import_ndjson(self):
+        """测试从NDJSON导入，无效的行计为无效，没有密码的用户设置为不可用的密码"""
+        lines = [json.dumps({'username': 'alice', 'password': 'secret'}), 'not json', '[1]',
+                 json.dumps({'username': 'bob', 'email': 'bob@example.com'})]
+        path = self.write_file('.ndjson', '\n'.join(lines) + '\n')
+        out = StringIO()
+
+        call_command('import_users', path, '--workers', '0', stdout=out)
+
+        self.assertIn('新建2，已存在0，无效2', out.getvalue())
+        self.assertTrue(User.objects.get(username='alice').check_password('secret'))
+        self.assertFalse(User.objects.get(username='bob').has_usable_password())
+
+
+@override_settings(SESSION_STORAGE_LAYOUT='hash')
+class SessionInventoryTestCase(TestCase):
+    def create_session(self, user=None, layout='hash'):
+        with self.settings(SESSION_STORAGE_LAYOUT=layout):
+            session = sessions.SessionStore()
+            session['visited'] = True
+            if user is not None:
+                session['_auth_user_id'] = str(user.pk)
+            session.create()
+        return session.session_key
+
+    def test_inventory_and_delete_orphans(self):
+        """测试统计各类session并删除用户已不存在或已停用的session"""
+        active = User.objects.create_user(username='active', password='testpassword')
+        inactive = User.objects.create_user(username='inactive', password='testpassword', is_active=False)
+        deleted = User.objects.create_user(username='deleted', password='testpassword')
+        keys = {
+            'anonymous': self.create_session(),
+            'active': self.create_session(active, layout='blob'),
+            'inactive': self.create_session(inactive),
+            'deleted': self.create_session(deleted),
+        }
+        deleted.delete()
+        out, err = StringIO(), StringIO()
+
+        call_command('session_inventory', '--ndjson', '--delete-orphans', '--batch-size', '2',
+                     stdout=out, stderr=err)
+
+        rows = {row['session_key']: row for row in map(json.loads, out.getvalue().splitlines())}
+        self.assertEqual(rows[keys['anonymous']]['status'], 'anonymous')
+        self.assertEqual(rows[keys['active']]['status'], 'authenticated')
+        self.assertEqual(rows[keys['active']]['user_id'], active.pk)
+        for name in ('inactive', 'deleted'):
+            self.assertEqual(rows[keys[name]]['status'], 'orphan')
+            self.assertTrue(rows[keys[name]]['deleted'])
+            self.assertFalse(sessions.SessionStore().exists(keys[name]))
+        self.assertTrue(sessions.SessionStore().exists(keys['active']))
+        self.assertIn('已删除', err.getvalue())
+
+
+def sharded_caches(*databases):
+    """把session分布在REDIS_URL所在Redis的几个数据库上的缓存配置"""
+    base = settings.REDIS_URL.rsplit('/', 1)[0]
+    return {**settings.CACHES, 'sessions': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': [f'{base}/{database}' for database in databases],
+        'OPTIONS': {**settings.CACHES['default']['OPTIONS'], 'CLIENT_CLASS': 'auth_app.sharding.ShardClient'},
+    }}
+
+
+@override_settings(SESSION_ENGINE='auth_app.buffered_sessions', SESSION_CACHE_ALIAS='sessions',
+                   CACHES=sharded_caches(1, 2))
+class SessionShardingTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username='testuser', password='testpassword')
+        self.nodes = caches['sessions'].client.nodes
+        for redis in self.nodes.values():
+            redis.flushdb()
+
+    def redis_key(self, session_key):
+        return f':1:django.contrib.sessions.cache{session_key}'
+
+    def stored_on(self, session_key):
+        return [node for node, redis in self.nodes.items() if redis.exists(self.redis_key(session_key))]
+
+    def test_login_stores_session_on_ring_node(self):
+        """测试session只保存在哈希环选择的节点上，轮换key时删除另一个节点上的旧key"""
+        ring = HashRing(self.nodes)
+        self.client.get(reverse('login'))
+        session = self.client.session
+        session.save()
+        old_key = session.session_key
+
+        with patch('auth_app.sessions.invalidate_local_session') as invalidate:
+            self.client.post(reverse('login'), {'username': 'testuser', 'password': 'testpassword'})
+
+        invalidate.assert_called_once_with(old_key)
+        session_key = self.client.session.session_key
+        self.assertEqual(self.stored_on(old_key), [])
+        self.assertEqual(self.stored_on(session_key), [ring.node_for(self.redis_key(session_key))])
+        self.assertEqual(self.client.get(reverse('user_api')).json()['username'], 'testuser')
+        self.assertTrue(health.probe()[0])
+
+    def test_rebalance_after_adding_node(self):
+        """测试增加节点后rebalance_sessions把session迁移到新选择的节点，有效期不变"""
+        before = sharded_caches(1)
+        with self.settings(CACHES=before):
+            keys = []
+            for _ in range(30):
+                session = sessions.SessionStore()
+                session['visited'] = True
+                session.create()
+                keys.append(session.session_key)
+        ring = HashRing(self.nodes)
+        source = before['sessions']['LOCATION'][0]
+        moving = [key for key in keys if ring.node_for(self.redis_key(key)) != source]
+        self.assertTrue(moving)
+        self.assertFalse(sessions.SessionStore().exists(moving[0]))
+
+        out = StringIO()
+        call_command('rebalance_sessions', '--dry-run', stdout=out)
+        self.assertIn(f'需要迁移{len(moving)}个', out.getvalue())
+        call_command('rebalance_sessions', '--batch-size', '7', stdout=out)
+
+        self.assertIn(f'已迁移{len(moving)}个', out.getvalue())
+        for key in keys:
+            self.assertEqual(self.stored_on(key), [ring.node_for(self.redis_key(key))])
+            self.assertEqual(sessions.SessionStore(key).load(), {'visited': True})
+        node = ring.node_for(self.redis_key(moving[0]))
+        self.assertGreater(self.nodes[node].ttl(self.redis_key(moving[0])), 0)
+
+
+class TokenBackend:
+    """只接受token的认证后端，用户名和密码登录时应按签名跳过它"""
+
+    def authenticate(self, request, token=None):
+        return None
+
+
+@override_settings(ROOT_URLCONF=__name__, SESSION_ENGINE='auth_app.sessions')
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        self.async_client = AsyncClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword'
+        )
+
+    async def test_login_and_user_api(self):
+        """测试异步登录后可以访问用户API，session中保存了用户信息"""
+        response = await self.async_client.post(reverse('login'), {
+            'username': 'testuser',
+            'password': 'testpassword'
+        })
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+        response = await self.async_client.get(reverse('user_api'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['username'], 'testuser')
+
+        response = await self.async_client.get(reverse('profile'))
+        self.assertContains(response, 'testuser')
+
+    async def test_user_api_conditional_get(self):
+        """测试异步用户API的ETag和304"""
+        await self.async_client.post(reverse('login'), {'username': 'testuser', 'password': 'testpassword'})
+        response = await self.async_client.get(reverse('user_api'))
+        self.assertIn('private', response['Cache-Control'])
+        response = await self.async_client.get(reverse('user_api'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_invalid_password(self):
+        """测试密码错误时不登录"""
+        response = await self.async_client.post(reverse('login'), {
+            'username': 'testuser',
+            'password': 'wrongpassword'
+        })
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('user_api'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith('/login/?next='))
+
+    @override_settings(AUTHENTICATION_BACKENDS=['auth_app.tests.TokenBackend', 'auth_app.backends.CachedModelBackend'])
+    async def test_login_skips_backend_with_other_credentials(self):
+        """测试参数不匹配的认证后端被跳过，不会抛出TypeError"""
+        response = await self.async_client.post(reverse('login'), {
+            'username': 'testuser',
+            'password': 'testpassword'
+        })
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    async def test_register_and_logout(self):
+        """测试异步注册、重复用户名和登出"""
+        response = await self.async_client.post(reverse('register'), {
+            'username': 'newuser',
+            'email': 'new@example.com',
+            'password1': 'newpassword',
+            'password2': 'newpassword',
+        })
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        user = await User.objects.aget(username='newuser')
+        self.assertTrue(user.check_password('newpassword'))
+
+        response = await self.async_client.post(reverse('register'), {
+            'username': 'newuser',
+            'email': 'new@example.com',
+            'password1': 'newpassword',
+            'password2': 'newpassword',
+        })
+        self.assertContains(response, 'Username already exists.')
+
+        await self.async_client.post(reverse('login'), {'username': 'newuser', 'password': 'newpassword'})
+        response = await self.async_client.get(reverse('logout'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        response = await self.async_client.get(reverse('user_api'))
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(PASSWORD_HASHING_QUEUE_TIMEOUT=0.01)
+    async def test_login_rejected_when_hashing_busy(self):
+        """测试异步登录在所有哈希线程都忙时返回503"""
+        _, slots = hashing._get_executor()
+        held = 0
+        while slots.acquire(blocking=False):
+            held += 1
+        try:
+            response = await self.async_client.post(reverse('login'), {
+                'username': 'testuser',
+                'password': 'testpassword'
+            })
+        finally:
+            for _ in range(held):
+                slots.release()
+        self.assertEqual(response.status_code, 503)
+
+
+class HealthTestCase(TestCase):
+    def setUp(self):
+        health._report = None
+
+    def test_livez(self):
+        """测试存活探针不访问数据库"""
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('livez'))
+        self.assertEqual(response.json(), {'status': 'ok'})
+
+    def test_readyz_caches_results(self):
+        """测试就绪探针在缓存有效期内不重复检查"""
+        response = self.client.get(reverse('readyz'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['checks']['database']['status'], 'ok')
+
+        with self.assertNumQueries(0):
+            self.client.get(reverse('readyz'))
+
+    def test_readyz_reports_failure(self):
+        """测试依赖不可用时返回503"""
+        with patch.dict(health.CHECKS, redis=Mock(side_effect=ConnectionError('refused'))):
+            response = self.client.get(reverse('readyz'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['redis']['error'], 'refused')
@@ -1,12 +1,21 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
-urlpatterns = [
-    path('', views.home_view, name='home'),
-    path('login/', views.login_view, name='login'),
-    path('register/', views.register_view, name='register'),
-    path('logout/', views.logout_view, name='logout'),
-    path('profile/', views.profile_view, name='profile'),
-    path('api/user/', views.user_api_view, name='user_api'),
-]
 
+def auth_urlpatterns(views):
+    return [
+        path('', views.home_view, name='home'),
+        path('login/', views.login_view, name='login'),
+        path('register/', views.register_view, name='register'),
+        path('logout/', views.logout_view, name='logout'),
+        path('profile/', views.profile_view, name='profile'),
+        path('api/user/', views.user_api_view, name='user_api'),
+        path('metrics/', views.metrics_view, name='metrics'),
+        path('livez/', views.livez_view, name='livez'),
+        path('readyz/', views.readyz_view, name='readyz'),
+    ]
+
+
+# ASGI部署时使用异步视图，WSGI下异步视图反而需要为每个请求启动事件循环
+urlpatterns = auth_urlpatterns(async_views if settings.AUTH_ASYNC_VIEWS else views)
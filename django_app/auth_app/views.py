@@ -3,7 +3,22 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag
+
+from shared_auth.etags import make_etag
+from shared_auth.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from . import hashing, health, metrics
+from .hashing import HashingBusy
+
+
+def hashing_busy_response(request, template_name):
+    """所有哈希线程都忙时返回503，提示客户端稍后重试"""
+    messages.error(request, 'The server is busy, please try again in a moment.')
+    response = render(request, template_name, status=503)
+    response['Retry-After'] = '1'
+    return response
 
 
 def home_view(request):
@@ -17,7 +32,10 @@ def login_view(request):
         username = request.POST.get('username')
         password = request.POST.get('password')
         
-        user = authenticate(request, username=username, password=password)
+        try:
+            user = authenticate(request, username=username, password=password)
+        except HashingBusy:
+            return hashing_busy_response(request, 'auth_app/login.html')
         
         if user is not None:
             login(request, user)
@@ -50,7 +68,10 @@ def register_view(request):
             messages.error(request, 'Username already exists.')
             return render(request, 'auth_app/register.html')
         
-        user = User.objects.create_user(username=username, email=email, password=password1)
+        try:
+            user = hashing.create_user(username=username, email=email, password=password1)
+        except HashingBusy:
+            return hashing_busy_response(request, 'auth_app/register.html')
         messages.success(request, f'Account created for {username}. You can now login.')
         return redirect('login')
     
@@ -71,16 +92,48 @@ def profile_view(request):
     return render(request, 'auth_app/profile.html', {'session_id': session_id})
 
 
-@login_required
-def user_api_view(request):
-    """用户API视图，返回JSON格式的用户数据"""
+def user_api_data(request):
     user = request.user
-    data = {
+    return {
         'id': user.id,
         'username': user.username,
         'email': user.email,
         'session_id': request.COOKIES.get('shared_session_id', 'Not found'),
         'auth_backend': 'django'
     }
-    return JsonResponse(data)
 
+
+def user_api_etag(request, *args, **kwargs):
+    """用户API的ETag，由响应中的字段计算；用户由缓存的用户行解析，不查询数据库"""
+    return make_etag(*user_api_data(request).values())
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@etag(user_api_etag)
+def user_api_view(request):
+    """用户API视图，返回JSON格式的用户数据"""
+    return JsonResponse(user_api_data(request))
+
+
+def metrics_view(request):
+    """Prometheus格式的指标"""
+    return HttpResponse(metrics.registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+def livez_view(request):
+    """存活探针，不访问数据库和Redis"""
+    return JsonResponse({'status': 'ok'})
+
+
+def readyz_response(report):
+    ready, checks = report
+    return JsonResponse(
+        {'status': 'ready' if ready else 'not_ready', 'checks': checks},
+        status=200 if ready else 503,
+    )
+
+
+def readyz_view(request):
+    """就绪探针，返回缓存的数据库和Redis检查结果，未就绪时返回503"""
+    return readyz_response(health.report())
@@ -13,6 +13,9 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 from pathlib import Path
 
+from shared_auth.logs import parse_sampling
+from shared_auth.sharding import parse_nodes
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -22,6 +25,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-r%3!vam8adf%l3cb!lylwvio$d&zgbzg*fybo_(otn2c7_k9lc')
+# 轮换密钥时保留旧密钥，逗号分隔；signed_cookies模式下FastAPI需配置相同的值
+SECRET_KEY_FALLBACKS = [key for key in os.environ.get('SECRET_KEY_FALLBACKS', '').split(',') if key]
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.environ.get('DEBUG', 'True') == 'True'
@@ -43,7 +48,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'auth_app.middleware.BufferedSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -87,6 +92,37 @@ DATABASES = {
 }
 
 
+# Authentication backends
+# 用户行缓存在共享Redis中，按用户ID和每个用户的版本号区分（用户修改后增加）；
+# 修改AUTH_USER_CACHE_VERSION可使所有用户的缓存失效
+# 切换到CachedModelBackend之前登录的session记录的后端是ModelBackend，保留它才不会使这些session失效
+# （它们在重新登录之前不使用缓存）；CachedModelBackend拒绝的登录不会再由ModelBackend检查一次
+AUTHENTICATION_BACKENDS = [
+    'auth_app.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', '3600'))
+AUTH_USER_CACHE_VERSION = int(os.environ.get('AUTH_USER_CACHE_VERSION', '1'))
+
+# 登录和注册的密码哈希在专用线程池中计算（见auth_app.hashing）：
+# 每个进程最多同时计算PASSWORD_HASHING_WORKERS个哈希，等待空闲线程超过
+# PASSWORD_HASHING_QUEUE_TIMEOUT秒时返回503。上限是每个进程的，默认把CPU平均分给
+# 同一容器中的gunicorn worker（GUNICORN_WORKERS），所有worker合计不超过CPU数
+PASSWORD_HASHING_WORKERS = int(
+    os.environ.get('PASSWORD_HASHING_WORKERS')
+    or max(1, (os.cpu_count() or 1) // int(os.environ.get('GUNICORN_WORKERS') or 1))
+)
+PASSWORD_HASHING_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_HASHING_QUEUE_TIMEOUT', '2.0'))
+
+# /readyz/缓存数据库和Redis检查结果的秒数
+HEALTH_CHECK_INTERVAL = float(os.environ.get('HEALTH_CHECK_INTERVAL', '5'))
+
+# 使用auth_app.async_views中的异步视图，默认在以ASGI运行（DJANGO_INTERFACE=asgi）时开启
+AUTH_ASYNC_VIEWS = (os.environ.get('AUTH_ASYNC_VIEWS') or
+                    ('1' if os.environ.get('DJANGO_INTERFACE') == 'asgi' else '0')) == '1'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -130,8 +166,21 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Redis Session Configuration
-SESSION_ENGINE = "django.contrib.sessions.backends.cache"
+# SESSION_MODE=redis：基于cache后端，在session保存/删除时通过Redis发布失效消息，
+# 一个请求内的写入、删除和失效消息在响应时合并为一个pipeline（auth_app.middleware.BufferedSessionMiddleware）
+# SESSION_MODE=signed_cookies：session保存在签名cookie中，FastAPI使用相同的SECRET_KEY本地校验
+SESSION_MODE = os.environ.get('SESSION_MODE', 'redis')
+if SESSION_MODE == 'signed_cookies':
+    SESSION_ENGINE = "django.contrib.sessions.backends.signed_cookies"
+else:
+    SESSION_ENGINE = "auth_app.buffered_sessions"
 SESSION_CACHE_ALIAS = "default"
+# redis模式下session在Redis中的存储布局：blob（整个session编码为一个字符串）
+# 或hash（每个顶层key一个hash字段，FastAPI只读取需要的字段），必须与FastAPI一致
+SESSION_STORAGE_LAYOUT = os.environ.get('SESSION_STORAGE_LAYOUT', 'blob')
+SESSION_INVALIDATION_CHANNEL = os.environ.get('SESSION_INVALIDATION_CHANNEL', 'shared_session:invalidate')
+# 与FastAPI共用的session编解码（带版本头的orjson，兼容旧的pickle数据）
+SESSION_SERIALIZER = "shared_auth.codec.SessionSerializer"
 
 # Redis Cache Configuration
 REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
@@ -141,16 +190,34 @@ CACHES = {
         "LOCATION": REDIS_URL,
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SERIALIZER": "shared_auth.codec.DjangoRedisSerializer",
             "PREFIX": "shared_session:",
         }
     }
 }
 
+# session分片：SESSION_REDIS_URLS为逗号分隔的多个Redis地址时，session按一致性哈希分布在这些节点上
+# （auth_app.sharding），列表必须与FastAPI相同；用户缓存和失效消息仍然使用REDIS_URL。
+# 增加节点后用 manage.py rebalance_sessions 迁移改变了节点的session
+SESSION_REDIS_URLS = parse_nodes(os.environ.get('SESSION_REDIS_URLS', ''))
+if SESSION_REDIS_URLS:
+    CACHES["sessions"] = {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": SESSION_REDIS_URLS,
+        "OPTIONS": {
+            "CLIENT_CLASS": "auth_app.sharding.ShardClient",
+            "SERIALIZER": "shared_auth.codec.DjangoRedisSerializer",
+        }
+    }
+    SESSION_CACHE_ALIAS = "sessions"
+
 # Session Configuration
 SESSION_COOKIE_NAME = "shared_session_id"
+SESSION_COOKIE_AGE = int(os.environ.get('SESSION_COOKIE_AGE', '1209600'))
 SESSION_COOKIE_PATH = "/"
-SESSION_COOKIE_DOMAIN = None  # 在生产环境中设置为共享域名
-SESSION_COOKIE_SECURE = False  # 在生产环境中设置为True
+# 在生产环境中设置为共享域名和True；FastAPI滑动过期时按相同的属性重新设置cookie
+SESSION_COOKIE_DOMAIN = os.environ.get('SESSION_COOKIE_DOMAIN') or None
+SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', 'False') == 'True'
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
 
@@ -160,27 +227,49 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
 
 # Logging Configuration
+# 日志由后台线程写出，请求线程只把记录放入队列（见shared_auth.logs）
+# LOG_SAMPLING按logger采样INFO及以下级别的日志，例如 "django.server=0.01"
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {
+            '()': 'shared_auth.logs.SamplingFilter',
+            'rates': parse_sampling(os.environ.get('LOG_SAMPLING', '')),
+        },
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            '()': 'shared_auth.logs.queue_handler',
+            'maxsize': int(os.environ.get('LOG_QUEUE_SIZE', '10000')),
+            'filters': ['sampling'],
         },
     },
+    'root': {
+        'handlers': ['console'],
+        'level': LOG_LEVEL,
+    },
     'loggers': {
         'django': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
+            'propagate': False,
         },
         'django.request': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
         'django.security': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        # runserver的访问日志
+        'django.server': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
             'propagate': False,
         },
     },
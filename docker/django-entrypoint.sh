@@ -48,6 +48,53 @@ else:
     print('超级用户已存在')
 "
 
+# serve：按SERVER_MODE启动Django
+#   dev        manage.py runserver（默认，单进程，仅用于开发）
+#   gunicorn   多worker的生产模式，DJANGO_INTERFACE=wsgi（默认，gthread）或asgi（UvicornWorker）
+serve() {
+    case "${SERVER_MODE:-dev}" in
+        dev)
+            exec python manage.py runserver "0.0.0.0:${PORT:-8000}"
+            ;;
+        gunicorn)
+            if [ "${DJANGO_INTERFACE:-wsgi}" = "asgi" ]; then
+                export GUNICORN_WORKER_CLASS="${GUNICORN_WORKER_CLASS:-uvicorn.workers.UvicornWorker}"
+                exec gunicorn -c /etc/gunicorn/gunicorn.conf.py shared_auth_project.asgi:application
+            fi
+            export GUNICORN_WORKER_CLASS="${GUNICORN_WORKER_CLASS:-gthread}"
+            exec gunicorn -c /etc/gunicorn/gunicorn.conf.py shared_auth_project.wsgi:application
+            ;;
+        *)
+            echo "未知的SERVER_MODE：${SERVER_MODE}" >&2
+            exit 1
+            ;;
+    esac
+}
+
+# serve-combined：在一个ASGI进程中运行Django和FastAPI（combined/asgi.py），
+# 用于合并部署的镜像，工作目录为django_app，combined包位于上一级目录
+serve_combined() {
+    case "${SERVER_MODE:-dev}" in
+        dev)
+            exec uvicorn combined.asgi:application --app-dir .. --host 0.0.0.0 --port "${PORT:-8000}"
+            ;;
+        gunicorn)
+            export GUNICORN_WORKER_CLASS="${GUNICORN_WORKER_CLASS:-uvicorn.workers.UvicornWorker}"
+            exec gunicorn -c /etc/gunicorn/gunicorn.conf.py --pythonpath .. combined.asgi:application
+            ;;
+        *)
+            echo "未知的SERVER_MODE：${SERVER_MODE}" >&2
+            exit 1
+            ;;
+    esac
+}
+
 # Execute the main command
 echo "启动Django应用..."
-exec "$@" 
\ No newline at end of file
+if [ "$1" = "serve" ]; then
+    serve
+fi
+if [ "$1" = "serve-combined" ]; then
+    serve_combined
+fi
+exec "$@"
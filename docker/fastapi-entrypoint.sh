@@ -17,6 +17,31 @@ wait_for_redis() {
 # Wait for Redis
 wait_for_redis
 
+# serve：按SERVER_MODE启动FastAPI
+#   dev        单个uvicorn进程（默认），UVICORN_RELOAD=1时代码修改后自动重启
+#   gunicorn   由gunicorn管理的多个UvicornWorker
+serve() {
+    case "${SERVER_MODE:-dev}" in
+        dev)
+            if [ "${UVICORN_RELOAD:-0}" = "1" ]; then
+                exec uvicorn main:app --host 0.0.0.0 --port "${PORT:-8001}" --reload
+            fi
+            exec uvicorn main:app --host 0.0.0.0 --port "${PORT:-8001}"
+            ;;
+        gunicorn)
+            export GUNICORN_WORKER_CLASS="${GUNICORN_WORKER_CLASS:-uvicorn.workers.UvicornWorker}"
+            exec gunicorn -c /etc/gunicorn/gunicorn.conf.py main:app
+            ;;
+        *)
+            echo "未知的SERVER_MODE：${SERVER_MODE}" >&2
+            exit 1
+            ;;
+    esac
+}
+
 # Execute the main command
 echo "启动FastAPI应用..."
-exec "$@" 
\ No newline at end of file
+if [ "$1" = "serve" ]; then
+    serve
+fi
+exec "$@"
@@ -0,0 +1,82 @@
+"""生产环境的gunicorn配置，Django和FastAPI镜像共用
+
+所有参数都可以通过环境变量覆盖；入口脚本通过 ``GUNICORN_WORKER_CLASS`` 选择worker类型：
+Django（WSGI）默认使用 ``gthread``，FastAPI和Django（ASGI）使用 ``uvicorn.workers.UvicornWorker``。
+"""
+import os
+
+
+def _cpu_count():
+    # 遵循容器的CPU亲和性限制；CPU配额（--cpus）不会反映在这里，需要时用GUNICORN_WORKERS指定
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _env(name, default):
+    # docker-compose中未设置的变量会以空字符串传入，按未设置处理
+    return os.environ.get(name) or default
+
+
+def _bool(name, default):
+    return _env(name, default).lower() in ("1", "true", "yes")
+
+
+worker_class = _env("GUNICORN_WORKER_CLASS", "gthread")
+_async_worker = "uvicorn" in worker_class.lower()
+
+bind = _env("GUNICORN_BIND", f"0.0.0.0:{_env('PORT', '8000')}")
+
+# 异步worker每个进程即可用满一个CPU；同步/线程worker按常用的 2*CPU+1
+workers = int(_env("GUNICORN_WORKERS", _cpu_count() if _async_worker else 2 * _cpu_count() + 1))
+# 应用按worker数量划分每个进程的资源（例如Django的PASSWORD_HASHING_WORKERS）；
+# 配置文件在加载应用之前执行，这里写回的值对预加载和worker进程都可见
+os.environ["GUNICORN_WORKERS"] = str(workers)
+
+# 多个worker时各进程的指标通过该目录汇总（见shared_auth.metrics），应用在导入时读取该变量
+if workers > 1 and not os.environ.get("METRICS_MULTIPROC_DIR"):
+    os.environ["METRICS_MULTIPROC_DIR"] = os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else "/tmp", f"shared_auth_metrics_{os.getpid()}"
+    )
+# 仅对gthread生效
+threads = int(_env("GUNICORN_THREADS", "4"))
+
+# 在master中加载一次应用，worker通过fork共享已导入的代码；连接在各worker中按需建立
+preload_app = _bool("GUNICORN_PRELOAD", "true")
+
+# 处理一定数量的请求后重启worker，限制内存增长；jitter避免所有worker同时重启
+max_requests = int(_env("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(_env("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# 反向代理到gunicorn的空闲连接保持时间应小于这里的值，避免复用已被关闭的连接
+keepalive = int(_env("GUNICORN_KEEPALIVE", "5"))
+timeout = int(_env("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(_env("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# worker心跳文件放在内存文件系统中，避免容器的overlay文件系统阻塞worker
+worker_tmp_dir = _env("GUNICORN_WORKER_TMP_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else None)
+
+# 访问日志默认关闭，应用日志由各自的日志配置输出
+accesslog = _env("GUNICORN_ACCESSLOG", None)
+errorlog = "-"
+loglevel = _env("LOG_LEVEL", "info").lower()
+
+
+def on_starting(server):
+    # 清除上一次运行留下的指标文件；目录由master创建，worker只写入自己的文件
+    directory = os.environ.get("METRICS_MULTIPROC_DIR")
+    if directory:
+        from shared_auth.metrics import clear_multiprocess_dir
+
+        os.makedirs(directory, exist_ok=True)
+        clear_multiprocess_dir(directory)
+
+
+def child_exit(server, worker):
+    # 保留退出（轮换）的worker的计数器，计数器不会因max_requests重启worker而减少
+    directory = os.environ.get("METRICS_MULTIPROC_DIR")
+    if directory:
+        from shared_auth.metrics import mark_process_dead
+
+        mark_process_dead(directory, worker.pid)
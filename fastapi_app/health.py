@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class HealthProber:
+    """在后台按固定间隔检查依赖（Redis、数据库），探针接口只读取缓存的结果
+
+    每项检查都有超时，依赖变慢时只影响后台任务，不会拖慢探针请求。
+    结果超过 ``stale_after`` 秒没有刷新（例如后台任务卡住）时视为未就绪。
+    ``optional`` 中的检查（例如只读副本，失败时可以改用主节点）同样报告和导出，但不影响是否就绪。
+    """
+
+    def __init__(self, checks: Dict[str, Callable[[], Awaitable[Any]]], interval: float = 5.0,
+                 timeout: float = 1.0, stale_after: Optional[float] = None, gauge=None,
+                 clock=time.monotonic, optional: Iterable[str] = ()):
+        self.checks = checks
+        self.optional = frozenset(optional)
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after if stale_after is not None else 3 * interval
+        # 带 ``dependency`` 标签的Gauge，检查通过时为1，否则为0
+        self.gauge = gauge
+        self.results: Dict[str, Dict[str, Any]] = {name: {"status": "unknown"} for name in checks}
+        self.checked_at: Optional[float] = None
+        self._clock = clock
+
+    async def _check(self, name: str, check: Callable[[], Awaitable[Any]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), self.timeout)
+        except asyncio.TimeoutError:
+            result = {"status": "error", "error": f"timed out after {self.timeout}s"}
+        except Exception as e:
+            result = {"status": "error", "error": str(e)}
+        else:
+            result = {"status": "ok"}
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        if self.gauge is not None:
+            self.gauge.labels(name).set(1 if result["status"] == "ok" else 0)
+        return result
+
+    async def probe(self) -> None:
+        """并发执行所有检查并更新缓存的结果"""
+        names = list(self.checks)
+        results = await asyncio.gather(*(self._check(name, self.checks[name]) for name in names))
+        for name, result in zip(names, results):
+            if result["status"] != "ok" and self.results[name].get("status") == "ok":
+                logger.warning("Dependency %s became unavailable: %s", name, result["error"])
+        self.results = dict(zip(names, results))
+        self.checked_at = self._clock()
+
+    async def run(self) -> None:
+        """后台任务：立即检查一次，之后每隔 ``interval`` 秒检查一次"""
+        while True:
+            try:
+                await self.probe()
+            except Exception:
+                logger.exception("Health probe failed")
+            await asyncio.sleep(self.interval)
+
+    @property
+    def age(self) -> Optional[float]:
+        return None if self.checked_at is None else self._clock() - self.checked_at
+
+    @property
+    def ready(self) -> bool:
+        age = self.age
+        if age is None or age > self.stale_after:
+            return False
+        return all(result["status"] == "ok" for name, result in self.results.items() if name not in self.optional)
+
+    def report(self) -> Dict[str, Any]:
+        age = self.age
+        return {
+            "status": "ready" if self.ready else "not_ready",
+            "checked_seconds_ago": None if age is None else round(age, 3),
+            "checks": self.results,
+        }
@@ -0,0 +1,143 @@
+"""FastAPI关键路径的指标，由 ``/metrics`` 以Prometheus文本格式导出
+
+带标签的指标在这里绑定好子指标，请求路径上直接使用，不再查找标签。
+"""
+import os
+
+from shared_auth.metrics import Counter, Gauge, Histogram, Registry
+
+registry = Registry()
+
+STAGE_SECONDS = Histogram(
+    "shared_auth_stage_seconds", "Latency of each stage of session and user resolution",
+    ["stage"], registry=registry,
+)
+REDIS_GET = STAGE_SECONDS.labels("redis_get")
+REDIS_MGET = STAGE_SECONDS.labels("redis_mget")
+REDIS_HMGET = STAGE_SECONDS.labels("redis_hmget")
+REDIS_HGETALL = STAGE_SECONDS.labels("redis_hgetall")
+REDIS_READ_REFRESH = STAGE_SECONDS.labels("redis_read_refresh")
+SESSION_DECODE = STAGE_SECONDS.labels("session_decode")
+SIGNED_COOKIE_VERIFY = STAGE_SECONDS.labels("signed_cookie_verify")
+USER_QUERY = STAGE_SECONDS.labels("user_query")
+USER_BATCH_QUERY = STAGE_SECONDS.labels("user_batch_query")
+DATABASE_POOL_ACQUIRE = STAGE_SECONDS.labels("database_pool_acquire")
+
+SESSION_CACHE_REQUESTS = Counter(
+    "shared_auth_session_cache_requests_total", "In-process session cache lookups",
+    ["result"], registry=registry,
+)
+SESSION_CACHE_HIT = SESSION_CACHE_REQUESTS.labels("hit")
+SESSION_CACHE_MISS = SESSION_CACHE_REQUESTS.labels("miss")
+
+SESSION_NOT_FOUND = Counter(
+    "shared_auth_session_not_found_total", "Session keys with no data in the session store",
+    registry=registry,
+)
+SESSION_DECODE_FAILURES = Counter(
+    "shared_auth_session_decode_failures_total",
+    "Sessions that could not be decoded or whose signature was invalid",
+    registry=registry,
+)
+SESSION_STORE_ERRORS = Counter(
+    "shared_auth_session_store_errors_total", "Errors talking to the session store",
+    registry=registry,
+)
+SESSION_REFRESHES = Counter(
+    "shared_auth_session_refreshes_total", "Session expiry extensions sent by sliding expiration",
+    registry=registry,
+)
+SESSION_REPLICA_READS = Counter(
+    "shared_auth_session_replica_reads_total", "Session reads sent to a Redis replica",
+    registry=registry,
+)
+SESSION_REPLICA_FALLBACKS = Counter(
+    "shared_auth_session_replica_fallbacks_total",
+    "Replica session reads retried on the primary: session missing on the replica or replica error",
+    ["reason"], registry=registry,
+)
+SESSION_REPLICA_MISS = SESSION_REPLICA_FALLBACKS.labels("miss")
+SESSION_REPLICA_ERROR = SESSION_REPLICA_FALLBACKS.labels("error")
+SESSION_REPLICA_STALE = Counter(
+    "shared_auth_session_replica_stale_total",
+    "Sessions missing on the replica but found on the primary, i.e. reads that hit replication lag",
+    registry=registry,
+)
+
+USER_SOURCE = Counter(
+    "shared_auth_user_source_total",
+    "Where resolved users came from: the auth_user table or the session fallback",
+    ["source"], registry=registry,
+)
+USER_FROM_DATABASE = USER_SOURCE.labels("database")
+USER_FROM_SESSION = USER_SOURCE.labels("session")
+USER_QUERY_ERRORS = Counter(
+    "shared_auth_user_query_errors_total", "Failed auth_user queries", registry=registry,
+)
+
+NOT_MODIFIED = Counter(
+    "shared_auth_not_modified_total", "Conditional requests answered with 304 Not Modified",
+    ["endpoint"], registry=registry,
+)
+USER_NOT_MODIFIED = NOT_MODIFIED.labels("user")
+SESSION_NOT_MODIFIED = NOT_MODIFIED.labels("session")
+
+DATABASE_POOL_TIMEOUTS = Counter(
+    "shared_auth_database_pool_timeouts_total",
+    "Database connections that could not be acquired within the acquire timeout",
+    registry=registry,
+)
+
+DEPENDENCY_UP = Gauge(
+    "shared_auth_dependency_up", "Result of the last background health check (1 = ok)",
+    ["dependency"], registry=registry,
+)
+
+POOL_CONNECTIONS = Gauge(
+    "shared_auth_pool_connections", "Connection pool usage, sampled at scrape time",
+    ["pool", "state"], registry=registry,
+)
+
+
+def database_pool(database):
+    """返回asyncpg连接池，未连接或不是PostgreSQL时返回None"""
+    # databases的后端把连接池保存在 ``_backend._pool``，SQLite后端的连接池不是asyncpg连接池
+    pool = getattr(getattr(database, "_backend", None), "_pool", None)
+    return pool if hasattr(pool, "get_size") else None
+
+
+def register_database_pool(database) -> None:
+    """导出asyncpg连接池的大小、空闲、下限和上限"""
+    def sample(method):
+        def read():
+            pool = database_pool(database)
+            return getattr(pool, method)() if pool is not None else None
+        return read
+
+    POOL_CONNECTIONS.labels("database", "size").set_function(sample("get_size"))
+    POOL_CONNECTIONS.labels("database", "idle").set_function(sample("get_idle_size"))
+    POOL_CONNECTIONS.labels("database", "min").set_function(sample("get_min_size"))
+    POOL_CONNECTIONS.labels("database", "max").set_function(sample("get_max_size"))
+
+
+def register_redis_pool(get_client) -> None:
+    """导出redis-py连接池中使用中和空闲的连接数，``get_client`` 返回当前的客户端"""
+    def sample(read):
+        def sampled():
+            client = get_client()
+            pool = getattr(client, "connection_pool", None)
+            return read(pool) if pool is not None else None
+        return sampled
+
+    POOL_CONNECTIONS.labels("redis", "in_use").set_function(
+        sample(lambda pool: len(pool._in_use_connections))
+    )
+    POOL_CONNECTIONS.labels("redis", "idle").set_function(
+        sample(lambda pool: len(pool._available_connections))
+    )
+    POOL_CONNECTIONS.labels("redis", "max").set_function(sample(lambda pool: pool.max_connections))
+
+
+# gunicorn运行多个worker时汇总所有worker的指标（目录由docker/gunicorn.conf.py设置）
+if os.environ.get("METRICS_MULTIPROC_DIR"):
+    registry.enable_multiprocess(os.environ["METRICS_MULTIPROC_DIR"], "fastapi")
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCache:
+    """进程内的session缓存，按LRU淘汰并在TTL后过期
+
+    ``epoch`` 在每次失效时递增。调用方在读取Redis之前记录 ``epoch``，
+    写入缓存时带上该值；如果期间发生过失效，写入会被丢弃，
+    避免把登出前读到的旧数据重新放回缓存。
+
+    合并部署（combined/asgi.py）时Django在线程池中读写同一个缓存，因此用锁保护。
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 30.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.epoch = 0
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, epoch: Optional[int] = None,
+            ttl: Optional[float] = None) -> None:
+        if not self.enabled or (epoch is not None and epoch != self.epoch):
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            self._entries[key] = (value, self._clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self.epoch += 1
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.epoch += 1
+            self._entries.clear()
+
+
+async def listen_for_invalidations(redis_client, channel: str, cache: SessionCache,
+                                   retry_interval: float = 1.0) -> None:
+    """订阅Django发布的session失效消息，收到后立即从缓存中移除对应的session
+
+    订阅断开期间可能错过消息，因此每次（重新）订阅成功后都会清空缓存。
+    """
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(channel)
+            cache.clear()
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                session_key = message["data"]
+                if isinstance(session_key, bytes):
+                    session_key = session_key.decode()
+                cache.invalidate(session_key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Session invalidation listener disconnected: %s", e)
+            cache.clear()
+            await asyncio.sleep(retry_interval)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
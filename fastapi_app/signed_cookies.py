@@ -0,0 +1,108 @@
+"""在FastAPI中本地校验Django ``signed_cookies`` session后端生成的cookie
+
+与 ``django.core.signing.TimestampSigner`` 的格式保持一致（HMAC-SHA256，
+salt为 ``django.contrib.sessions.backends.signed_cookies``，可选zlib压缩），
+不依赖Django，也不需要访问Redis。
+"""
+import base64
+import hashlib
+import hmac
+import time
+import zlib
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+from shared_auth import codec
+
+SIGNED_COOKIES_SALT = "django.contrib.sessions.backends.signed_cookies"
+BASE62_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+class BadSignature(Exception):
+    """签名无效"""
+
+
+class SignatureExpired(BadSignature):
+    """签名有效但已超过max_age"""
+
+
+def b62_decode(s: str) -> int:
+    if s == "0":
+        return 0
+    sign = 1
+    if s[0] == "-":
+        s = s[1:]
+        sign = -1
+    decoded = 0
+    for digit in s:
+        decoded = decoded * 62 + BASE62_ALPHABET.index(digit)
+    return sign * decoded
+
+
+def b64_decode(s: bytes) -> bytes:
+    pad = b"=" * (-len(s) % 4)
+    return base64.urlsafe_b64decode(s + pad)
+
+
+class SignedCookieVerifier:
+    """校验并解码Django签名的session cookie
+
+    ``secret_key`` 和 ``fallback_keys`` 对应Django的 ``SECRET_KEY`` 和
+    ``SECRET_KEY_FALLBACKS``，轮换密钥期间用旧密钥签名的cookie仍然有效。
+    """
+
+    def __init__(self, secret_key: str, fallback_keys: Iterable[str] = (),
+                 salt: str = SIGNED_COOKIES_SALT, max_age: Optional[float] = None,
+                 sep: str = ":", loads: Callable[[bytes], Any] = None, clock=time.time):
+        self.sep = sep
+        self.max_age = max_age
+        self._loads = loads or (lambda data: codec.loads(data, allow_pickle=False))
+        self._clock = clock
+        # 预先计算每个密钥派生出的HMAC对象，校验时只需copy
+        key_salt = (salt + "signer").encode()
+        self._hmacs = [
+            hmac.new(hashlib.sha256(key_salt + key.encode()).digest(), digestmod=hashlib.sha256)
+            for key in [secret_key, *fallback_keys]
+        ]
+
+    def _signature(self, base_hmac, value: bytes) -> bytes:
+        mac = base_hmac.copy()
+        mac.update(value)
+        return base64.urlsafe_b64encode(mac.digest()).strip(b"=")
+
+    def unsign(self, signed_value: str) -> Tuple[str, int]:
+        """校验签名，返回（数据, 签名时间戳）"""
+        if self.sep not in signed_value:
+            raise BadSignature(f'No "{self.sep}" found in value')
+        value, sig = signed_value.rsplit(self.sep, 1)
+        value_bytes, sig_bytes = value.encode(), sig.encode()
+        for base_hmac in self._hmacs:
+            if hmac.compare_digest(sig_bytes, self._signature(base_hmac, value_bytes)):
+                break
+        else:
+            raise BadSignature(f'Signature "{sig}" does not match')
+        try:
+            payload, timestamp = value.rsplit(self.sep, 1)
+            return payload, b62_decode(timestamp)
+        except (ValueError, IndexError):
+            raise BadSignature("Invalid timestamp")
+
+    def loads(self, signed_value: str) -> Tuple[Any, Optional[float]]:
+        """校验并解码cookie，返回（session数据, 剩余有效秒数）"""
+        payload, timestamp = self.unsign(signed_value)
+        remaining = None
+        if self.max_age is not None:
+            remaining = self.max_age - (self._clock() - timestamp)
+            if remaining <= 0:
+                raise SignatureExpired(f"Signature age exceeds {self.max_age} seconds")
+
+        data = payload.encode()
+        decompress = data[:1] == b"."
+        if decompress:
+            data = data[1:]
+        try:
+            data = b64_decode(data)
+            if decompress:
+                data = zlib.decompress(data)
+            return self._loads(data), remaining
+        except Exception as e:
+            raise BadSignature(f"Malformed payload: {e}") from e
@@ -0,0 +1,38 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    """合并并发的相同查询：同一个key同一时间只有一个查询在执行
+
+    查询完成前到达的调用方等待同一个任务并得到相同的结果（或异常）；
+    查询完成后key立即移除，之后的调用会重新查询，因此不会引入额外的过期数据。
+
+    ``epoch`` 返回缓存当前的失效计数（:attr:`SessionCache.epoch`）。查询开始后发生过失效时，
+    之后到达的调用方不再等待这个可能读到失效前数据的查询，而是开始一个新的查询。
+    """
+
+    def __init__(self, epoch: Optional[Callable[[], int]] = None):
+        self._epoch = epoch
+        # key -> (任务, 开始时的epoch)
+        self._calls: Dict[Hashable, Tuple[asyncio.Task, Optional[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        epoch = self._epoch() if self._epoch is not None else None
+        call = self._calls.get(key)
+        if call is None or call[1] != epoch:
+            task = asyncio.ensure_future(fn(*args))
+            self._calls[key] = (task, epoch)
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            task = call[0]
+        # 某个调用方被取消时不影响其他仍在等待的调用方
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
@@ -1,13 +1,48 @@
+import asyncio
 import pytest
-import base64
 import pickle
+from datetime import datetime, timedelta, timezone
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock, AsyncMock
 
+import main
 from main import app, get_django_session_data
+import fakeredis
+import fakeredis.aioredis
+
+from shared_auth import codec, session_hash
+from health import HealthProber
+from session_cache import SessionCache
+from signed_cookies import BadSignature, SignatureExpired, SignedCookieVerifier
+from singleflight import SingleFlight
 
 
 client = TestClient(app)
+# 批量校验接口的内部服务令牌
+SERVICE_HEADERS = {"X-Service-Token": "test-service-token"}
+
+
+@pytest.fixture(autouse=True)
+def service_token():
+    with patch('main.session_validate_token', SERVICE_HEADERS["X-Service-Token"]):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clear_session_cache():
+    """每个测试前清空进程内session缓存"""
+    main.session_cache.clear()
+    yield
+    main.session_cache.clear()
+
+
+def mock_redis(raw_value=None):
+    """构造异步Redis客户端的mock，GET返回给定的原始数据"""
+    redis_mock = MagicMock()
+    redis_mock.get = AsyncMock(return_value=raw_value)
+    redis_mock.mget = AsyncMock(return_value=[])
+    redis_mock.ping = AsyncMock(return_value=True)
+    return redis_mock
 
 
 def test_root():
@@ -19,11 +54,8 @@ def test_root():
 
 def test_health_check():
     """测试健康检查"""
-    with patch('main.redis_client') as mock_redis, \
+    with patch('main.redis_client', mock_redis()), \
          patch('main.database') as mock_db:
-        # 模拟 Redis ping 方法
-        mock_redis.ping.return_value = True
-        
         # 模拟数据库异步方法
         mock_db.fetch_one = AsyncMock(return_value=[1])
         
@@ -47,12 +79,11 @@ def test_get_user_authenticated():
         '_auth_user_email': 'test@example.com'
     }
     
-    # 序列化并编码session数据
+    # Django的cache后端直接存储pickle序列化的数据
     pickled = pickle.dumps(session_data)
-    encoded = base64.b64encode(pickled)
     
     # 模拟Redis返回session数据
-    with patch('main.redis_client.get', return_value=encoded), \
+    with patch('main.redis_client', mock_redis(pickled)), \
          patch('main.database.fetch_one', return_value={"id": 1, "username": "testuser", "email": "test@example.com"}):
         
         response = client.get("/api/user", cookies={
@@ -65,7 +96,8 @@ def test_get_user_authenticated():
         assert data["email"] == "test@example.com"
 
 
-def test_get_django_session_data():
+@pytest.mark.asyncio
+async def test_get_django_session_data():
     """测试解析Django session数据"""
     # 创建模拟session数据
     session_data = {
@@ -74,13 +106,9 @@ def test_get_django_session_data():
         '_auth_user_email': 'test@example.com'
     }
     
-    # 序列化并编码session数据
-    pickled = pickle.dumps(session_data)
-    encoded = base64.b64encode(pickled)
-    
-    # 模拟Redis返回session数据
-    with patch('main.redis_client.get', return_value=encoded):
-        result = get_django_session_data("fake_session_id")
+    # 模拟Redis返回共享格式编码的session数据
+    with patch('main.redis_client', mock_redis(codec.dumps(session_data))):
+        result = await get_django_session_data("fake_session_id")
         
         assert result is not None
         assert result['_auth_user_id'] == '1'
@@ -97,12 +125,11 @@ def test_get_session():
         '_auth_user_email': 'test@example.com'
     }
     
-    # 序列化并编码session数据
+    # Django的cache后端直接存储pickle序列化的数据
     pickled = pickle.dumps(session_data)
-    encoded = base64.b64encode(pickled)
     
     # 模拟Redis返回session数据
-    with patch('main.redis_client.get', return_value=encoded):
+    with patch('main.redis_client', mock_redis(pickled)):
         response = client.get("/api/session", cookies={
             "shared_session_id": "fake_session_id"
         })
@@ -113,3 +140,739 @@ def test_get_session():
         assert "session_data" in data
         assert data["session_data"]["_auth_user_id"] == '1'
 
+
+@pytest.mark.asyncio
+async def test_get_django_session_data_missing():
+    """测试session不存在时返回None"""
+    with patch('main.redis_client', mock_redis(None)):
+        assert await get_django_session_data("missing_session_id") is None
+
+
+@pytest.mark.asyncio
+async def test_session_cache_avoids_redis_round_trip():
+    """测试重复读取同一session时只访问一次Redis"""
+    redis_mock = mock_redis(pickle.dumps({'_auth_user_id': '1'}))
+    with patch('main.redis_client', redis_mock):
+        await get_django_session_data("cached_session_id")
+        result = await get_django_session_data("cached_session_id")
+
+    assert result['_auth_user_id'] == '1'
+    assert redis_mock.get.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_session_cache_invalidation():
+    """测试收到失效消息后重新从Redis读取session"""
+    redis_mock = mock_redis(pickle.dumps({'_auth_user_id': '1'}))
+    with patch('main.redis_client', redis_mock):
+        await get_django_session_data("cached_session_id")
+        main.session_cache.invalidate("cached_session_id")
+        redis_mock.get.return_value = None
+        result = await get_django_session_data("cached_session_id")
+
+    assert result is None
+    assert redis_mock.get.await_count == 2
+
+
+def test_session_cache_lru_and_ttl():
+    """测试缓存的容量淘汰、过期以及失效期间的写入丢弃"""
+    now = [0.0]
+    cache = SessionCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    now[0] = 11
+    assert cache.get("a") is None
+
+    epoch = cache.epoch
+    cache.invalidate("c")
+    cache.set("c", 3, epoch)
+    assert cache.get("c") is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_session_lookups_are_coalesced():
+    """测试并发读取同一session时只发出一次Redis GET"""
+    release = asyncio.Event()
+
+    async def slow_get(key):
+        await release.wait()
+        return pickle.dumps({'_auth_user_id': '1'})
+
+    redis_mock = mock_redis()
+    redis_mock.get = AsyncMock(side_effect=slow_get)
+    with patch('main.redis_client', redis_mock), \
+         patch.object(main.session_cache, 'ttl', 0):
+        lookups = [asyncio.ensure_future(get_django_session_data("burst_session_id")) for _ in range(10)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*lookups)
+
+    assert all(result['_auth_user_id'] == '1' for result in results)
+    assert redis_mock.get.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_singleflight_propagates_errors_and_forgets_key():
+    """测试查询失败时所有等待方都收到异常，且之后会重新查询"""
+    flights = SingleFlight()
+    calls = []
+
+    async def failing(key):
+        calls.append(key)
+        await asyncio.sleep(0)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(
+        flights.do("k", failing, "k"), flights.do("k", failing, "k"), return_exceptions=True
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert calls == ["k"]
+    assert len(flights) == 0
+
+    with pytest.raises(RuntimeError):
+        await flights.do("k", failing, "k")
+    assert calls == ["k", "k"]
+
+
+@pytest.mark.asyncio
+async def test_singleflight_restarts_after_invalidation():
+    """测试查询开始后发生失效时，之后的调用方开始新的查询而不是等待旧的结果"""
+    cache = SessionCache()
+    flights = SingleFlight(lambda: cache.epoch)
+    release = asyncio.Event()
+    values = iter(["before", "after"])
+
+    async def load():
+        value = next(values)
+        await release.wait()
+        return value
+
+    first = asyncio.ensure_future(flights.do("k", load))
+    joined = asyncio.ensure_future(flights.do("k", load))
+    await asyncio.sleep(0)
+    cache.invalidate("k")
+    restarted = asyncio.ensure_future(flights.do("k", load))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(first, joined, restarted) == ["before", "before", "after"]
+    assert len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_get_django_session_data_legacy_pickle():
+    """测试仍能读取改用共享编码之前写入的pickle session"""
+    with patch('main.redis_client', mock_redis(pickle.dumps({'_auth_user_id': '1'}))):
+        result = await get_django_session_data("legacy_session_id")
+
+    assert result['_auth_user_id'] == '1'
+
+
+def django_signed_cookie(session_data, key, timestamp=None):
+    """使用Django的signing模块生成signed_cookies后端的session cookie"""
+    signing = pytest.importorskip("django.core.signing")
+    signer = signing.TimestampSigner(
+        key=key, salt="django.contrib.sessions.backends.signed_cookies", fallback_keys=[]
+    )
+    if timestamp is not None:
+        signer.timestamp = lambda: signing.b62_encode(timestamp)
+    return signer.sign_object(session_data, serializer=codec.SessionSerializer, compress=True)
+
+
+def test_signed_cookie_verifier_accepts_django_cookie():
+    """测试校验Django生成的签名cookie（包括压缩数据和旧密钥）"""
+    session_data = {'_auth_user_id': '1', 'padding': 'x' * 500}
+    verifier = SignedCookieVerifier("new-secret", fallback_keys=["old-secret"], max_age=60)
+
+    data, remaining = verifier.loads(django_signed_cookie(session_data, "new-secret"))
+    assert data == session_data
+    assert 0 < remaining <= 60
+
+    data, _ = verifier.loads(django_signed_cookie(session_data, "old-secret"))
+    assert data == session_data
+
+
+def test_signed_cookie_verifier_rejects_invalid_cookies():
+    """测试拒绝篡改、未知密钥和过期的cookie"""
+    verifier = SignedCookieVerifier("secret", max_age=60)
+    cookie = django_signed_cookie({'_auth_user_id': '1'}, "secret")
+
+    with pytest.raises(BadSignature):
+        verifier.loads(cookie[:-1] + ("A" if cookie[-1] != "A" else "B"))
+    with pytest.raises(BadSignature):
+        verifier.loads(django_signed_cookie({'_auth_user_id': '1'}, "other-secret"))
+    with pytest.raises(SignatureExpired):
+        verifier.loads(django_signed_cookie({'_auth_user_id': '1'}, "secret", timestamp=0))
+
+
+@pytest.mark.asyncio
+async def test_signed_cookie_session_mode():
+    """测试signed_cookies模式下不访问Redis，且重复请求命中缓存"""
+    verifier = SignedCookieVerifier("secret", max_age=60)
+    cookie = django_signed_cookie({'_auth_user_id': '1'}, "secret")
+    redis_mock = mock_redis()
+
+    with patch('main.signed_cookie_verifier', verifier), \
+         patch('main.redis_client', redis_mock), \
+         patch.object(verifier, 'loads', wraps=verifier.loads) as loads:
+        first = await get_django_session_data(cookie)
+        second = await get_django_session_data(cookie)
+
+    assert first == second == {'_auth_user_id': '1'}
+    assert loads.call_count == 1
+    redis_mock.get.assert_not_called()
+
+
+def test_validate_sessions_batch():
+    """测试批量校验session：一次MGET、一次用户查询，无效session返回null"""
+    redis_mock = mock_redis()
+    redis_mock.mget.return_value = [
+        codec.dumps({'_auth_user_id': '1'}),
+        None,
+        codec.dumps({'_auth_user_id': '2', '_auth_user_username': 'ghost', '_auth_user_email': 'ghost@example.com'}),
+        b'corrupted',
+    ]
+    user_rows = [{"id": 1, "username": "testuser", "email": "test@example.com"}]
+
+    with patch('main.redis_client', redis_mock), \
+         patch('main.database.fetch_all', return_value=user_rows) as fetch_all:
+        response = client.post("/api/sessions/validate", headers=SERVICE_HEADERS, json={
+            "session_ids": ["s1", "missing", "s2", "bad", "s1"]
+        })
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results["s1"]["username"] == "testuser"
+    assert results["s1"]["auth_backend"] == "django"
+    assert results["missing"] is None
+    assert results["s2"]["auth_backend"] == "django_session"
+    assert results["bad"] is None
+
+    redis_mock.mget.assert_awaited_once()
+    assert len(redis_mock.mget.await_args.args[0]) == 4
+    fetch_all.assert_awaited_once()
+    assert "ANY" in fetch_all.await_args.kwargs["query"]
+    assert fetch_all.await_args.kwargs["values"] == {"user_ids": [1, 2]}
+
+
+def fake_redis_pair():
+    """返回共用同一个fakeredis服务器的（同步客户端, 异步客户端）"""
+    server = fakeredis.FakeServer()
+    return fakeredis.FakeRedis(server=server), fakeredis.aioredis.FakeRedis(server=server)
+
+
+def save_hash_session(redis, session_key, session_data):
+    """按Django的hash布局保存session"""
+    args = session_hash.save_args(session_data, must_create=True, expiry_ms=60000)
+    redis.eval(session_hash.SAVE_SCRIPT, 1, f"{main.session_prefix}{session_key}", *args)
+
+
+@pytest.mark.asyncio
+async def test_hash_layout_reads_only_auth_fields():
+    """测试hash布局下解析用户只用HMGET读取认证字段，完整读取时不使用部分字段的缓存"""
+    sync_redis, redis = fake_redis_pair()
+    session_data = {
+        '_auth_user_id': '1',
+        '_auth_user_username': 'testuser',
+        '_messages': ['x' * 10000],
+    }
+    save_hash_session(sync_redis, "hashed", session_data)
+    sync_redis.set(f"{main.session_prefix}legacy", codec.dumps({'_auth_user_id': '2'}))
+    hmgets = main.metrics.REDIS_HMGET.count
+
+    with patch('main.redis_client', redis), patch('main.session_storage_layout', "hash"):
+        partial = await get_django_session_data("hashed", main.AUTH_SESSION_FIELDS)
+        cached = await get_django_session_data("hashed", main.AUTH_SESSION_FIELDS)
+        full = await get_django_session_data("hashed")
+        legacy = await get_django_session_data("legacy", main.AUTH_SESSION_FIELDS)
+        missing = await get_django_session_data("missing", main.AUTH_SESSION_FIELDS)
+
+    assert partial == {'_auth_user_id': '1', '_auth_user_username': 'testuser'}
+    assert cached is partial
+    # hashed、legacy（WRONGTYPE后改用GET）和missing各一次，第二次读取hashed命中缓存
+    assert main.metrics.REDIS_HMGET.count - hmgets == 3
+    assert full == session_data
+    assert main.session_cache.get("hashed") is full
+    assert legacy == {'_auth_user_id': '2'}
+    assert missing is None
+
+
+def test_validate_sessions_hash_layout():
+    """测试hash布局下批量校验session用一个pipeline读取，按旧布局保存的session用MGET读取"""
+    sync_redis, redis = fake_redis_pair()
+    save_hash_session(sync_redis, "s1", {'_auth_user_id': '1', '_messages': ['hello']})
+    save_hash_session(sync_redis, "empty", {})
+    sync_redis.set(f"{main.session_prefix}legacy", codec.dumps({
+        '_auth_user_id': '2', '_auth_user_username': 'ghost', '_auth_user_email': 'ghost@example.com',
+    }))
+    user_rows = [{"id": 1, "username": "testuser", "email": "test@example.com"}]
+
+    with patch('main.redis_client', redis), patch('main.session_storage_layout', "hash"), \
+         patch('main.database.fetch_all', return_value=user_rows):
+        response = client.post("/api/sessions/validate", headers=SERVICE_HEADERS, json={
+            "session_ids": ["s1", "empty", "legacy", "missing"]
+        })
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results["s1"]["username"] == "testuser"
+    assert results["empty"] is None
+    assert results["legacy"]["auth_backend"] == "django_session"
+    assert results["missing"] is None
+    assert main.session_cache.get("s1") == {'_auth_user_id': '1'}
+
+
+def sharded_redis(*nodes):
+    """每个节点一个fakeredis服务器，返回（哈希环, {节点: 同步客户端}, {节点: 异步客户端}）"""
+    servers = {node: fakeredis.FakeServer() for node in nodes}
+    return (
+        main.sharding.HashRing(nodes),
+        {node: fakeredis.FakeRedis(server=server) for node, server in servers.items()},
+        {node: fakeredis.aioredis.FakeRedis(server=server) for node, server in servers.items()},
+    )
+
+
+def test_validate_sessions_sharded():
+    """测试session分片时每个节点一次MGET，各session从哈希环选择的节点读取"""
+    ring, sync_clients, clients = sharded_redis("redis://shard-a:6379/0", "redis://shard-b:6379/0")
+    session_keys = [f"s{index}" for index in range(20)]
+    for index, session_key in enumerate(session_keys):
+        key = f"{main.session_prefix}{session_key}"
+        sync_clients[ring.node_for(key)].set(key, codec.dumps({
+            '_auth_user_id': str(index), '_auth_user_username': f'user{index}', '_auth_user_email': '',
+        }))
+    mgets = main.metrics.REDIS_MGET.count
+
+    with patch('main.session_ring', ring), patch('main.session_redis_clients', clients), \
+         patch('main.database.fetch_all', return_value=[]):
+        response = client.post("/api/sessions/validate", headers=SERVICE_HEADERS, json={"session_ids": [*session_keys, "missing"]})
+
+    results = response.json()["results"]
+    assert [results[key]["username"] for key in session_keys] == [f"user{index}" for index in range(20)]
+    assert results["missing"] is None
+    assert main.metrics.REDIS_MGET.count - mgets == 2
+
+
+@pytest.mark.asyncio
+async def test_sharded_session_refresh_uses_ring_node():
+    """测试session分片时读取和延长有效期都访问session所在的节点"""
+    ring, sync_clients, clients = sharded_redis("redis://shard-a:6379/0", "redis://shard-b:6379/0")
+    key = f"{main.session_prefix}abc"
+    node = ring.node_for(key)
+    sync_clients[node].set(key, codec.dumps({'_auth_user_id': '1'}), px=1000)
+
+    with patch('main.session_ring', ring), patch('main.session_redis_clients', clients):
+        session_data = await get_django_session_data("abc", refresh=True)
+
+    assert session_data == {'_auth_user_id': '1'}
+    assert sync_clients[node].pttl(key) > 1000
+    assert all(not redis.exists(key) for other, redis in sync_clients.items() if other != node)
+
+
+@pytest.mark.asyncio
+async def test_replica_miss_falls_back_to_primary():
+    """测试从副本读取session，副本上没有的session（复制延迟）改为从主节点读取并计数"""
+    sync_primary, primary = fake_redis_pair()
+    sync_replica, replica = fake_redis_pair()
+    sync_primary.set(f"{main.session_prefix}old", codec.dumps({'_auth_user_id': '1'}))
+    sync_replica.set(f"{main.session_prefix}old", codec.dumps({'_auth_user_id': '1', 'source': 'replica'}))
+    sync_primary.set(f"{main.session_prefix}fresh", codec.dumps({'_auth_user_id': '2'}))
+    reads, misses, stale = (main.metrics.SESSION_REPLICA_READS.value, main.metrics.SESSION_REPLICA_MISS.value,
+                            main.metrics.SESSION_REPLICA_STALE.value)
+
+    with patch('main.redis_client', primary), patch('main.redis_replica_clients', [replica]):
+        old = await get_django_session_data("old")
+        fresh = await get_django_session_data("fresh")
+        missing = await get_django_session_data("missing")
+
+    assert old == {'_auth_user_id': '1', 'source': 'replica'}
+    assert fresh == {'_auth_user_id': '2'}
+    assert missing is None
+    assert main.metrics.SESSION_REPLICA_READS.value - reads == 3
+    assert main.metrics.SESSION_REPLICA_MISS.value - misses == 2
+    assert main.metrics.SESSION_REPLICA_STALE.value - stale == 1
+
+
+@pytest.mark.asyncio
+async def test_replica_error_and_refresh_use_primary():
+    """测试副本出错时从主节点读取，需要延长有效期的读取直接在主节点上执行"""
+    sync_primary, primary = fake_redis_pair()
+    sync_primary.set(f"{main.session_prefix}abc", codec.dumps({'_auth_user_id': '1'}), px=1000)
+    replica = mock_redis()
+    replica.get = AsyncMock(side_effect=ConnectionError("replica down"))
+    errors, reads = main.metrics.SESSION_REPLICA_ERROR.value, main.metrics.SESSION_REPLICA_READS.value
+
+    with patch('main.redis_client', primary), patch('main.redis_replica_clients', [replica]):
+        assert await get_django_session_data("abc") == {'_auth_user_id': '1'}
+        main.session_cache.clear()
+        assert await get_django_session_data("abc", refresh=True) == {'_auth_user_id': '1'}
+
+    assert main.metrics.SESSION_REPLICA_ERROR.value - errors == 1
+    assert main.metrics.SESSION_REPLICA_READS.value - reads == 1
+    assert replica.get.await_count == 1
+    assert sync_primary.pttl(f"{main.session_prefix}abc") > 1000
+
+
+@pytest.mark.asyncio
+async def test_batch_read_uses_replica():
+    """测试批量读取先在副本上MGET，副本上没有的session再用一次MGET从主节点读取"""
+    sync_primary, primary = fake_redis_pair()
+    sync_replica, replica = fake_redis_pair()
+    for redis in (sync_primary, sync_replica):
+        redis.set(f"{main.session_prefix}old", codec.dumps({'_auth_user_id': '1'}))
+    sync_primary.set(f"{main.session_prefix}fresh", codec.dumps({'_auth_user_id': '2'}))
+    reads, misses, stale = (main.metrics.SESSION_REPLICA_READS.value, main.metrics.SESSION_REPLICA_MISS.value,
+                            main.metrics.SESSION_REPLICA_STALE.value)
+
+    with patch('main.redis_client', primary), patch('main.redis_replica_clients', [replica]), \
+         patch.object(primary, 'mget', wraps=primary.mget) as primary_mget:
+        sessions = await main.get_django_sessions(["old", "fresh", "missing"])
+
+    assert sessions == {"old": {'_auth_user_id': '1'}, "fresh": {'_auth_user_id': '2'}, "missing": None}
+    primary_mget.assert_called_once_with([f"{main.session_prefix}fresh", f"{main.session_prefix}missing"])
+    assert main.metrics.SESSION_REPLICA_READS.value - reads == 1
+    assert main.metrics.SESSION_REPLICA_MISS.value - misses == 1
+    assert main.metrics.SESSION_REPLICA_STALE.value - stale == 1
+
+
+def test_validate_sessions_requires_service_token():
+    """测试没有或使用错误的内部服务令牌、以及未配置令牌时批量校验接口返回403，不读取Redis"""
+    redis_mock = mock_redis()
+    with patch('main.redis_client', redis_mock):
+        for headers in ({}, {"X-Service-Token": "wrong"}):
+            response = client.post("/api/sessions/validate", headers=headers, json={"session_ids": ["s1"]})
+            assert response.status_code == 403
+        with patch('main.session_validate_token', ""):
+            response = client.post("/api/sessions/validate", headers={"X-Service-Token": ""}, json={"session_ids": ["s1"]})
+            assert response.status_code == 403
+    redis_mock.mget.assert_not_called()
+
+
+def test_validate_sessions_rejects_oversized_batch():
+    """测试超过批量上限时返回400"""
+    with patch('main.session_validate_max_batch', 2):
+        response = client.post("/api/sessions/validate", headers=SERVICE_HEADERS, json={"session_ids": ["a", "b", "c"]})
+    assert response.status_code == 400
+
+
+def test_metrics_endpoint_records_stages():
+    """测试/metrics导出各阶段耗时和计数"""
+    session_data = {'_auth_user_id': '1'}
+    user_row = {"id": 1, "username": "testuser", "email": "test@example.com"}
+    redis_gets = main.metrics.REDIS_GET.count
+    cache_hits = main.metrics.SESSION_CACHE_HIT.value
+    not_found = main.metrics.SESSION_NOT_FOUND.value
+
+    with patch('main.redis_client', mock_redis(codec.dumps(session_data))), \
+         patch('main.database.fetch_one', AsyncMock(return_value=user_row)):
+        assert client.get("/api/user", cookies={"shared_session_id": "metrics_key"}).status_code == 200
+        assert client.get("/api/user", cookies={"shared_session_id": "metrics_key"}).status_code == 200
+    with patch('main.redis_client', mock_redis(None)):
+        assert client.get("/api/user", cookies={"shared_session_id": "missing_key"}).status_code == 401
+
+    assert main.metrics.REDIS_GET.count == redis_gets + 2
+    assert main.metrics.SESSION_CACHE_HIT.value == cache_hits + 1
+    assert main.metrics.SESSION_NOT_FOUND.value == not_found + 1
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert '# TYPE shared_auth_stage_seconds histogram' in response.text
+    assert 'shared_auth_stage_seconds_bucket{stage="redis_get",le="+Inf"}' in response.text
+    assert 'shared_auth_session_cache_requests_total{result="hit"}' in response.text
+
+
+def test_user_conditional_get():
+    """测试/api/user的ETag：由用户行计算，不读取版本戳；用户未修改时返回304，修改后ETag变化"""
+    session_data = {'_auth_user_id': '1'}
+    redis_mock = mock_redis(codec.dumps(session_data))
+    row = {"id": 1, "username": "testuser", "email": "test@example.com"}
+    fetch_one = AsyncMock(return_value=row)
+    cookies = {"shared_session_id": "etag_key"}
+
+    with patch('main.redis_client', redis_mock), patch('main.database.fetch_one', fetch_one):
+        response = client.get("/api/user", cookies=cookies)
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "private, no-cache"
+        etag = response.headers["etag"]
+        assert etag.startswith('W/"')
+
+        response = client.get("/api/user", cookies=cookies, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+        fetch_one.return_value = {**row, "email": "changed@example.com"}
+        response = client.get("/api/user", cookies=cookies, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert response.json()["email"] == "changed@example.com"
+
+    # session读取之外没有其他Redis命令
+    assert redis_mock.get.await_count == 1
+
+
+def test_session_conditional_get():
+    """测试/api/session的ETag随session数据变化"""
+    session_data = {'_auth_user_id': '1', 'visits': 1}
+    cookies = {"shared_session_id": "etag_session_key"}
+
+    with patch('main.redis_client', mock_redis(codec.dumps(session_data))):
+        etag = client.get("/api/session", cookies=cookies).headers["etag"]
+        response = client.get("/api/session", cookies=cookies, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    main.session_cache.clear()
+    with patch('main.redis_client', mock_redis(codec.dumps({**session_data, 'visits': 2}))):
+        response = client.get("/api/session", cookies=cookies, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["session_data"]["visits"] == 2
+
+
+def test_sliding_expiration_is_throttled():
+    """测试滑动过期：读取时在同一个脚本中延长有效期并重新设置cookie，每个间隔最多延长一次"""
+    server = fakeredis.FakeServer()
+    sync_redis = fakeredis.FakeRedis(server=server)
+    key = f"{main.session_prefix}sliding"
+    sync_redis.set(key, codec.dumps({'_auth_user_id': '1'}), px=10000)
+    cookies = {"shared_session_id": "sliding"}
+    refreshes = main.metrics.SESSION_REFRESHES.value
+
+    def get_session():
+        # 每个请求在新的事件循环中执行，使用新的异步客户端
+        with patch('main.redis_client', fakeredis.aioredis.FakeRedis(server=server)):
+            return client.get("/api/session", cookies=cookies)
+
+    with patch('main.session_refresh_interval', 300), \
+         patch('main.session_refreshes', SessionCache(maxsize=100, ttl=300)) as session_refreshes:
+        response = get_session()
+        assert f"Max-Age={main.session_cookie_age}" in response.headers["set-cookie"]
+        assert sync_redis.pttl(key) > 10000
+
+        sync_redis.pexpire(key, 10000)
+        response = get_session()
+        assert "set-cookie" not in response.headers
+        assert sync_redis.pttl(key) <= 10000
+
+        # 间隔过后，命中进程内缓存时单独延长一次
+        session_refreshes.clear()
+        response = get_session()
+        assert "set-cookie" in response.headers
+        assert sync_redis.pttl(key) > 10000
+    assert main.metrics.SESSION_REFRESHES.value - refreshes == 2
+
+
+@pytest.mark.asyncio
+async def test_sliding_expiration_follows_set_expiry():
+    """测试滑动过期使用session中set_expiry设置的秒数，固定的过期时间不被延长"""
+    sync_redis, redis = fake_redis_pair()
+    sync_redis.set(f"{main.session_prefix}custom", codec.dumps({'_session_expiry': 600}), px=10000)
+    sync_redis.set(f"{main.session_prefix}fixed", codec.dumps({'_session_expiry': '2000-01-01T00:00:00+00:00'}),
+                   px=10000)
+
+    with patch('main.redis_client', redis), patch.object(redis, 'pexpire', wraps=redis.pexpire) as pexpire:
+        custom = await get_django_session_data("custom", refresh=True)
+        fixed = await get_django_session_data("fixed", refresh=True)
+
+    assert custom and fixed
+    pexpire.assert_called_once_with(f"{main.session_prefix}custom", 600000)
+    assert 10000 < sync_redis.pttl(f"{main.session_prefix}custom") <= 600000
+    # 过期时间已经过去，恢复后key被删除
+    assert not sync_redis.exists(f"{main.session_prefix}fixed")
+    response = main.Response()
+    main.set_session_cookie(response, "custom", custom)
+    assert "Max-Age=600" in response.headers["set-cookie"]
+    response = main.Response()
+    main.set_session_cookie(response, "fixed", fixed)
+    assert "set-cookie" not in response.headers
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("layout", ["blob", "hash"])
+async def test_sliding_expiration_reads_and_refreshes_in_one_command(layout):
+    """测试需要延长有效期的读取只向Redis发送一条命令（EVALSHA）"""
+    sync_redis, redis = fake_redis_pair()
+    key = f"{main.session_prefix}abc"
+    if layout == "hash":
+        save_hash_session(sync_redis, "abc", {'_auth_user_id': '1'})
+    else:
+        sync_redis.set(key, codec.dumps({'_auth_user_id': '1'}))
+    sync_redis.pexpire(key, 10000)
+    sync_redis.script_load(main.READ_REFRESH_SCRIPT)
+    refreshes = main.metrics.SESSION_REFRESHES.value
+
+    with patch('main.redis_client', redis), patch('main.session_storage_layout', layout), \
+         patch.object(redis, 'execute_command', wraps=redis.execute_command) as execute_command:
+        session_data = await get_django_session_data("abc", fields=main.AUTH_SESSION_FIELDS, refresh=True)
+
+    assert session_data['_auth_user_id'] == '1'
+    assert execute_command.call_count == 1
+    assert execute_command.call_args.args[0] == "EVALSHA"
+    assert sync_redis.pttl(key) > 10000
+    assert main.metrics.SESSION_REFRESHES.value - refreshes == 1
+
+
+@pytest.mark.asyncio
+async def test_sliding_expiration_never_extends_fixed_expiry():
+    """测试固定过期时间的session不会先被延长：即使PEXPIREAT失败，有效期也保持不变"""
+    sync_redis, redis = fake_redis_pair()
+    expire_at = datetime.now(timezone.utc) + timedelta(seconds=60)
+    sync_redis.set(f"{main.session_prefix}fixed", codec.dumps({'_session_expiry': expire_at.isoformat()}),
+                   px=60000)
+
+    with patch('main.redis_client', redis), \
+         patch.object(redis, 'pexpireat', AsyncMock(side_effect=ConnectionError("lost"))):
+        assert await get_django_session_data("fixed", refresh=True)
+
+    assert 0 < sync_redis.pttl(f"{main.session_prefix}fixed") <= 60000
+
+
+def fake_pool(row=None, acquire_error=None):
+    """构造asyncpg连接池的mock"""
+    connection = MagicMock()
+    connection.fetchrow = AsyncMock(return_value=row)
+    pool = MagicMock()
+    pool.acquire = AsyncMock(return_value=connection, side_effect=acquire_error)
+    pool.release = AsyncMock()
+    pool.get_size.return_value = 2
+    pool.get_idle_size.return_value = 1
+    pool.get_min_size.return_value = 2
+    pool.get_max_size.return_value = 10
+    return pool, connection
+
+
+@pytest.mark.asyncio
+async def test_new_connection_prepares_user_lookup():
+    """测试新建连接时只预备用户查询，查询时执行该连接上的预备语句，连接关闭后移除"""
+    row = {"id": 1, "username": "testuser", "email": "test@example.com"}
+    pool, connection = fake_pool()
+    statement = MagicMock()
+    statement.fetchrow = AsyncMock(return_value=row)
+    connection.prepare = AsyncMock(return_value=statement)
+    connection.get_server_pid.return_value = 4321
+
+    with patch('main.user_lookup_statements', {}) as statements, \
+         patch('main.get_database_pool', return_value=pool):
+        await main.init_database_connection(connection)
+        assert await main.fetch_user_row('1') == row
+        connection.add_termination_listener.call_args.args[0](connection)
+        assert not statements
+
+    connection.prepare.assert_awaited_once_with(main.USER_LOOKUP_QUERY)
+    statement.fetchrow.assert_awaited_once_with(1)
+    connection.fetchrow.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_new_connection_usable_when_prepare_fails():
+    """测试预备用户查询失败时记录日志，连接仍然使用，查询改为普通执行"""
+    pool, connection = fake_pool({"id": 1})
+    connection.prepare = AsyncMock(side_effect=RuntimeError('relation "auth_user" does not exist'))
+
+    with patch('main.user_lookup_statements', {}) as statements, \
+         patch('main.get_database_pool', return_value=pool), patch.object(main.logger, 'warning') as warning:
+        await main.init_database_connection(connection)
+        assert await main.fetch_user_row('1') == {"id": 1}
+
+    assert not statements
+    warning.assert_called_once()
+    connection.fetchrow.assert_awaited_once_with(main.USER_LOOKUP_QUERY, 1)
+
+
+@pytest.mark.asyncio
+async def test_fetch_user_row_uses_pool_prepared_statement():
+    """测试PostgreSQL下用户查询直接使用连接池和预备语句，用完归还连接"""
+    row = {"id": 1, "username": "testuser", "email": "test@example.com"}
+    pool, connection = fake_pool(row)
+    acquires = main.metrics.DATABASE_POOL_ACQUIRE.count
+
+    with patch('main.get_database_pool', return_value=pool):
+        assert await main.fetch_user_row('1') == row
+
+    pool.acquire.assert_awaited_once_with(timeout=main.database_pool_acquire_timeout)
+    connection.fetchrow.assert_awaited_once_with(main.USER_LOOKUP_QUERY, 1)
+    pool.release.assert_awaited_once_with(connection)
+    assert main.metrics.DATABASE_POOL_ACQUIRE.count == acquires + 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_user_row_acquire_timeout():
+    """测试获取连接超时时计数并抛出异常"""
+    pool, _ = fake_pool(acquire_error=asyncio.TimeoutError())
+    timeouts = main.metrics.DATABASE_POOL_TIMEOUTS.value
+
+    with patch('main.get_database_pool', return_value=pool):
+        with pytest.raises(asyncio.TimeoutError):
+            await main.fetch_user_row('1')
+
+    pool.release.assert_not_awaited()
+    assert main.metrics.DATABASE_POOL_TIMEOUTS.value == timeouts + 1
+
+
+def test_health_reports_database_pool():
+    """测试健康检查返回连接池使用情况"""
+    pool, _ = fake_pool()
+    with patch('main.redis_client', mock_redis()), \
+         patch('main.database') as mock_db, \
+         patch('main.get_database_pool', return_value=pool):
+        mock_db.fetch_one = AsyncMock(return_value=[1])
+        stats = client.get("/health").json()["database_pool"]
+
+    assert stats["size"] == 2 and stats["idle"] == 1 and stats["max"] == 10
+    assert "acquire_wait_avg_ms" in stats and "acquire_timeouts" in stats
+
+
+@pytest.mark.asyncio
+async def test_health_prober_caches_results_with_timeouts():
+    """测试后台健康检查：慢的检查超时，结果过期后视为未就绪"""
+    now = [100.0]
+
+    async def ok():
+        return True
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    async def failing():
+        raise ConnectionError("refused")
+
+    prober = HealthProber({"redis": ok, "database": ok}, interval=5, timeout=0.05, clock=lambda: now[0])
+    assert not prober.ready
+    await prober.probe()
+    assert prober.ready
+    assert prober.report()["checks"]["redis"]["status"] == "ok"
+
+    now[0] += 16
+    assert not prober.ready
+
+    prober.checks = {"redis": slow, "database": failing}
+    await prober.probe()
+    report = prober.report()
+    assert report["status"] == "not_ready"
+    assert "timed out" in report["checks"]["redis"]["error"]
+    assert report["checks"]["database"]["error"] == "refused"
+
+    # 可选的检查失败时仍然就绪
+    prober = HealthProber({"redis": ok, "redis_replica": failing}, optional=["redis_replica"], clock=lambda: now[0])
+    await prober.probe()
+    assert prober.ready
+    assert prober.report()["checks"]["redis_replica"]["error"] == "refused"
+
+
+def test_liveness_and_readiness():
+    """测试/livez不检查依赖，/readyz返回缓存的检查结果"""
+    assert client.get("/livez").json() == {"status": "ok"}
+
+    prober = HealthProber({"redis": AsyncMock(), "database": AsyncMock()}, gauge=main.metrics.DEPENDENCY_UP)
+    with patch('main.health_prober', prober):
+        assert client.get("/readyz").status_code == 503
+        asyncio.run(prober.probe())
+        response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json()["checks"]["database"]["status"] == "ok"
+    assert main.metrics.DEPENDENCY_UP.labels("database").value == 1
@@ -0,0 +1,4 @@
+"""Django与FastAPI共用的代码（session编解码等）
+
+两个应用的Docker镜像都会复制该包；本地运行时需要把仓库根目录加入 ``PYTHONPATH``。
+"""
@@ -0,0 +1,75 @@
+"""共享session编解码
+
+Django（``SESSION_SERIALIZER`` 和django_redis的 ``SERIALIZER``）与FastAPI使用同一种格式：
+
+    b"\\xa5S" + 版本号（1字节） + orjson编码的数据
+
+没有该头部的数据按旧格式处理：JSON（Django默认的 ``JSONSerializer``）
+或pickle（django_redis默认序列化器写入的旧session）。旧session全部过期后，
+应设置 ``SHARED_SESSION_ALLOW_PICKLE=False``，避免从共享存储中反序列化pickle数据。
+"""
+import os
+import pickle
+from typing import Any
+
+import orjson
+
+MAGIC = b"\xa5S"
+VERSION = 1
+HEADER = MAGIC + bytes([VERSION])
+
+ALLOW_PICKLE = os.environ.get("SHARED_SESSION_ALLOW_PICKLE", "True") == "True"
+
+
+class CodecError(ValueError):
+    """数据无法按共享格式解码"""
+
+
+def dumps(value: Any) -> bytes:
+    """编码为带版本头的orjson数据
+
+    与Django的 ``JSONSerializer`` 一样只支持JSON类型；datetime会编码为ISO 8601字符串。
+    """
+    try:
+        return HEADER + orjson.dumps(value)
+    except TypeError as e:
+        raise CodecError(str(e)) from e
+
+
+def loads(data: bytes, allow_pickle: bool = None) -> Any:
+    """解码共享格式的数据，兼容旧的JSON和pickle数据"""
+    if allow_pickle is None:
+        allow_pickle = ALLOW_PICKLE
+    if data[:2] == MAGIC:
+        version = data[2] if len(data) > 2 else None
+        if version != VERSION:
+            raise CodecError(f"Unsupported session format version: {version}")
+        return orjson.loads(data[3:])
+    if data[:1] in (b"{", b"["):
+        return orjson.loads(data)
+    if allow_pickle:
+        return pickle.loads(data)
+    raise CodecError("Refusing to unpickle legacy session data")
+
+
+class SessionSerializer:
+    """用作Django的 ``SESSION_SERIALIZER``"""
+
+    def dumps(self, obj: Any) -> bytes:
+        return dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return loads(data)
+
+
+class DjangoRedisSerializer:
+    """用作django_redis的 ``SERIALIZER`` 选项"""
+
+    def __init__(self, options=None):
+        pass
+
+    def dumps(self, value: Any) -> bytes:
+        return dumps(value)
+
+    def loads(self, value: bytes) -> Any:
+        return loads(value)
@@ -0,0 +1,48 @@
+"""用户和session接口的ETag
+
+客户端轮询 ``/api/user``、``/api/session`` 时多数响应都相同。ETag由决定响应内容的版本信息计算：
+
+- session：session key和session数据
+- 用户：响应中的用户信息（数据库中的用户行），不需要额外读取Redis
+
+ETag是弱校验器（``W/"..."``），只表示响应语义相同，不保证字节完全一致。
+"""
+import hashlib
+from typing import Any, Optional
+
+import orjson
+
+# 响应头：内容因用户而异，共享缓存不能保存；客户端每次都要带上If-None-Match重新校验
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """由各部分的值计算弱ETag，``parts`` 可以是字符串、字节、数字、None或可JSON编码的对象"""
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode()
+        else:
+            data = orjson.dumps(part, option=orjson.OPT_SORT_KEYS)
+        # 带上长度，避免 ("ab", "c") 和 ("a", "bc") 得到相同的ETag
+        digest.update(len(data).to_bytes(4, "big"))
+        digest.update(data)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """``If-None-Match`` 请求头是否包含 ``etag``（弱比较，忽略 ``W/`` 前缀）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
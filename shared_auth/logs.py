@@ -0,0 +1,153 @@
+"""非阻塞的日志输出：请求路径只把日志记录放入队列，由后台线程格式化并写出
+
+- :class:`NonBlockingQueueHandler` 不在调用线程中格式化消息，队列满时丢弃记录而不是等待
+- :class:`SamplingFilter` 按logger名称对INFO及以下级别的高频日志采样，WARNING及以上始终保留
+- :func:`queue_handler` 创建handler并启动后台写线程，可直接用作 ``dictConfig`` 中handler的 ``()``
+
+消息在写出时才用 ``%`` 格式化，调用方应使用 ``logger.info("... %s", value)``
+而不是f-string，并且不要在记录日志后修改作为参数传入的对象。
+"""
+import atexit
+import logging
+import logging.config
+import logging.handlers
+import os
+import queue
+import random
+from typing import Dict, Iterable, Mapping, Optional
+
+DEFAULT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# 已创建的（队列handler, 实际写出的handler），fork之后在子进程中重新启动后台线程
+_pipelines = []
+# 当前进程中运行的后台线程，进程退出时由 _stop_listeners 停止
+_listeners = []
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """解析 ``"uvicorn.access=0.01,main=0.1"`` 形式的采样配置"""
+    rates = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """按logger名称采样，``rates`` 为logger名称（含子logger）到保留比例的映射"""
+
+    def __init__(self, rates: Optional[Mapping[str, float]] = None, max_level: int = logging.INFO,
+                 random=random.random):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.max_level = max_level
+        self._random = random
+        self._resolved: Dict[str, float] = {}
+
+    def _rate_for(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            # 使用最具体的配置：a.b.c -> a.b -> a
+            parts = name.split(".")
+            rate = 1.0
+            for i in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:i])
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1.0 or self._random() < rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """把原始记录放入有界队列，格式化留给后台线程中的handler"""
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def queue_handler(stream=None, format: str = DEFAULT_FORMAT, maxsize: int = 10000) -> NonBlockingQueueHandler:
+    """创建写入 ``stream`` 的非阻塞handler，并启动后台写线程
+
+    后台线程在进程退出时停止，停止前会写完队列中剩余的记录。重新配置日志时
+    ``dictConfig`` 会关闭已有的handler，因此后台线程不随handler关闭而停止，
+    仍在使用旧handler的logger不会丢失日志。
+    """
+    target = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter(format))
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize))
+    _start_listener(handler, target)
+    _pipelines.append((handler, target))
+    return handler
+
+
+def _start_listener(handler: NonBlockingQueueHandler, target: logging.Handler) -> None:
+    listener = logging.handlers.QueueListener(handler.queue, target)
+    listener.start()
+    _listeners.append(listener)
+
+
+@atexit.register
+def _stop_listeners() -> None:
+    # 只注册一次，停止的是退出时当前进程中的线程；fork之后不会累积继承自父进程的退出函数
+    for listener in _listeners:
+        listener.stop()
+
+
+def _restart_after_fork() -> None:
+    # 后台线程不会被fork到子进程（例如gunicorn预加载应用后fork出的worker），
+    # 旧队列的锁也可能正被父进程的线程持有，因此换用新队列并重新启动线程
+    _listeners.clear()
+    for handler, target in _pipelines:
+        handler.queue = queue.Queue(handler.queue.maxsize)
+        _start_listener(handler, target)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def configure(level: str = "INFO", sampling: str = "", loggers: Iterable[str] = (),
+              format: str = DEFAULT_FORMAT, maxsize: int = 10000) -> None:
+    """让root logger以及 ``loggers`` 中的logger都写入同一个非阻塞handler
+
+    ``loggers`` 用于接管自带handler的logger（例如uvicorn的访问日志）。
+    """
+    logging.config.dictConfig({
+        "version": 1,
+        "disable_existing_loggers": False,
+        "filters": {
+            "sampling": {"()": SamplingFilter, "rates": parse_sampling(sampling)},
+        },
+        "handlers": {
+            "queue": {
+                "()": queue_handler,
+                "format": format,
+                "maxsize": maxsize,
+                "filters": ["sampling"],
+            },
+        },
+        "loggers": {
+            name: {"handlers": ["queue"], "level": level, "propagate": False} for name in loggers
+        },
+        "root": {"handlers": ["queue"], "level": level},
+    })
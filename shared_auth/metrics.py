@@ -0,0 +1,499 @@
+"""轻量的进程内指标（计数器、仪表、直方图），以Prometheus文本格式导出
+
+请求路径上的记录只有一次二分查找和几次整数/浮点加法，不加锁：
+多线程同时更新同一个指标时极少数增量可能丢失，对监控用途可以接受。
+指标保存在进程内存中，每个进程各自计数。gunicorn在同一个端口后面运行多个worker时，
+由 :meth:`Registry.enable_multiprocess` 汇总：每个worker每秒把自己的指标写入共享目录
+（``METRICS_MULTIPROC_DIR``）中的一个文件，处理抓取请求的worker读取所有文件后导出
+计数器和直方图的总和，仪表按 ``pid`` 标签分别导出。退出的worker的计数器和直方图由
+gunicorn master（``child_exit``）合并到一个文件中保留，计数器不会因worker轮换而减少。
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 单位为秒，覆盖本地缓存命中（微秒级）到慢查询（秒级）
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional["Registry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *labelvalues: str):
+        """返回指定标签值的子指标；热点路径上应在模块加载时绑定一次"""
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        labelvalues = tuple(str(value) for value in labelvalues)
+        child = self._children.get(labelvalues)
+        if child is None:
+            child = self._children[labelvalues] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterable[Tuple[Tuple[str, ...], "_Metric"]]:
+        if self.labelnames:
+            return sorted(self._children.items())
+        return [((), self)]
+
+    def render(self) -> List[str]:
+        return self._render(self.labelnames, self._samples())
+
+    def _render(self, labelnames, samples) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for labelvalues, sample in samples:
+            lines.extend(sample._render_sample(self.name, labelnames, labelvalues))
+        return lines
+
+    def _snapshot_samples(self) -> List[list]:
+        """``[[标签值, 值], ...]``，可以序列化为JSON；没有值的仪表不包含在内"""
+        samples = []
+        values = sorted(self._children.items()) if self.labelnames else [((), self._value)]
+        for labelvalues, sample in values:
+            value = sample._snapshot()
+            if value is not None:
+                samples.append([list(labelvalues), value])
+        return samples
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def _render_sample(self, name, labelnames, labelvalues):
+        return [f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(self.value)}"]
+
+    def _snapshot(self):
+        return self.value
+
+    def _merge(self, snapshot) -> None:
+        self.value += snapshot
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._value = _CounterValue()
+
+    @property
+    def value(self):
+        return self._value.value
+
+    def inc(self, amount: float = 1) -> None:
+        self._value.value += amount
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def _render_sample(self, name, labelnames, labelvalues):
+        return self._value._render_sample(name, labelnames, labelvalues)
+
+
+class _GaugeValue:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], Optional[float]]) -> None:
+        """导出时才调用 ``function`` 取值，返回None时不导出该样本"""
+        self.function = function
+
+    def current(self) -> Optional[float]:
+        if self.function is None:
+            return self.value
+        try:
+            return self.function()
+        except Exception:
+            return None
+
+    def _render_sample(self, name, labelnames, labelvalues):
+        value = self.current()
+        if value is None:
+            return []
+        return [f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(value)}"]
+
+    def _snapshot(self):
+        return self.current()
+
+    def _merge(self, snapshot) -> None:
+        self.value = snapshot
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._value = _GaugeValue()
+
+    @property
+    def value(self):
+        return self._value.current()
+
+    def set(self, value: float) -> None:
+        self._value.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self._value.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self._value.value -= amount
+
+    def set_function(self, function: Callable[[], Optional[float]]) -> None:
+        self._value.set_function(function)
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def _render_sample(self, name, labelnames, labelvalues):
+        return self._value._render_sample(name, labelnames, labelvalues)
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        """``with histogram.time():`` 记录代码块耗时（秒）"""
+        return _Timer(self)
+
+    def _render_sample(self, name, labelnames, labelvalues):
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, labelvalues, le)} {cumulative}")
+        labels = _format_labels(labelnames, labelvalues)
+        lines.append(f"{name}_sum{labels} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+    def _snapshot(self):
+        return {"counts": self.counts, "sum": self.sum, "count": self.count}
+
+    def _merge(self, snapshot) -> None:
+        self.counts = [total + count for total, count in zip(self.counts, snapshot["counts"])]
+        self.sum += snapshot["sum"]
+        self.count += snapshot["count"]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+        self._value = _HistogramValue(self.buckets)
+
+    @property
+    def count(self):
+        return self._value.count
+
+    @property
+    def sum(self):
+        return self._value.sum
+
+    def observe(self, value: float) -> None:
+        self._value.observe(value)
+
+    def time(self) -> _Timer:
+        return _Timer(self._value)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_sample(self, name, labelnames, labelvalues):
+        return self._value._render_sample(name, labelnames, labelvalues)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._multiprocess: Optional["_Multiprocess"] = None
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        if self._multiprocess is not None:
+            return self._multiprocess.render()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        return {name: metric._snapshot_samples() for name, metric in self._metrics.items()}
+
+    def enable_multiprocess(self, directory: str, name: str, interval: float = 1.0) -> None:
+        """在 ``directory`` 中汇总所有进程的指标，``name`` 区分同一目录中的不同应用（例如django、fastapi）"""
+        self._multiprocess = _Multiprocess(self, directory, name, interval)
+
+
+REGISTRY = Registry()
+
+# 本进程中启用了汇总的 :class:`_Multiprocess`
+_instances: List["_Multiprocess"] = []
+
+# 已退出的worker的计数器和直方图合并到的文件
+_DEAD = "dead"
+# dead文件中保留的最近合并的文件名，汇总时跳过它们（合并与删除之间的短暂窗口）
+_DEAD_KEEP = 100
+
+
+def _path(directory: str, name: str, process: str) -> str:
+    return os.path.join(directory, f"{name}_{process}.json")
+
+
+def _read(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write(path: str, data: Dict[str, Any]) -> None:
+    # 先写临时文件再原子替换，读取方不会读到写了一半的文件
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class _Multiprocess:
+    """把本进程的指标定期写入共享目录，导出时汇总目录中所有进程的指标
+
+    每个进程的文件名为 ``<name>_<pid>-<启动时间>.json``，pid被复用时也不会与已退出的进程混淆。
+    """
+
+    def __init__(self, registry: Registry, directory: str, name: str, interval: float):
+        self.registry = registry
+        self.directory = directory
+        self.name = name
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        _instances.append(self)
+        self._start()
+        if hasattr(os, "register_at_fork"):
+            # gunicorn预加载应用后fork出的worker中没有写入线程，pid也不同，重新启动
+            os.register_at_fork(after_in_child=self._start)
+        atexit.register(self._exit)
+
+    def _start(self) -> None:
+        self.process = f"{os.getpid()}-{time.time_ns()}"
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(self._stopped,), name=f"metrics-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止写入且退出时不再写入，用于预加载了应用但不处理请求的gunicorn master"""
+        self._stopped.set()
+        self._thread.join()
+        self.process = None
+
+    def _run(self, stopped: threading.Event) -> None:
+        while not stopped.wait(self.interval):
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def _exit(self) -> None:
+        # 正常退出前写入最后的数字，之后由master合并到dead文件
+        self._stopped.set()
+        if self.process is None:
+            return
+        try:
+            self.flush()
+        except OSError:
+            pass
+
+    def flush(self) -> None:
+        gauges = [name for name, metric in self.registry._metrics.items() if isinstance(metric, Gauge)]
+        _write(_path(self.directory, self.name, self.process),
+               {"metrics": self.registry.snapshot(), "gauges": gauges})
+
+    def _collect(self) -> Optional[List[Tuple[Optional[str], Dict[str, Any]]]]:
+        """``[(pid或None, 指标快照)]``，None为dead文件；读取期间有文件被合并时返回None"""
+        dead = _read(_path(self.directory, self.name, _DEAD)) or {"processes": [], "metrics": {}}
+        merged = set(dead["processes"])
+        snapshots = [(None, dead["metrics"])]
+        prefix = len(self.name) + 1
+        for path in glob.glob(_path(self.directory, self.name, "*-*")):
+            process = os.path.basename(path)[prefix:-len(".json")]
+            if process in merged:
+                continue
+            data = _read(path)
+            if data is None:
+                return None
+            snapshots.append((process.split("-", 1)[0], data["metrics"]))
+        return snapshots
+
+    def render(self) -> str:
+        self.flush()
+        snapshots = self._collect() or self._collect() or []
+        lines = []
+        for name, metric in self.registry._metrics.items():
+            if isinstance(metric, Gauge):
+                # 仪表（连接池、依赖状态）按进程分别导出，退出的worker不再导出
+                samples = sorted(
+                    ((*labelvalues, pid), _loaded(metric, value))
+                    for pid, metrics in snapshots if pid is not None
+                    for labelvalues, value in metrics.get(name, [])
+                )
+                lines.extend(metric._render((*metric.labelnames, "pid"), samples))
+            else:
+                lines.extend(metric._render(metric.labelnames, sorted(_sum(metric, snapshots, name).items())))
+        return "\n".join(lines) + "\n"
+
+
+def _loaded(metric: _Metric, value) -> Any:
+    sample = metric._new_child()
+    sample._merge(value)
+    return sample
+
+
+def _sum(metric: _Metric, snapshots, name: str) -> Dict[Tuple[str, ...], Any]:
+    totals: Dict[Tuple[str, ...], Any] = {}
+    for _, metrics in snapshots:
+        for labelvalues, value in metrics.get(name, []):
+            labelvalues = tuple(labelvalues)
+            total = totals.get(labelvalues)
+            if total is None:
+                total = totals[labelvalues] = metric._new_child()
+            total._merge(value)
+    return totals
+
+
+def _add(total, value):
+    if total is None:
+        return value
+    if isinstance(value, dict):
+        return {
+            "counts": [a + b for a, b in zip(total["counts"], value["counts"])],
+            "sum": total["sum"] + value["sum"],
+            "count": total["count"] + value["count"],
+        }
+    return total + value
+
+
+def mark_process_dead(directory: str, pid: int) -> None:
+    """把退出的worker的计数器和直方图合并到dead文件并删除它的文件
+
+    由gunicorn master的 ``child_exit`` 调用；仪表只反映运行中的进程，直接丢弃。
+    """
+    for path in glob.glob(os.path.join(directory, f"*_{pid}-*.json")):
+        name, process = os.path.basename(path)[:-len(".json")].rsplit("_", 1)
+        data = _read(path)
+        if data is not None:
+            dead_path = _path(directory, name, _DEAD)
+            dead = _read(dead_path) or {"processes": [], "metrics": {}}
+            for metric_name, samples in data["metrics"].items():
+                if metric_name in data["gauges"]:
+                    continue
+                totals = {tuple(labels): value for labels, value in dead["metrics"].get(metric_name, [])}
+                for labels, value in samples:
+                    totals[tuple(labels)] = _add(totals.get(tuple(labels)), value)
+                dead["metrics"][metric_name] = [[list(labels), value] for labels, value in totals.items()]
+            dead["processes"] = [*dead["processes"], process][-_DEAD_KEEP:]
+            # 先写入记录了该进程的dead文件再删除进程的文件，汇总时不会重复计算
+            _write(dead_path, dead)
+        os.remove(path)
+
+
+def clear_multiprocess_dir(directory: str) -> None:
+    """删除上一次运行留下的文件，由gunicorn master启动时（``on_starting``）调用
+
+    master预加载应用时已经启用了汇总，但master不处理请求，这里同时停止本进程的写入；
+    fork出的worker会重新开始写入。
+    """
+    for instance in _instances:
+        instance.stop()
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
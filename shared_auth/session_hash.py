@@ -0,0 +1,92 @@
+"""hash布局的session存储（``SESSION_STORAGE_LAYOUT=hash``）
+
+默认的blob布局把整个session编码后保存在一个字符串key中，读取任何一个字段都要传输并解码整个session。
+hash布局把session的每个顶层key保存为Redis hash的一个字段，值用 :mod:`shared_auth.codec` 单独编码：
+
+    __session__        1
+    _auth_user_id      b"\\xa5S\\x01" + orjson("1")
+    _messages          ...
+
+FastAPI用HMGET只读取用户ID、用户名和邮箱，不传输和解码消息等视图保存的其他数据。
+``__session__`` 字段表示session存在，空session也会保存为只有该字段的hash。
+
+两个应用必须使用相同的布局；切换布局后，按旧布局保存的session仍可读取（读取hash时遇到
+WRONGTYPE改为GET），在下次保存时改为新布局。
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from shared_auth import codec
+
+LAYOUTS = ("blob", "hash")
+
+MARKER_FIELD = "__session__"
+
+# KEYS[1]：session key
+# ARGV[1]：为1时只在key不存在时写入（Django的must_create），否则只在key仍然存在时替换整个hash，
+#          已被其他请求删除（登出）的session不会被写回
+# ARGV[2]：有效期（毫秒）；其余参数依次为字段名和编码后的值
+# 返回是否写入
+SAVE_SCRIPT = """
+if ARGV[1] == '1' then
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return 0
+    end
+else
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 0
+    end
+    redis.call('DEL', KEYS[1])
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class PartialSession(dict):
+    """只包含部分字段的session，``fields`` 为读取时请求的字段
+
+    可以与完整的session放在同一个进程内缓存中，但只能用于读取 ``fields`` 中的字段。
+    """
+
+    def __init__(self, data: Dict[str, Any], fields: Iterable[str]):
+        super().__init__(data)
+        self.fields = frozenset(fields)
+
+
+def covers(session: Dict[str, Any], fields: Optional[Iterable[str]]) -> bool:
+    """``session`` 是否包含读取 ``fields`` 所需的数据，``fields`` 为None时要求完整的session"""
+    if not isinstance(session, PartialSession):
+        return True
+    return fields is not None and session.fields.issuperset(fields)
+
+
+def is_wrong_type(error: Exception) -> bool:
+    """Redis是否因为key是另一种布局（字符串/hash）而拒绝了命令"""
+    return str(error).startswith("WRONGTYPE")
+
+
+def save_args(session: Dict[str, Any], must_create: bool, expiry_ms: int) -> List[Any]:
+    """:data:`SAVE_SCRIPT` 的ARGV"""
+    args = [1 if must_create else 0, expiry_ms, MARKER_FIELD, b"1"]
+    for field, value in session.items():
+        if field == MARKER_FIELD:
+            raise codec.CodecError(f"{MARKER_FIELD!r} is reserved")
+        args.append(field)
+        args.append(codec.dumps(value))
+    return args
+
+
+def _field_name(field) -> str:
+    return field.decode() if isinstance(field, bytes) else field
+
+
+def decode_fields(items: Iterable[Tuple[Any, Optional[bytes]]]) -> Dict[str, Any]:
+    """解码HGETALL或HMGET得到的 ``(字段, 值)``，跳过不存在的字段和标记字段"""
+    session = {}
+    for field, value in items:
+        field = _field_name(field)
+        if value is None or field == MARKER_FIELD:
+            continue
+        session[field] = codec.loads(value)
+    return session
@@ -0,0 +1,67 @@
+"""session在多个Redis节点之间的分片（``SESSION_REDIS_URLS``）
+
+Django和FastAPI用同一个 :class:`HashRing` 按完整的Redis key（``:1:django.contrib.sessions.cache<session key>``）
+选择节点，两个应用配置相同的节点列表时总是访问同一个节点；列表的顺序不影响结果。
+
+一致性哈希：每个节点在环上有 ``replicas`` 个虚拟节点，key属于环上顺时针方向的第一个虚拟节点。
+增加一个节点时只有大约 ``1/节点数`` 的key改变节点，由Django的 ``rebalance_sessions`` 命令迁移。
+"""
+import bisect
+import hashlib
+from typing import Dict, Iterable, List, Union
+from urllib.parse import urlsplit, urlunsplit
+
+# 每个节点的虚拟节点数，必须在两个应用中相同
+DEFAULT_REPLICAS = 160
+
+
+def parse_nodes(value: str) -> List[str]:
+    """解析逗号分隔的节点地址，忽略空项"""
+    return [node.strip() for node in value.split(",") if node.strip()]
+
+
+def redact(url: str) -> str:
+    """隐藏节点地址中的密码，用于日志和命令输出"""
+    parts = urlsplit(url)
+    if parts.password is None:
+        return url
+    netloc = parts.netloc.rsplit("@", 1)[1]
+    user = parts.username or ""
+    return urlunsplit(parts._replace(netloc=f"{user}:***@{netloc}"))
+
+
+def _hash(value: bytes) -> int:
+    # 不能使用hash()：字符串的哈希值在每个进程中不同
+    return int.from_bytes(hashlib.md5(value).digest()[:8], "big")
+
+
+def _bytes(key: Union[str, bytes]) -> bytes:
+    return key if isinstance(key, bytes) else str(key).encode()
+
+
+class HashRing:
+    """一致性哈希环，``node_for`` 返回key所在的节点（``nodes`` 中的字符串）"""
+
+    def __init__(self, nodes: Iterable[str], replicas: int = DEFAULT_REPLICAS):
+        self.nodes = sorted(set(nodes))
+        if not self.nodes:
+            raise ValueError("HashRing requires at least one node")
+        self.replicas = replicas
+        points = sorted(
+            (_hash(f"{node}#{index}".encode()), node)
+            for node in self.nodes
+            for index in range(replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: Union[str, bytes]) -> str:
+        index = bisect.bisect(self._points, _hash(_bytes(key)))
+        return self._owners[index % len(self._owners)]
+
+    def group(self, keys: Iterable[str]) -> Dict[str, List[str]]:
+        """按节点分组，每组内保持原来的顺序"""
+        groups: Dict[str, List[str]] = {}
+        for key in keys:
+            groups.setdefault(self.node_for(key), []).append(key)
+        return groups
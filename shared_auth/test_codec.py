@@ -0,0 +1,54 @@
+import json
+import pickle
+from datetime import datetime, timezone
+
+import pytest
+
+from shared_auth import codec
+
+
+SESSION = {
+    '_auth_user_id': '1',
+    '_auth_user_backend': 'auth_app.backends.CachedModelBackend',
+    '_auth_user_hash': 'abc123',
+    '_auth_user_username': 'testuser',
+    '_auth_user_email': 'test@example.com',
+}
+
+
+def test_round_trip():
+    """测试编码后可以解码回原数据"""
+    data = codec.dumps(SESSION)
+    assert data.startswith(codec.HEADER)
+    assert codec.loads(data) == SESSION
+
+
+def test_datetime_encoded_as_iso_string():
+    """测试datetime编码为ISO 8601字符串"""
+    value = datetime(2025, 6, 5, 12, 0, tzinfo=timezone.utc)
+    assert codec.loads(codec.dumps({'at': value})) == {'at': '2025-06-05T12:00:00+00:00'}
+
+
+def test_legacy_pickle_fallback():
+    """测试兼容旧的pickle数据，并且可以禁用"""
+    legacy = pickle.dumps(SESSION)
+    assert codec.loads(legacy, allow_pickle=True) == SESSION
+    with pytest.raises(codec.CodecError):
+        codec.loads(legacy, allow_pickle=False)
+
+
+def test_legacy_json_fallback():
+    """测试兼容Django默认JSONSerializer写入的数据"""
+    assert codec.loads(json.dumps(SESSION).encode(), allow_pickle=False) == SESSION
+
+
+def test_unknown_version_rejected():
+    """测试拒绝未知版本的数据"""
+    with pytest.raises(codec.CodecError):
+        codec.loads(codec.MAGIC + b"\x02{}")
+
+
+def test_unsupported_type_rejected():
+    """测试非JSON类型无法编码"""
+    with pytest.raises(codec.CodecError):
+        codec.dumps({'value': object()})
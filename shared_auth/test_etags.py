@@ -0,0 +1,22 @@
+from shared_auth import etags
+
+
+def test_make_etag_is_weak_and_stable():
+    """测试ETag为弱校验器，相同输入得到相同的值，字典顺序不影响结果"""
+    etag = etags.make_etag("session", "abc", {"a": 1, "b": 2})
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert etag == etags.make_etag("session", "abc", {"b": 2, "a": 1})
+    assert etag != etags.make_etag("session", "abc", {"a": 1, "b": 3})
+    assert etags.make_etag("ab", "c") != etags.make_etag("a", "bc")
+
+
+def test_matches():
+    """测试If-None-Match的解析和弱比较"""
+    etag = etags.make_etag("user", 1)
+    opaque = etag[2:]
+    assert etags.matches(etag, etag)
+    assert etags.matches(opaque, etag)
+    assert etags.matches(f'"other", {etag}', etag)
+    assert etags.matches("*", etag)
+    assert not etags.matches(None, etag)
+    assert not etags.matches('W/"other"', etag)
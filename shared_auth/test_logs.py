@@ -0,0 +1,84 @@
+import io
+import logging
+import os
+import queue
+
+import pytest
+
+from shared_auth import logs
+from shared_auth.logs import NonBlockingQueueHandler, SamplingFilter, parse_sampling, queue_handler
+
+
+def make_record(name, level=logging.INFO, msg="message", args=()):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_parse_sampling():
+    assert parse_sampling("") == {}
+    assert parse_sampling("uvicorn.access=0.01, main=0.5") == {"uvicorn.access": 0.01, "main": 0.5}
+
+
+def test_sampling_filter_uses_most_specific_logger_and_keeps_warnings():
+    sampling = SamplingFilter({"app": 0.0, "app.keep": 1.0}, random=lambda: 0.5)
+
+    assert not sampling.filter(make_record("app"))
+    assert not sampling.filter(make_record("app.child"))
+    assert sampling.filter(make_record("app.keep.child"))
+    assert sampling.filter(make_record("other"))
+    assert sampling.filter(make_record("app", level=logging.WARNING))
+
+
+def test_queue_handler_defers_formatting_and_drops_when_full():
+    class Unformattable:
+        def __str__(self):
+            raise AssertionError("formatted in the calling thread")
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(make_record("app", msg="%s", args=(Unformattable(),)))
+    handler.handle(make_record("app"))
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+def test_queue_handler_writes_in_background():
+    stream = io.StringIO()
+    handler = queue_handler(stream=stream, format="%(name)s %(message)s")
+    logger = logging.getLogger("shared_auth.test_logs")
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        logger.warning("hello %s", "world")
+        handler.queue.join()
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = True
+
+    assert stream.getvalue() == "shared_auth.test_logs hello world\n"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_queue_handler_keeps_writing_after_fork():
+    read_fd, write_fd = os.pipe()
+    stream = os.fdopen(write_fd, "w")
+    handler = queue_handler(stream=stream, format="%(process)d %(message)s")
+    logger = logging.getLogger("shared_auth.test_logs.fork")
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        pid = os.fork()
+        if pid == 0:
+            logger.warning("from child")
+            handler.queue.join()
+            stream.flush()
+            # 子进程中只有重新启动的线程，不保留父进程的
+            os._exit(0 if len(logs._listeners) == len(logs._pipelines) else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = True
+        stream.close()
+
+    with os.fdopen(read_fd) as reader:
+        assert reader.read() == f"{pid} from child\n"
@@ -0,0 +1,91 @@
+import os
+from unittest.mock import patch
+
+from shared_auth import metrics
+from shared_auth.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = Histogram("stage_seconds", "Stage latency", ["stage"], registry=registry, buckets=(0.1, 1.0))
+    stage = histogram.labels("redis_get")
+    for value in (0.05, 0.1, 0.5, 2.0):
+        stage.observe(value)
+
+    text = registry.render()
+    assert 'stage_seconds_bucket{stage="redis_get",le="0.1"} 2' in text
+    assert 'stage_seconds_bucket{stage="redis_get",le="1.0"} 3' in text
+    assert 'stage_seconds_bucket{stage="redis_get",le="+Inf"} 4' in text
+    assert 'stage_seconds_count{stage="redis_get"} 4' in text
+    assert 'stage_seconds_sum{stage="redis_get"} 2.65' in text
+
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    counter = Counter("lookups_total", "Lookups", ["result"], registry=registry)
+    counter.labels("hit").inc()
+    counter.labels("hit").inc(2)
+    gauge = Gauge("pool_connections", "Pool usage", registry=registry)
+    gauge.set_function(lambda: 7)
+    unavailable = Gauge("unavailable", "No value", registry=registry)
+    unavailable.set_function(lambda: None)
+
+    text = registry.render()
+    assert "# TYPE lookups_total counter" in text
+    assert 'lookups_total{result="hit"} 3' in text
+    assert "pool_connections 7" in text
+    assert "\nunavailable " not in text
+
+
+def test_histogram_timer():
+    registry = Registry()
+    histogram = Histogram("block_seconds", "Block latency", registry=registry)
+    with histogram.time():
+        pass
+    assert histogram.count == 1
+
+
+def test_multiprocess_aggregation(tmp_path, monkeypatch):
+    """测试多进程汇总：计数器和直方图求和，仪表按pid导出，退出的进程的计数器保留"""
+    def worker_registry():
+        registry = Registry()
+        counter = Counter("lookups_total", "Lookups", ["result"], registry=registry)
+        histogram = Histogram("block_seconds", "Block latency", registry=registry, buckets=(1.0,))
+        gauge = Gauge("dependency_up", "Dependency status", registry=registry)
+        return registry, counter, histogram, gauge
+
+    monkeypatch.setattr(metrics, "_instances", [])
+    with patch("shared_auth.metrics.threading.Thread"), patch("shared_auth.metrics.atexit.register"), \
+            patch("os.register_at_fork"):
+        first, first_counter, first_histogram, first_gauge = worker_registry()
+        first.enable_multiprocess(str(tmp_path), "app")
+        with patch("os.getpid", return_value=4242):
+            second, second_counter, second_histogram, second_gauge = worker_registry()
+            second.enable_multiprocess(str(tmp_path), "app")
+
+    first_counter.labels("hit").inc(2)
+    first_histogram.observe(0.5)
+    first_gauge.set(1)
+    second_counter.labels("hit").inc(3)
+    second_histogram.observe(2.0)
+    second_gauge.set(0)
+    second._multiprocess.flush()
+
+    text = first.render()
+    assert 'lookups_total{result="hit"} 5' in text
+    assert 'block_seconds_bucket{le="1.0"} 1' in text
+    assert "block_seconds_count 2" in text
+    assert f'dependency_up{{pid="{os.getpid()}"}} 1' in text
+    assert 'dependency_up{pid="4242"} 0' in text
+
+    metrics.mark_process_dead(str(tmp_path), 4242)
+    text = first.render()
+    assert 'lookups_total{result="hit"} 5' in text
+    assert "block_seconds_count 2" in text
+    assert 'pid="4242"' not in text
+
+    # master预加载应用后停止写入，只留下worker的文件
+    metrics.clear_multiprocess_dir(str(tmp_path))
+    assert not list(tmp_path.iterdir())
+    first._multiprocess._exit()
+    assert not list(tmp_path.iterdir())
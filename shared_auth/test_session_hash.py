@@ -0,0 +1,26 @@
+import pytest
+
+from shared_auth import codec, session_hash
+
+
+def test_save_args_round_trip():
+    """测试保存脚本的参数按字段编码，HGETALL的结果可以解码回原session"""
+    session = {"_auth_user_id": "1", "_messages": [{"level": 20}]}
+    args = session_hash.save_args(session, must_create=True, expiry_ms=1000)
+    assert args[:4] == [1, 1000, session_hash.MARKER_FIELD, b"1"]
+    stored = {field.encode(): value for field, value in zip(args[2::2], args[3::2])}
+    assert session_hash.decode_fields(stored.items()) == session
+    assert session_hash.decode_fields([("_auth_user_id", codec.dumps("1")), ("_auth_user_email", None)]) == {
+        "_auth_user_id": "1"
+    }
+    with pytest.raises(codec.CodecError):
+        session_hash.save_args({session_hash.MARKER_FIELD: 1}, must_create=False, expiry_ms=1000)
+
+
+def test_partial_session_covers():
+    """测试部分字段的session只能满足这些字段的读取"""
+    partial = session_hash.PartialSession({"_auth_user_id": "1"}, ["_auth_user_id", "_auth_user_email"])
+    assert session_hash.covers(partial, ["_auth_user_id"])
+    assert not session_hash.covers(partial, ["_messages"])
+    assert not session_hash.covers(partial, None)
+    assert session_hash.covers({"_auth_user_id": "1"}, None)
@@ -0,0 +1,37 @@
+import pytest
+
+from shared_auth import sharding
+
+NODES = ["redis://shard-a:6379/0", "redis://shard-b:6379/0", "redis://shard-c:6379/0"]
+
+
+def test_ring_is_stable_and_balanced():
+    """测试节点选择与节点列表的顺序无关，key大致均匀分布，str和bytes结果相同"""
+    ring = sharding.HashRing(NODES)
+    keys = [f":1:django.contrib.sessions.cache{index:032d}" for index in range(3000)]
+    assert [ring.node_for(key) for key in keys] == [sharding.HashRing(NODES[::-1]).node_for(key) for key in keys]
+    assert ring.node_for(keys[0].encode()) == ring.node_for(keys[0])
+    groups = ring.group(keys)
+    assert sorted(groups) == sorted(NODES)
+    assert all(700 < len(group) < 1300 for group in groups.values())
+    with pytest.raises(ValueError):
+        sharding.HashRing([])
+
+
+def test_adding_node_moves_only_its_share():
+    """测试增加节点时只有分配给新节点的key改变节点"""
+    before = sharding.HashRing(NODES)
+    after = sharding.HashRing([*NODES, "redis://shard-d:6379/0"])
+    keys = [f"key-{index}" for index in range(4000)]
+    moved = [key for key in keys if before.node_for(key) != after.node_for(key)]
+    assert all(after.node_for(key) == "redis://shard-d:6379/0" for key in moved)
+    assert 700 < len(moved) < 1300
+
+
+def test_parse_nodes_and_redact():
+    """测试节点列表的解析和地址中密码的隐藏"""
+    assert sharding.parse_nodes(" redis://a:6379/0, ,redis://b:6379/0 ") == ["redis://a:6379/0", "redis://b:6379/0"]
+    assert sharding.parse_nodes("") == []
+    assert sharding.redact("redis://user:secret@a:6379/0") == "redis://user:***@a:6379/0"
+    assert sharding.redact("redis://:secret@a:6379/0") == "redis://:***@a:6379/0"
+    assert sharding.redact("redis://a:6379/0") == "redis://a:6379/0"
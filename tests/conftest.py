@@ -10,13 +10,31 @@ from urllib.parse import urljoin
 DJANGO_URL = os.environ.get("DJANGO_URL", "http://localhost:8000")
 FASTAPI_URL = os.environ.get("FASTAPI_URL", "http://localhost:8001")
 
+# live：连接已经运行的服务（docker-compose）；inprocess：在测试进程内启动两个应用；
+# combined：在测试进程内启动合并部署的ASGI应用（combined/asgi.py）
+INTEGRATION_MODE = os.environ.get("INTEGRATION_MODE", "live")
+
+
+@pytest.fixture(scope="session")
+def service_urls():
+    """返回（Django URL, FastAPI URL），inprocess模式下先在进程内启动服务"""
+    if INTEGRATION_MODE in ("inprocess", "combined"):
+        from inprocess import InProcessServices
+
+        services = InProcessServices(combined=INTEGRATION_MODE == "combined").start()
+        yield services.django_url, services.fastapi_url
+        services.stop()
+    else:
+        yield DJANGO_URL, FASTAPI_URL
+
 
 @pytest.fixture(scope="session")
-def wait_for_services():
+def wait_for_services(service_urls):
     """等待所有服务启动"""
+    django_url, fastapi_url = service_urls
     services = [
-        {"name": "Django", "url": f"{DJANGO_URL}/admin/login/"},
-        {"name": "FastAPI", "url": f"{FASTAPI_URL}/health"}
+        {"name": "Django", "url": f"{django_url}/readyz/"},
+        {"name": "FastAPI", "url": f"{fastapi_url}/readyz"}
     ]
     
     max_retries = 30
@@ -26,7 +44,8 @@ def wait_for_services():
         for i in range(max_retries):
             try:
                 response = requests.get(service["url"], timeout=5)
-                if response.status_code < 500:
+                # 就绪探针在数据库和Redis可用之前返回503
+                if response.status_code == 200:
                     print(f"{service['name']} is ready!")
                     break
             except requests.RequestException:
@@ -39,11 +58,11 @@ def wait_for_services():
 
 
 @pytest.fixture(scope="session")
-def django_client(wait_for_services):
+def django_client(wait_for_services, service_urls):
     """Django客户端"""
     class DjangoClient:
         def __init__(self):
-            self.base_url = DJANGO_URL
+            self.base_url = service_urls[0]
             self.session = requests.Session()
         
         def get(self, path, **kwargs):
@@ -137,21 +156,34 @@ def django_client(wait_for_services):
     return DjangoClient()
 
 
+class SharedCookieJar(requests.cookies.RequestsCookieJar):
+    """浏览器中同一主机上的Django和FastAPI共用cookie；测试把Django的cookie复制过来时，
+    替换FastAPI（滑动过期时）设置的同名cookie，而不是按域名各保存一个"""
+
+    def set(self, name, value, **kwargs):
+        for cookie in [cookie for cookie in self if cookie.name == name]:
+            self.clear(cookie.domain, cookie.path, cookie.name)
+        return super().set(name, value, **kwargs)
+
+
 @pytest.fixture(scope="session")
-def fastapi_client(wait_for_services):
+def fastapi_client(wait_for_services, service_urls):
     """FastAPI客户端"""
     class FastAPIClient:
         def __init__(self):
-            self.base_url = FASTAPI_URL
+            self.base_url = service_urls[1]
             self.session = requests.Session()
+            self.session.cookies = SharedCookieJar()
         
         def get(self, path, **kwargs):
-            url = urljoin(self.base_url, path)
-            return self.session.get(url, **kwargs)
+            return self.session.get(self._url(path), **kwargs)
         
         def post(self, path, **kwargs):
-            url = urljoin(self.base_url, path)
-            return self.session.post(url, **kwargs)
+            return self.session.post(self._url(path), **kwargs)
+        
+        def _url(self, path):
+            # 合并部署时FastAPI位于路径前缀下，urljoin会丢掉该前缀
+            return self.base_url.rstrip("/") + path
         
         def get_user_data(self):
             """获取用户数据"""
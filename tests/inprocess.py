@@ -0,0 +1,139 @@
+"""进程内运行Django和FastAPI的集成测试环境
+
+不需要Docker：Redis由fakeredis代替，两个应用共用一个SQLite文件数据库。
+Django（WSGI）和FastAPI（uvicorn）分别在后台线程中监听本机随机端口，
+现有的基于HTTP的测试用例和压测脚本可以直接使用返回的URL。
+``combined=True`` 时改为用uvicorn运行合并部署的入口（combined/asgi.py），
+Django和FastAPI共用一个端口，FastAPI位于 ``/fastapi`` 前缀下。
+
+用法：
+    harness = InProcessServices().start()
+    ... harness.django_url / harness.fastapi_url ...
+    harness.stop()
+"""
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import fakeredis
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Django和FastAPI共用的Redis替身
+redis_server = fakeredis.FakeServer()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class InProcessServices:
+    def __init__(self, host="127.0.0.1", combined=False):
+        self.host = host
+        self.combined = combined
+        self.db_dir = tempfile.TemporaryDirectory(prefix="shared_auth_")
+        self.db_path = os.path.join(self.db_dir.name, "db.sqlite3")
+        self.django_url = None
+        self.fastapi_url = None
+        self._django_server = None
+        self._django_thread = None
+        self._fastapi_server = None
+        self._fastapi_thread = None
+
+    def start(self):
+        for path in (ROOT_DIR, ROOT_DIR / "django_app", ROOT_DIR / "fastapi_app"):
+            if str(path) not in sys.path:
+                sys.path.insert(0, str(path))
+
+        os.environ["INPROCESS_DB_PATH"] = self.db_path
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{self.db_path}"
+        os.environ["DJANGO_SETTINGS_MODULE"] = "inprocess_settings"
+
+        # WAL模式允许FastAPI在Django写入时并发读取
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+
+        self._setup_django()
+        if self.combined:
+            self._start_combined()
+        else:
+            self._start_django()
+            self._start_fastapi()
+        return self
+
+    def _setup_django(self):
+        import django
+        from django.core.management import call_command
+        from django.test.utils import setup_test_environment
+
+        django.setup()
+        # 邮件写入内存等测试环境设置，同时满足pytest-django的自动fixture
+        setup_test_environment()
+        call_command("migrate", interactive=False, verbosity=0)
+
+    def _start_django(self):
+        from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+        from django.core.wsgi import get_wsgi_application
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        port = _free_port()
+        self._django_server = ThreadedWSGIServer((self.host, port), QuietHandler)
+        self._django_server.set_app(get_wsgi_application())
+        self._django_thread = threading.Thread(target=self._django_server.serve_forever, daemon=True)
+        self._django_thread.start()
+        self.django_url = f"http://{self.host}:{port}"
+
+    def _start_fastapi(self):
+        import main
+
+        port = self._serve_asgi(main.app, "FastAPI")
+        self.fastapi_url = f"http://{self.host}:{port}"
+
+    def _start_combined(self):
+        from combined import asgi
+
+        port = self._serve_asgi(asgi.application, "Combined ASGI app")
+        self.django_url = f"http://{self.host}:{port}"
+        self.fastapi_url = f"{self.django_url}{asgi.FASTAPI_PREFIX}"
+
+    def _serve_asgi(self, app, name):
+        """在后台线程中用uvicorn运行ASGI应用，返回监听的端口"""
+        import uvicorn
+        import main
+
+        main.create_redis_client = lambda url=None: fakeredis.FakeAsyncRedis(server=redis_server)
+
+        port = _free_port()
+        config = uvicorn.Config(app, host=self.host, port=port, log_level="warning", lifespan="on")
+        self._fastapi_server = uvicorn.Server(config)
+        self._fastapi_thread = threading.Thread(target=self._fastapi_server.run, daemon=True)
+        self._fastapi_thread.start()
+        self._wait_until(lambda: self._fastapi_server.started, name)
+        return port
+
+    def _wait_until(self, predicate, name, timeout=10.0):
+        event = threading.Event()
+        waited = 0.0
+        while not predicate():
+            if waited >= timeout or not self._fastapi_thread.is_alive():
+                raise RuntimeError(f"{name} did not start")
+            event.wait(0.05)
+            waited += 0.05
+
+    def stop(self):
+        if self._fastapi_server is not None:
+            self._fastapi_server.should_exit = True
+            self._fastapi_thread.join(timeout=10)
+        if self._django_server is not None:
+            self._django_server.shutdown()
+            self._django_server.server_close()
+        self.db_dir.cleanup()
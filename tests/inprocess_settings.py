@@ -0,0 +1,28 @@
+"""进程内集成测试使用的Django配置：SQLite + fakeredis"""
+import os
+
+import fakeredis
+
+from shared_auth_project.settings import *  # noqa: F401,F403
+from shared_auth_project.settings import CACHES
+
+from inprocess import redis_server
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['INPROCESS_DB_PATH'],
+        'OPTIONS': {'timeout': 20},
+    }
+}
+
+CACHES['default']['OPTIONS']['CONNECTION_POOL_KWARGS'] = {
+    'connection_class': fakeredis.FakeConnection,
+    'server': redis_server,
+}
+
+# 默认使用快速的密码哈希，压测登录耗时时设置INPROCESS_FAST_PASSWORD_HASHER=False
+if os.environ.get('INPROCESS_FAST_PASSWORD_HASHER', 'True') == 'True':
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+LOGGING = {'version': 1, 'disable_existing_loggers': False}
@@ -0,0 +1,44 @@
+import re
+import uuid
+
+import pytest
+
+from conftest import INTEGRATION_MODE
+
+pytestmark = pytest.mark.skipif(INTEGRATION_MODE != "combined", reason="仅在合并部署模式下运行")
+
+
+def metric_value(text, sample):
+    """从Prometheus文本中读取一个样本的值"""
+    match = re.search(rf"^{re.escape(sample)} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_fastapi_reuses_session_and_user_resolved_by_django(django_client, fastapi_client):
+    """测试合并部署时FastAPI直接使用Django在同一进程中读取的session和用户"""
+    username = f"testuser_{uuid.uuid4().hex[:8]}"
+    password = "testpassword123"
+    django_client.register(username, f"{username}@example.com", password)
+    django_client.login(username, password)
+
+    # Django处理请求时读取session并解析用户
+    assert django_client.get_user_data().status_code == 200
+
+    for name, value in django_client.session.cookies.get_dict().items():
+        fastapi_client.session.cookies.set(name, value)
+
+    before = fastapi_client.get("/metrics").text
+    response = fastapi_client.get_user_data()
+    after = fastapi_client.get("/metrics").text
+
+    assert response.status_code == 200
+    assert response.json()["username"] == username
+    assert response.json()["auth_backend"] == "django"
+    # 没有访问Redis和数据库
+    for sample in (
+        'shared_auth_stage_seconds_count{stage="redis_get"}',
+        'shared_auth_stage_seconds_count{stage="user_query"}',
+    ):
+        assert metric_value(after, sample) == metric_value(before, sample)
+    hits = 'shared_auth_session_cache_requests_total{result="hit"}'
+    assert metric_value(after, hits) == metric_value(before, hits) + 1
@@ -1,8 +1,12 @@
+import os
 import pytest
+import re
 import time
 import uuid
 import json
 
+from conftest import INTEGRATION_MODE
+
 
 def test_django_login_fastapi_access(django_client, fastapi_client):
     """测试在Django登录后，可以通过FastAPI访问用户数据"""
@@ -98,3 +102,23 @@ def test_django_logout_fastapi_access(django_client, fastapi_client):
     fastapi_user_response = fastapi_client.get_user_data()
     assert fastapi_user_response.status_code == 401, "登出后仍能访问FastAPI用户数据"
 
+
+@pytest.mark.skipif(
+    INTEGRATION_MODE not in ("inprocess", "combined") or os.environ.get("SESSION_MODE") == "signed_cookies",
+    reason="指标按进程统计，仅在进程内启动redis session时运行",
+)
+def test_django_login_writes_session_once(django_client):
+    """测试Django登录（轮换session key）时只向Redis提交一次session写入"""
+    username = f"testuser_{uuid.uuid4().hex[:8]}"
+    password = "testpassword123"
+    django_client.register(username, f"{username}@example.com", password)
+
+    def session_saves():
+        metrics = django_client.get("/metrics/").text
+        return float(re.search(r'^shared_auth_stage_seconds_count\{stage="session_save"\} (\S+)$',
+                               metrics, re.MULTILINE).group(1))
+
+    before = session_saves()
+    login_response = django_client.login(username, password)
+    assert login_response.status_code in [200, 302], "登录失败"
+    assert session_saves() - before == 1